@@ -0,0 +1,294 @@
+"""
+Load benchmark for the chat pipeline.
+
+    cd backend
+    python -m benchmarks.chat_load --provider openai --concurrency 100 --requests 500 --ttft-ms 300
+
+Starts the mock providers and the real backend (uvicorn main:app) as separate processes in a
+scratch working directory, drives /api/chat/send with concurrent clients and reports TTFT,
+inter-token latency, throughput, plus CPU and RSS of the backend process only.
+The report is saved to benchmarks/results/ so runs can be compared across commits
+(see benchmarks/compare.py).
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from uuid import uuid4
+import httpx
+from .mock_providers import add_arguments
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+# provider id -> (default model, path on the mock server, backend env var)
+PROVIDERS = {
+    "openai": ("gpt-4o", "/openai/v1/chat/completions", "ONYS_OPENAI_URL"),
+    "anthropic": ("claude-3-5-sonnet", "/anthropic/v1/messages", "ONYS_ANTHROPIC_URL"),
+    "gemini": ("gemini-2.0-flash", "/gemini/v1beta", "ONYS_GEMINI_URL"),
+    "runpod": ("llama3", "/ollama", None),  # RunPod/Ollama takes its URL from the settings file
+}
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def _wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url, timeout=1.0)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+class ProcessSampler:
+    """CPU time and RSS of another process, via psutil when available, else /proc (Linux)."""
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.peak_rss = 0
+        try:
+            import psutil
+            self._proc = psutil.Process(pid)
+        except ImportError:
+            self._proc = None
+
+    def cpu_seconds(self) -> float:
+        if self._proc:
+            times = self._proc.cpu_times()
+            return times.user + times.system
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def rss_bytes(self) -> int:
+        if self._proc:
+            return self._proc.memory_info().rss
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    async def track_peak(self, interval: float = 0.2):
+        while True:
+            self.peak_rss = max(self.peak_rss, self.rss_bytes())
+            await asyncio.sleep(interval)
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "max": None}
+    ordered = sorted(values)
+    pick = lambda p: round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 2)
+    return {"p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99), "max": round(ordered[-1] * 1000, 2)}
+
+async def _one_request(client: httpx.AsyncClient, url: str, provider: str, model: str, prompt: str) -> dict:
+    payload = {
+        "chat_id": f"bench-{uuid4().hex}",
+        "provider_id": provider,
+        "model_id": model,
+        "messages": [{"role": "user", "content": prompt}],
+    }
+    started = time.perf_counter()
+    first = last = None
+    gaps, chunks, error = [], 0, None
+
+    async with client.stream("POST", url, json=payload) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return {"ok": False, "error": f"HTTP {response.status_code}", "total": time.perf_counter() - started}
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            now = time.perf_counter()
+            if "chunk" in event:
+                if first is None:
+                    first = now
+                else:
+                    gaps.append(now - last)
+                last = now
+                chunks += 1
+            elif "error" in event:
+                error = event["error"]
+
+    return {
+        "ok": error is None and chunks > 0,
+        "error": error,
+        "ttft": first - started if first else None,
+        "gaps": gaps,
+        "chunks": chunks,
+        "total": time.perf_counter() - started,
+    }
+
+async def _drive(args, base_url: str, sampler: ProcessSampler) -> dict:
+    url = f"{base_url}/api/chat/send"
+    model = args.model or PROVIDERS[args.provider][0]
+    prompt = ("benchmark " * (args.prompt_chars // 10 + 1))[:args.prompt_chars]
+    limit = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(300.0)) as client:
+        async def run_one():
+            async with limit:
+                try:
+                    return await _one_request(client, url, args.provider, model, prompt)
+                except httpx.HTTPError as e:
+                    return {"ok": False, "error": f"{type(e).__name__}: {e}", "total": 0}
+
+        peak_task = asyncio.create_task(sampler.track_peak())
+        cpu_before = sampler.cpu_seconds()
+        started = time.perf_counter()
+        results = await asyncio.gather(*(run_one() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - started
+        cpu_used = sampler.cpu_seconds() - cpu_before
+        peak_task.cancel()
+
+    ok = [r for r in results if r["ok"]]
+    errors = {}
+    for r in results:
+        if not r["ok"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    total_chunks = sum(r["chunks"] for r in ok)
+
+    return {
+        "requests": {
+            "total": len(results),
+            "ok": len(ok),
+            "failed": len(results) - len(ok),
+            "errors": errors,
+        },
+        "ttft_ms": percentiles([r["ttft"] for r in ok if r["ttft"] is not None]),
+        "inter_token_ms": percentiles([g for r in ok for g in r["gaps"]]),
+        "total_ms": percentiles([r["total"] for r in ok]),
+        "throughput": {
+            "requests_per_sec": round(len(ok) / elapsed, 2),
+            "chunks_per_sec": round(total_chunks / elapsed, 2),
+            "elapsed_sec": round(elapsed, 2),
+        },
+        "process": {
+            "cpu_seconds": round(cpu_used, 3),
+            "cpu_percent": round(100 * cpu_used / elapsed, 1),
+            "peak_rss_mb": round(sampler.peak_rss / 1024 / 1024, 1),
+        },
+    }
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True)
+        return out.stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+def _write_settings(workdir: str, mock_url: str):
+    providers = [
+        {"id": pid, "name": pid, "keys": ["bench-key"], "url": f"{mock_url}/ollama" if pid == "runpod" else None}
+        for pid in PROVIDERS
+    ]
+    with open(os.path.join(workdir, "user_settings.json"), "w") as f:
+        json.dump({"providers": providers}, f)
+
+def _backend_env(args, mock_url: str, workdir: str) -> dict:
+    env = os.environ.copy()
+    env["PYTHONPATH"] = BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    # Keeps sessions and settings of the run out of the real data directory
+    env["ONYS_DATA_DIR"] = workdir
+    for _, path, var in PROVIDERS.values():
+        if var:
+            env[var] = mock_url + path
+    if not args.respect_limits:
+        # Measure the pipeline, not the admission queue
+        env["ONYS_MAX_CONCURRENT_CHATS"] = str(args.concurrency)
+        env["ONYS_MAX_CONCURRENT_PER_PROVIDER"] = str(args.concurrency)
+        env["ONYS_MAX_QUEUED_CHATS"] = str(args.requests)
+    return env
+
+def _print_report(report: dict):
+    print(f"\nProvider {report['config']['provider']} @ concurrency {report['config']['concurrency']} (commit {report['commit']})")
+    r = report["requests"]
+    print(f"  requests       {r['ok']}/{r['total']} ok, {r['failed']} failed {r['errors'] or ''}")
+    for name in ("ttft_ms", "inter_token_ms", "total_ms"):
+        p = report[name]
+        print(f"  {name:<14} p50={p['p50']} p90={p['p90']} p99={p['p99']} max={p['max']}")
+    t, proc = report["throughput"], report["process"]
+    print(f"  throughput     {t['requests_per_sec']} req/s, {t['chunks_per_sec']} chunks/s over {t['elapsed_sec']}s")
+    print(f"  backend        cpu {proc['cpu_seconds']}s ({proc['cpu_percent']}%), peak rss {proc['peak_rss_mb']} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat pipeline load benchmark")
+    parser.add_argument("--provider", choices=list(PROVIDERS), default="openai")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--prompt-chars", type=int, default=500)
+    parser.add_argument("--respect-limits", action="store_true", help="keep the default admission limits")
+    parser.add_argument("--output", default=None, help="report path (default: benchmarks/results/<commit>-<provider>-<time>.json)")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="onys-bench-")
+    mock_port, app_port = _free_port(), _free_port()
+    mock_url, app_url = f"http://127.0.0.1:{mock_port}", f"http://127.0.0.1:{app_port}"
+    _write_settings(workdir, mock_url)
+
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_providers", "--port", str(mock_port),
+         "--ttft-ms", str(args.ttft_ms), "--tokens-per-sec", str(args.tokens_per_sec),
+         "--tokens", str(args.tokens), "--error-rate", str(args.error_rate)],
+        cwd=BACKEND_DIR,
+    )
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(app_port), "--log-level", "warning"],
+        cwd=workdir, env=_backend_env(args, mock_url, workdir),
+    )
+
+    async def run():
+        await _wait_ready(f"{mock_url}/docs")
+        await _wait_ready(f"{app_url}/docs")
+        return await _drive(args, app_url, ProcessSampler(backend.pid))
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        backend.terminate()
+        mock.terminate()
+        backend.wait()
+        mock.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "provider": args.provider,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "prompt_chars": args.prompt_chars,
+            "ttft_ms": args.ttft_ms,
+            "tokens_per_sec": args.tokens_per_sec,
+            "tokens": args.tokens,
+            "error_rate": args.error_rate,
+            "respect_limits": args.respect_limits,
+        },
+        **results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}-{args.provider}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=4)
+
+    _print_report(report)
+    print(f"  saved to       {output}")
+
+if __name__ == "__main__":
+    main()
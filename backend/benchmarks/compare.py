@@ -0,0 +1,47 @@
+"""
+Compares two benchmark reports (e.g. before/after a change).
+
+    python -m benchmarks.compare benchmarks/results/abc123-openai-....json benchmarks/results/def456-openai-....json
+"""
+import argparse
+import json
+
+METRICS = [
+    ("ttft_ms", "p50"), ("ttft_ms", "p99"),
+    ("inter_token_ms", "p50"), ("inter_token_ms", "p99"),
+    ("total_ms", "p50"), ("total_ms", "p99"),
+    ("throughput", "requests_per_sec"), ("throughput", "chunks_per_sec"),
+    ("process", "cpu_seconds"), ("process", "peak_rss_mb"),
+]
+
+def compare(base: dict, head: dict) -> list:
+    rows = []
+    for section, key in METRICS:
+        before = base.get(section, {}).get(key)
+        after = head.get(section, {}).get(key)
+        change = None
+        if before and after is not None:
+            change = round(100 * (after - before) / before, 1)
+        rows.append((f"{section}.{key}", before, after, change))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two chat benchmark reports")
+    parser.add_argument("base")
+    parser.add_argument("head")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    if base.get("config") != head.get("config"):
+        print("Warning: the two runs used different settings\n")
+    print(f"{'metric':<30}{base['commit']:>12}{head['commit']:>12}{'change':>10}")
+    for name, before, after, change in compare(base, head):
+        change_text = f"{change:+.1f}%" if change is not None else "-"
+        print(f"{name:<30}{str(before):>12}{str(after):>12}{change_text:>10}")
+
+if __name__ == "__main__":
+    main()
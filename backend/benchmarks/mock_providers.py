@@ -0,0 +1,134 @@
+"""
+Local stand-ins for the provider streaming APIs, used by the load benchmarks.
+
+    python -m benchmarks.mock_providers --port 9100 --ttft-ms 300 --tokens-per-sec 60 --tokens 200 --error-rate 0.02
+
+Routes (point the backend at them with the ONYS_*_URL env vars):
+    POST /openai/v1/chat/completions              OpenAI SSE
+    POST /anthropic/v1/messages                   Anthropic SSE
+    POST /gemini/v1beta/models/{model}:{method}   Gemini SSE (alt=sse)
+    POST /ollama/api/chat                         Ollama NDJSON
+"""
+import argparse
+import asyncio
+import json
+import random
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+class MockConfig:
+    ttft_ms = 200.0         # delay before the first token
+    tokens_per_sec = 50.0   # pace of the following tokens (0 = as fast as possible)
+    tokens = 100            # tokens per answer
+    error_rate = 0.0        # share of requests answered with 429/500/503
+
+config = MockConfig()
+app = FastAPI()
+
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do"]
+
+async def _paced_tokens():
+    await asyncio.sleep(config.ttft_ms / 1000)
+    interval = 1 / config.tokens_per_sec if config.tokens_per_sec > 0 else 0
+    for i in range(config.tokens):
+        if i and interval:
+            await asyncio.sleep(interval)
+        yield WORDS[i % len(WORDS)] + " "
+
+def _injected_error():
+    if config.error_rate and random.random() < config.error_rate:
+        status = random.choice([429, 500, 503])
+        return JSONResponse({"error": {"message": "Injected failure", "code": status}}, status_code=status)
+    return None
+
+def _prompt_tokens(body: bytes) -> int:
+    return max(1, len(body) // 4)
+
+def _sse(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.post("/openai/v1/chat/completions")
+async def openai_chat(request: Request):
+    body = await request.body()
+    error = _injected_error()
+    if error:
+        return error
+
+    async def events():
+        async for token in _paced_tokens():
+            yield _sse({"choices": [{"index": 0, "delta": {"content": token}}]})
+        prompt = _prompt_tokens(body)
+        yield _sse({"choices": [], "usage": {"prompt_tokens": prompt, "completion_tokens": config.tokens, "total_tokens": prompt + config.tokens}})
+        yield "data: [DONE]\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.post("/anthropic/v1/messages")
+async def anthropic_messages(request: Request):
+    body = await request.body()
+    error = _injected_error()
+    if error:
+        return error
+
+    async def events():
+        yield _sse({"type": "message_start", "message": {"usage": {"input_tokens": _prompt_tokens(body), "output_tokens": 1}}}, "message_start")
+        yield _sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}, "content_block_start")
+        async for token in _paced_tokens():
+            yield _sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}}, "content_block_delta")
+        yield _sse({"type": "content_block_stop", "index": 0}, "content_block_stop")
+        yield _sse({"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": config.tokens}}, "message_delta")
+        yield _sse({"type": "message_stop"}, "message_stop")
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.post("/gemini/v1beta/models/{model_method}")
+async def gemini_generate(model_method: str, request: Request):
+    body = await request.body()
+    error = _injected_error()
+    if error:
+        return error
+
+    async def events():
+        async for token in _paced_tokens():
+            yield _sse({"candidates": [{"content": {"role": "model", "parts": [{"text": token}]}}]})
+        prompt = _prompt_tokens(body)
+        yield _sse({
+            "candidates": [{"content": {"role": "model", "parts": [{"text": ""}]}, "finishReason": "STOP"}],
+            "usageMetadata": {"promptTokenCount": prompt, "candidatesTokenCount": config.tokens, "totalTokenCount": prompt + config.tokens},
+        })
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.post("/ollama/api/chat")
+async def ollama_chat(request: Request):
+    body = await request.body()
+    error = _injected_error()
+    if error:
+        return error
+
+    async def lines():
+        async for token in _paced_tokens():
+            yield json.dumps({"model": "mock", "message": {"role": "assistant", "content": token}, "done": False}) + "\n"
+        yield json.dumps({"model": "mock", "message": {"role": "assistant", "content": ""}, "done": True,
+                          "prompt_eval_count": _prompt_tokens(body), "eval_count": config.tokens}) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--ttft-ms", type=float, default=MockConfig.ttft_ms)
+    parser.add_argument("--tokens-per-sec", type=float, default=MockConfig.tokens_per_sec)
+    parser.add_argument("--tokens", type=int, default=MockConfig.tokens)
+    parser.add_argument("--error-rate", type=float, default=MockConfig.error_rate)
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Mock provider streaming servers")
+    parser.add_argument("--port", type=int, default=9100)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    config.ttft_ms = args.ttft_ms
+    config.tokens_per_sec = args.tokens_per_sec
+    config.tokens = args.tokens
+    config.error_rate = args.error_rate
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
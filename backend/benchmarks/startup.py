@@ -0,0 +1,106 @@
+"""
+Startup benchmark: time from launching the backend until it answers its first request.
+
+    cd backend
+    python -m benchmarks.startup --runs 10
+
+Each run starts `uvicorn main:app` in a fresh process with an empty data directory and polls
+/api/settings/ until it answers. Also reports how long `import main` takes on its own and
+which heavy optional modules got imported at startup. The report is saved to benchmarks/results/.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import shutil
+import httpx
+from .chat_load import BACKEND_DIR, RESULTS_DIR, _free_port, _git_commit
+
+# Modules that should only be imported when a request needs them
+LAZY_MODULES = ("pypdf", "PIL")
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+print(json.dumps({"import_ms": round(elapsed * 1000, 1), "loaded": [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+def _env(data_dir: str) -> dict:
+    env = os.environ.copy()
+    env["PYTHONPATH"] = BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    env["ONYS_DATA_DIR"] = data_dir
+    return env
+
+def measure_import(data_dir: str) -> dict:
+    out = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=BACKEND_DIR, env=_env(data_dir),
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def measure_first_request(data_dir: str, timeout: float = 30.0) -> float:
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/api/settings/"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=_env(data_dir),
+    )
+    try:
+        with httpx.Client() as client:
+            while time.perf_counter() - started < timeout:
+                try:
+                    if client.get(url, timeout=1.0).status_code == 200:
+                        return time.perf_counter() - started
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.005)
+        raise RuntimeError(f"backend did not answer within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+def summarize(values: list) -> dict:
+    ms = [v * 1000 for v in values]
+    return {"median": round(statistics.median(ms), 1), "min": round(min(ms), 1), "max": round(max(ms), 1)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend startup benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", default=None, help="report path (default: benchmarks/results/<commit>-startup-<time>.json)")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="onys-startup-")
+    try:
+        probe = measure_import(data_dir)
+        first_request = [measure_first_request(data_dir) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"runs": args.runs},
+        "import_main_ms": probe["import_ms"],
+        "eager_heavy_modules": probe["loaded"],
+        "time_to_first_request_ms": summarize(first_request),
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}-startup-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=4)
+
+    ttfr = report["time_to_first_request_ms"]
+    print(f"\nStartup over {args.runs} runs (commit {commit})")
+    print(f"  import main          {report['import_main_ms']} ms")
+    print(f"  first request        median={ttfr['median']} min={ttfr['min']} max={ttfr['max']} ms")
+    print(f"  heavy modules loaded {', '.join(report['eager_heavy_modules']) or 'none'}")
+    print(f"  saved to             {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import os
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Root for everything the backend stores (settings, sessions, caches, ledgers).
+# Defaults to the backend directory, where the files lived when the server was started from there,
+# so paths no longer depend on the working directory.
+DATA_ROOT = os.path.abspath(os.environ.get("ONYS_DATA_DIR", BACKEND_DIR))
+
+def data_path(*parts: str) -> str:
+    return os.path.join(DATA_ROOT, *parts)
+
+def legacy_path(path: str, *old_paths: str) -> str:
+    """`path`, unless it does not exist yet and one of the old locations does (keeps existing installs working)."""
+    if os.path.exists(path):
+        return path
+    return next((old for old in old_paths if os.path.exists(old)), path)
+
+SETTINGS_FILE = data_path("user_settings.json")
+DATA_DIR = data_path("data")
+
+# Worker processes serving the app (set by `python main.py --workers N`). With more than one,
+# in-process state must not hide writes from the other workers.
+WORKERS = int(os.environ.get("ONYS_WORKERS", os.environ.get("WEB_CONCURRENCY", "1")))
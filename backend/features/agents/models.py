@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID, uuid4
 
 class Agent(BaseModel):
@@ -11,6 +11,8 @@ class Agent(BaseModel):
     category: str
     instructions: Optional[str] = ""
     knowledge: Optional[str] = ""
+    cache_responses: Optional[bool] = False
+    tools: Optional[List[str]] = []  # names from GET /api/tools
 
 class AgentCreate(BaseModel):
     name: str
@@ -20,6 +22,8 @@ class AgentCreate(BaseModel):
     category: str
     instructions: Optional[str] = ""
     knowledge: Optional[str] = ""
+    cache_responses: Optional[bool] = False
+    tools: Optional[List[str]] = []  # names from GET /api/tools
 
 class AgentUpdate(BaseModel):
     name: Optional[str] = None
@@ -29,3 +33,5 @@ class AgentUpdate(BaseModel):
     category: Optional[str] = None
     instructions: Optional[str] = None
     knowledge: Optional[str] = None
+    cache_responses: Optional[bool] = None
+    tools: Optional[List[str]] = None
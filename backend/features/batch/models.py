@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from features.chat.models import ChatMessage
+
+class BatchItem(BaseModel):
+    custom_id: Optional[str] = None # Echoed back in the output line to match results
+    agent_id: Optional[str] = None
+    provider_id: str
+    model_id: str
+    messages: List[ChatMessage]
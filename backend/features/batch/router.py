@@ -0,0 +1,49 @@
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse
+from .service import (
+    parse_batch_input, create_job, start_job, get_job,
+    list_jobs, cancel_job, get_results_path, MAX_BATCH_CONCURRENCY
+)
+
+router = APIRouter()
+
+@router.post("/", status_code=202)
+async def create_batch_job(request: Request, concurrency: Optional[int] = Query(None, ge=1, le=MAX_BATCH_CONCURRENCY)):
+    """Body: JSONL, one {agent_id, provider_id, model_id, messages, custom_id} object per line."""
+    body = (await request.body()).decode("utf-8")
+    try:
+        items = parse_batch_input(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+
+    job = await asyncio.to_thread(create_job, items, concurrency)
+    start_job(job["id"])
+    return job
+
+@router.get("/")
+def get_all_batch_jobs():
+    return list_jobs()
+
+@router.get("/{job_id}")
+def get_batch_job(job_id: str):
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return job
+
+@router.get("/{job_id}/results")
+def get_batch_results(job_id: str):
+    path = get_results_path(job_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return FileResponse(path, media_type="application/x-ndjson")
+
+@router.post("/{job_id}/cancel")
+async def cancel_batch_job(job_id: str):
+    if not cancel_job(job_id):
+        raise HTTPException(status_code=404, detail="No active batch job with this id")
+    return {"status": "cancelled"}
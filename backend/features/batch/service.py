@@ -0,0 +1,244 @@
+import asyncio
+import itertools
+import json
+import os
+import time
+import httpx
+from uuid import uuid4
+from pydantic import ValidationError
+from features.chat.service import get_provider_config, build_system_prompt, complete_chat, ProviderError
+from features.agents.service import get_agent
+from config import DATA_DIR
+from features.storage.service import storage
+from .models import BatchItem
+
+BATCH_DIR = os.path.join(DATA_DIR, "batch")
+
+BATCH_CONCURRENCY = int(os.environ.get("ONYS_BATCH_CONCURRENCY", "8"))
+BATCH_CONCURRENCY_PER_KEY = int(os.environ.get("ONYS_BATCH_CONCURRENCY_PER_KEY", "2"))
+# Upper bound for a job's own `concurrency`
+MAX_BATCH_CONCURRENCY = 256
+MAX_RETRIES = 3
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+ACTIVE_STATUSES = ("queued", "running")
+
+# job_id -> asyncio.Task of the running job
+_tasks = {}
+
+def _job_dir(job_id: str) -> str:
+    safe_id = "".join([c for c in job_id if c.isalnum() or c in "-_"])
+    return os.path.join(BATCH_DIR, safe_id)
+
+def _job_path(job_id: str, name: str) -> str:
+    return os.path.join(_job_dir(job_id), name)
+
+def parse_batch_input(text: str) -> list:
+    """Parses a JSONL body, one BatchItem per line. Raises ValueError naming the bad line."""
+    items = []
+    for line_no, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            items.append(BatchItem(**json.loads(line)))
+        except (json.JSONDecodeError, ValidationError, TypeError) as e:
+            raise ValueError(f"Line {line_no}: {e}")
+    return items
+
+def _save_job(job: dict):
+    job["updated_at"] = time.time()
+    storage.write(_job_path(job["id"], "job.json"), job, indent=4)
+
+def get_job(job_id: str):
+    job = storage.read(_job_path(job_id, "job.json"))
+    if job is None:
+        return None
+    done = job["completed"] + job["failed"]
+    job["progress"] = round(done / job["total"], 4) if job["total"] else 1.0
+    return job
+
+def list_jobs() -> list:
+    if not os.path.isdir(BATCH_DIR):
+        return []
+    jobs = [get_job(job_id) for job_id in os.listdir(BATCH_DIR)]
+    jobs = [j for j in jobs if j]
+    jobs.sort(key=lambda j: j["created_at"], reverse=True)
+    return jobs
+
+def get_results_path(job_id: str):
+    path = _job_path(job_id, "output.jsonl")
+    return path if os.path.exists(path) else None
+
+def create_job(items: list, concurrency: int = None) -> dict:
+    job_id = uuid4().hex
+    os.makedirs(_job_dir(job_id), exist_ok=True)
+    with open(_job_path(job_id, "input.jsonl"), "w") as f:
+        for item in items:
+            f.write(item.model_dump_json() + "\n")
+    open(_job_path(job_id, "output.jsonl"), "w").close()
+
+    job = {
+        "id": job_id,
+        "status": "queued",
+        "created_at": time.time(),
+        "total": len(items),
+        "completed": 0,
+        "failed": 0,
+        "concurrency": concurrency or BATCH_CONCURRENCY,
+    }
+    _save_job(job)
+    return job
+
+def _cancel_requested(job_id: str) -> bool:
+    # Written by cancel_job in a worker that does not run the job
+    return os.path.exists(_job_path(job_id, "cancel"))
+
+def _load_items(job_id: str) -> list:
+    with open(_job_path(job_id, "input.jsonl"), "r") as f:
+        return [BatchItem(**json.loads(line)) for line in f if line.strip()]
+
+def _scan_results(job_id: str):
+    """
+    Returns (done indices, completed count, failed count) from the output file.
+    A line cut short by a crash is truncated away so appends stay valid JSONL.
+    """
+    path = _job_path(job_id, "output.jsonl")
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+
+    done, completed, failed = set(), 0, 0
+    for line in data.decode("utf-8").splitlines():
+        result = json.loads(line)
+        done.add(result["index"])
+        if result["status"] == "ok":
+            completed += 1
+        else:
+            failed += 1
+    return done, completed, failed
+
+def _append_result(job_id: str, result: dict):
+    with open(_job_path(job_id, "output.jsonl"), "a") as f:
+        f.write(json.dumps(result) + "\n")
+
+async def _process_item(item: BatchItem, config: dict, keys) -> dict:
+    agent = await asyncio.to_thread(get_agent, item.agent_id) if item.agent_id else None
+    messages = [{"role": "system", "content": build_system_prompt(agent)}]
+    messages += [{"role": m.role, "content": m.content} for m in item.messages]
+
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            content, usage = await complete_chat(item.provider_id, config, item.model_id, messages, key=next(keys))
+            return {"status": "ok", "content": content, "usage": usage}
+        except ProviderError as e:
+            if e.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                return {"status": "error", "error": str(e)}
+        except httpx.HTTPError as e:
+            if attempt == MAX_RETRIES:
+                return {"status": "error", "error": f"Connection error: {str(e)}"}
+        except ValueError as e:
+            return {"status": "error", "error": str(e)}
+        await asyncio.sleep(2 ** attempt)
+
+async def run_job(job_id: str):
+    job = await asyncio.to_thread(get_job, job_id)
+    if await asyncio.to_thread(_cancel_requested, job_id):
+        job["status"] = "cancelled"
+        await asyncio.to_thread(_save_job, job)
+        return
+    # Setup failures (bad input file, provider config) end the job as failed, not stuck in "running"
+    try:
+        items = await asyncio.to_thread(_load_items, job_id)
+        done, job["completed"], job["failed"] = await asyncio.to_thread(_scan_results, job_id)
+        job["status"] = "running"
+        await asyncio.to_thread(_save_job, job)
+
+        # Bounded globally, and per provider by how many API keys it has
+        global_limit = asyncio.Semaphore(job["concurrency"])
+        provider_limits, provider_keys, configs = {}, {}, {}
+        for pid in {item.provider_id for item in items}:
+            configs[pid] = await asyncio.to_thread(get_provider_config, pid)
+            keys = [k for k in (configs[pid] or {}).get("keys", []) if k] or [""]
+            provider_keys[pid] = itertools.cycle(keys)
+            provider_limits[pid] = asyncio.Semaphore(BATCH_CONCURRENCY_PER_KEY * len(keys))
+        write_lock = asyncio.Lock()
+
+        async def run_item(index: int, item: BatchItem):
+            # Provider first: items queued behind a busy provider must not sit on global slots
+            # that items for other providers could use
+            async with provider_limits[item.provider_id], global_limit:
+                if _cancel_requested(job_id):
+                    # Cancelling the job task also stops the sibling items
+                    owner = _tasks.get(job_id)
+                    if owner:
+                        owner.cancel()
+                    raise asyncio.CancelledError()
+                if configs[item.provider_id]:
+                    result = await _process_item(item, configs[item.provider_id], provider_keys[item.provider_id])
+                else:
+                    result = {"status": "error", "error": "Provider configuration not found."}
+            result = {"index": index, "custom_id": item.custom_id, **result}
+
+            async with write_lock:
+                await asyncio.to_thread(_append_result, job_id, result)
+                job["completed" if result["status"] == "ok" else "failed"] += 1
+                await asyncio.to_thread(_save_job, job)
+
+        await asyncio.gather(*(run_item(i, item) for i, item in enumerate(items) if i not in done))
+        job["status"] = "completed"
+    except asyncio.CancelledError:
+        job["status"] = "cancelled"
+        raise
+    except Exception as e:
+        print(f"Batch job {job_id} failed: {e}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        await asyncio.to_thread(_save_job, job)
+        _tasks.pop(job_id, None)
+
+async def _run_claimed(job_id: str, claim):
+    try:
+        await run_job(job_id)
+    finally:
+        claim.release()
+
+def start_job(job_id: str) -> bool:
+    """Runs the job here unless another worker process already claimed it."""
+    if job_id in _tasks:
+        return True
+    # The claim is an OS lock: it is released when the job ends or its worker dies
+    claim = storage.try_claim(_job_path(job_id, "run.lock"))
+    if claim is None:
+        return False
+    _tasks[job_id] = asyncio.create_task(_run_claimed(job_id, claim))
+    return True
+
+def cancel_job(job_id: str) -> bool:
+    task = _tasks.get(job_id)
+    if task:
+        task.cancel()
+        return True
+    job = get_job(job_id)
+    if job and job["status"] in ACTIVE_STATUSES:
+        claim = storage.try_claim(_job_path(job_id, "run.lock"))
+        if claim is None:
+            # Running in another worker, which stops at its next item
+            storage.write(_job_path(job_id, "cancel"), {"requested_at": time.time()})
+            return True
+        try:
+            job["status"] = "cancelled"
+            _save_job(job)
+        finally:
+            claim.release()
+        return True
+    return False
+
+def resume_jobs():
+    """Called at startup: picks up jobs that were queued or running when the server stopped."""
+    for job in list_jobs():
+        # With several workers each one runs this; the first to claim a job resumes it
+        if job["status"] in ACTIVE_STATUSES and start_job(job["id"]):
+            print(f"Resuming batch job {job['id']} ({job['completed'] + job['failed']}/{job['total']} done)")
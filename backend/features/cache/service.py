@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from config import DATA_DIR
+from features.storage.service import storage
+
+CACHE_DIR = os.path.join(DATA_DIR, "cache", "responses")
+
+CACHE_TTL_SECONDS = int(os.environ.get("ONYS_RESPONSE_CACHE_TTL", str(24 * 3600)))
+MEMORY_MAX_ENTRIES = 256
+DISK_MAX_BYTES = int(os.environ.get("ONYS_RESPONSE_CACHE_DISK_BYTES", str(200 * 1024 * 1024)))
+
+REPLAY_CHUNK_CHARS = 24
+
+def _normalize_content(content):
+    if isinstance(content, list):
+        return [_normalize_content(c.get("text", "")) for c in content if c.get("type") == "text"]
+    return content.replace("\r\n", "\n").strip()
+
+def make_cache_key(provider_id: str, model_id: str, messages: list, images: list = []) -> str:
+    """
+    Hash of everything that determines the answer. `messages` must be the final provider payload
+    (system prompt + history + extracted documents), `images` the prepared images with their sha256.
+    """
+    payload = {
+        "provider": provider_id,
+        "model": model_id,
+        "messages": [[m["role"], _normalize_content(m["content"])] for m in messages],
+        "images": [img["sha256"] for img in images],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+def split_for_replay(text: str):
+    """Cuts a cached answer into stream-sized chunks, on word boundaries where possible."""
+    start = 0
+    while start < len(text):
+        end = min(start + REPLAY_CHUNK_CHARS, len(text))
+        if end < len(text):
+            space = text.rfind(" ", start, end)
+            if space > start:
+                end = space + 1
+        yield text[start:end]
+        start = end
+
+def _disk_size(entry: dict) -> int:
+    return len(json.dumps(entry).encode("utf-8"))
+
+class ResponseCache:
+    """
+    Two tiers: an in-memory LRU for hot entries and a directory of JSON files that survives restarts.
+    Disk size is bounded by evicting the oldest files once DISK_MAX_BYTES is exceeded.
+    """
+    def __init__(self, cache_dir=CACHE_DIR, ttl=CACHE_TTL_SECONDS, max_entries=MEMORY_MAX_ENTRIES, disk_max_bytes=DISK_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.disk_max_bytes = disk_max_bytes
+        self.memory = OrderedDict()
+        self.disk_index = None  # key -> (created, size), built on first disk access
+        self._disk_lock = threading.RLock()  # the disk tier runs in worker threads
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _expired(self, entry: dict) -> bool:
+        return time.time() - entry["created"] > self.ttl
+
+    def _remember(self, key: str, entry: dict):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    # --- Disk tier (blocking, always run in a thread) ---
+
+    def _load_disk_index(self):
+        with self._disk_lock:
+            if self.disk_index is not None:
+                return
+            disk_index = {}
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith(".json"):
+                        stat = os.stat(os.path.join(root, name))
+                        disk_index[name[:-5]] = (stat.st_mtime, stat.st_size)
+            self.disk_index = disk_index
+
+    def _read_disk(self, key: str):
+        self._load_disk_index()
+        # Not trusting a miss in the index: another worker may have written the entry since
+        entry = storage.read(self._path(key))
+        with self._disk_lock:
+            if entry is None:
+                self.disk_index.pop(key, None)
+            elif key not in self.disk_index:
+                self.disk_index[key] = (entry["created"], _disk_size(entry))
+        return entry
+
+    def _delete_disk(self, key: str):
+        with self._disk_lock:
+            if self.disk_index is not None:
+                self.disk_index.pop(key, None)
+            storage.delete(self._path(key))
+
+    def _write_disk(self, key: str, entry: dict):
+        self._load_disk_index()
+        path = self._path(key)
+        storage.write(path, entry)
+        with self._disk_lock:
+            # Size of what storage.write wrote; the file itself may already be evicted by another thread
+            self.disk_index[key] = (entry["created"], _disk_size(entry))
+
+            total = sum(size for _, size in self.disk_index.values())
+            if total > self.disk_max_bytes:
+                for old_key, (_, size) in sorted(self.disk_index.items(), key=lambda item: item[1][0]):
+                    if total <= self.disk_max_bytes:
+                        break
+                    self._delete_disk(old_key)
+                    total -= size
+
+    # --- Public API ---
+
+    async def get(self, key: str):
+        entry = self.memory.get(key)
+        if entry is None:
+            entry = await asyncio.to_thread(self._read_disk, key)
+        if entry is None or self._expired(entry):
+            if entry is not None:
+                self.memory.pop(key, None)
+                await asyncio.to_thread(self._delete_disk, key)
+            self.misses += 1
+            return None
+        self._remember(key, entry)
+        self.hits += 1
+        return entry
+
+    async def put(self, key: str, content: str, usage: dict):
+        entry = {"created": time.time(), "content": content, "usage": usage}
+        self._remember(key, entry)
+        await asyncio.to_thread(self._write_disk, key, entry)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_entries": len(self.memory),
+            "disk_entries": len(self.disk_index) if self.disk_index is not None else None,
+        }
+
+response_cache = ResponseCache()
@@ -0,0 +1,167 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+# Limits can be tuned per deployment through env vars.
+# ONYS_PROVIDER_LIMITS overrides the per-provider limit, e.g. "openai=8,runpod=1"
+MAX_CONCURRENT_CHATS = int(os.environ.get("ONYS_MAX_CONCURRENT_CHATS", "16"))
+MAX_CONCURRENT_PER_PROVIDER = int(os.environ.get("ONYS_MAX_CONCURRENT_PER_PROVIDER", "4"))
+MAX_QUEUED_CHATS = int(os.environ.get("ONYS_MAX_QUEUED_CHATS", "64"))
+QUEUE_TIMEOUT_SECONDS = float(os.environ.get("ONYS_QUEUE_TIMEOUT", "120"))
+
+POSITION_POLL_SECONDS = 0.5
+
+def _parse_provider_limits(value: str) -> dict:
+    limits = {}
+    for item in value.split(","):
+        if "=" in item:
+            pid, limit = item.split("=", 1)
+            limits[pid.strip()] = int(limit)
+    return limits
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Chat queue is full.")
+        self.retry_after = retry_after
+
+class QueueTimeoutError(Exception):
+    pass
+
+class Ticket:
+    def __init__(self, provider_id: str):
+        self.provider_id = provider_id
+        self.enqueued_at = time.monotonic()
+        self.granted_at = None
+        self.released = False
+        self.granted = asyncio.Event()
+
+class AdmissionController:
+    """
+    Global + per-provider concurrency limits with a bounded FIFO wait queue.
+    A provider at its limit doesn't block queued requests for other providers.
+    """
+    def __init__(self, max_concurrent=MAX_CONCURRENT_CHATS, max_per_provider=MAX_CONCURRENT_PER_PROVIDER,
+                 max_queued=MAX_QUEUED_CHATS, queue_timeout=QUEUE_TIMEOUT_SECONDS, provider_limits=None):
+        self.max_concurrent = max_concurrent
+        self.max_per_provider = max_per_provider
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.provider_limits = provider_limits or {}
+
+        self.active = 0
+        self.active_by_provider = {}
+        self.waiting = deque()
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.waits = deque(maxlen=500)      # seconds spent queued, recent admissions
+        self.durations = deque(maxlen=100)  # seconds a slot was held, recent releases
+
+    def limit_for(self, provider_id: str) -> int:
+        return self.provider_limits.get(provider_id, self.max_per_provider)
+
+    def _has_capacity(self, provider_id: str) -> bool:
+        return (self.active < self.max_concurrent
+                and self.active_by_provider.get(provider_id, 0) < self.limit_for(provider_id))
+
+    def _grant(self, ticket: Ticket):
+        self.active += 1
+        self.active_by_provider[ticket.provider_id] = self.active_by_provider.get(ticket.provider_id, 0) + 1
+        ticket.granted_at = time.monotonic()
+        self.admitted += 1
+        self.waits.append(ticket.granted_at - ticket.enqueued_at)
+        ticket.granted.set()
+
+    def _dispatch(self):
+        for ticket in list(self.waiting):
+            if self.active >= self.max_concurrent:
+                break
+            if self._has_capacity(ticket.provider_id):
+                self.waiting.remove(ticket)
+                self._grant(ticket)
+
+    def enqueue(self, provider_id: str) -> Ticket:
+        """Reserves a slot or a place in the queue. Raises QueueFullError when neither is available."""
+        ticket = Ticket(provider_id)
+        if self._has_capacity(provider_id) and not any(t.provider_id == provider_id for t in self.waiting):
+            self._grant(ticket)
+        elif len(self.waiting) >= self.max_queued:
+            self.rejected += 1
+            raise QueueFullError(self.retry_after())
+        else:
+            self.waiting.append(ticket)
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        try:
+            return self.waiting.index(ticket) + 1
+        except ValueError:
+            return 0
+
+    async def wait(self, ticket: Ticket):
+        """Yields the ticket's queue position whenever it changes, returns once a slot is granted."""
+        deadline = ticket.enqueued_at + self.queue_timeout
+        last_position = None
+        while not ticket.granted.is_set():
+            position = self.position(ticket)
+            if position != last_position:
+                last_position = position
+                yield position
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.timed_out += 1
+                self.release(ticket)
+                raise QueueTimeoutError()
+            try:
+                await asyncio.wait_for(ticket.granted.wait(), timeout=min(remaining, POSITION_POLL_SECONDS))
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, ticket: Ticket):
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.granted_at is not None:
+            self.active -= 1
+            self.active_by_provider[ticket.provider_id] -= 1
+            self.durations.append(time.monotonic() - ticket.granted_at)
+        elif ticket in self.waiting:
+            self.waiting.remove(ticket)
+        self._dispatch()
+
+    def retry_after(self) -> int:
+        # Rough estimate: time for the current queue to drain at the observed turn duration
+        avg_duration = sum(self.durations) / len(self.durations) if self.durations else 10.0
+        batches = (len(self.waiting) // max(self.max_concurrent, 1)) + 1
+        return max(1, int(avg_duration * batches))
+
+    def stats(self) -> dict:
+        waits = sorted(self.waits)
+        providers = {}
+        for pid in set(self.active_by_provider) | {t.provider_id for t in self.waiting}:
+            providers[pid] = {
+                "active": self.active_by_provider.get(pid, 0),
+                "queued": sum(1 for t in self.waiting if t.provider_id == pid),
+                "limit": self.limit_for(pid),
+            }
+        return {
+            "active": self.active,
+            "queued": len(self.waiting),
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_ms": {
+                "avg": round(1000 * sum(waits) / len(waits), 1) if waits else 0,
+                "p95": round(1000 * waits[int(len(waits) * 0.95)], 1) if waits else 0,
+                "max": round(1000 * waits[-1], 1) if waits else 0,
+            },
+            "providers": providers,
+        }
+
+admission = AdmissionController(
+    provider_limits=_parse_provider_limits(os.environ.get("ONYS_PROVIDER_LIMITS", ""))
+)
@@ -0,0 +1,145 @@
+"""
+History compaction for long chats.
+
+Once the part of a chat not covered by its summary passes COMPACT_THRESHOLD_TOKENS, the older
+turns are folded into the summary by a cheap model in a background task. The summary is stored
+in the session file next to the raw messages (which stay for display), and the next turns send
+summary + recent messages instead of the full history.
+"""
+import asyncio
+import os
+import time
+from features.sessions.service import save_summary
+from features.sessions.messages import prefix_hash
+from features.usage.service import usage_ledger
+
+COMPACTION_ENABLED = os.environ.get("ONYS_COMPACTION", "1") != "0"
+COMPACT_THRESHOLD_TOKENS = int(os.environ.get("ONYS_COMPACT_THRESHOLD_TOKENS", "6000"))
+KEEP_RECENT_TOKENS = int(os.environ.get("ONYS_COMPACT_KEEP_RECENT_TOKENS", "2000"))
+# "provider:model" used for every summary; by default the chat's provider with a cheap model
+SUMMARY_MODEL = os.environ.get("ONYS_SUMMARY_MODEL", "")
+
+CHEAP_MODELS = {
+    "openai": "gpt-4o-mini",
+    "anthropic": "claude-3-haiku-20240307",
+    "gemini": "gemini-2.0-flash",
+}
+
+SUMMARY_INSTRUCTION = """You maintain the running summary of a conversation between a user and an AI assistant.
+Merge the previous summary with the new messages into one updated summary.
+Keep facts, decisions, names, numbers, code identifiers, open questions and the user's preferences.
+Drop greetings and repetition. Write plain prose or short bullet points, no preamble."""
+
+_tasks = {}  # chat_id -> running compaction task
+
+def estimate_tokens(messages: list) -> int:
+    # ~4 characters per token, close enough for a threshold
+    total = 0
+    for msg in messages:
+        content = msg.get("content")
+        if isinstance(content, list):
+            content = " ".join(c.get("text", "") for c in content if isinstance(c, dict))
+        total += len(content or "") // 4 + 4
+    return total
+
+def summary_target(provider_id: str, model_id: str):
+    if ":" in SUMMARY_MODEL:
+        provider, model = SUMMARY_MODEL.split(":", 1)
+        return provider, model
+    return provider_id, CHEAP_MODELS.get(provider_id, model_id)
+
+def _valid_summary(history: list, summary) -> bool:
+    # The frontend can edit or truncate the history; a summary of other messages is ignored
+    if not summary or not summary.get("text"):
+        return False
+    covered = summary.get("covered", 0)
+    return 0 < covered < len(history) and prefix_hash(history, covered) == summary.get("hash")
+
+def apply_summary(history: list, summary):
+    """Returns (summary text or None, messages to send)."""
+    if not _valid_summary(history, summary):
+        return None, history
+    return summary["text"], history[summary["covered"]:]
+
+def summary_block(text: str) -> str:
+    return f"\n\nSUMMARY OF THE EARLIER CONVERSATION (older messages are not repeated below):\n{text}"
+
+def compaction_cutoff(history: list, summary=None):
+    """Index up to which the history should be summarized, or None while it is short enough."""
+    covered = summary["covered"] if _valid_summary(history, summary) else 0
+    if estimate_tokens(history[covered:]) <= COMPACT_THRESHOLD_TOKENS:
+        return None
+
+    # Keep the most recent messages verbatim, starting on a user turn so providers that
+    # require user/assistant alternation still get a valid conversation
+    cutoff, kept = len(history), 0
+    while cutoff > covered + 1:
+        kept += estimate_tokens(history[cutoff - 1:cutoff])
+        if kept > KEEP_RECENT_TOKENS:
+            break
+        cutoff -= 1
+    while cutoff < len(history) and history[cutoff].get("role") != "user":
+        cutoff += 1
+    if cutoff >= len(history) or cutoff <= covered:
+        return None
+    return cutoff
+
+def _transcript(messages: list) -> str:
+    lines = []
+    for msg in messages:
+        content = msg.get("content")
+        if isinstance(content, list):
+            content = " ".join(c.get("text", "") for c in content if isinstance(c, dict))
+        lines.append(f"{msg.get('role', 'user').upper()}: {content}")
+    return "\n\n".join(lines)
+
+async def summarize(previous: str, messages: list, provider_id: str, model_id: str):
+    from .service import complete_chat, get_provider_config
+
+    config = await asyncio.to_thread(get_provider_config, provider_id)
+    if not config:
+        raise ValueError(f"Provider '{provider_id}' is not configured.")
+    prompt = f"PREVIOUS SUMMARY:\n{previous or '(none)'}\n\nNEW MESSAGES:\n{_transcript(messages)}"
+    return await complete_chat(provider_id, config, model_id, [
+        {"role": "system", "content": SUMMARY_INSTRUCTION},
+        {"role": "user", "content": prompt},
+    ])
+
+async def compact(chat_id: str, history: list, summary, cutoff: int, provider_id: str, model_id: str, agent_id: str = None):
+    previous, covered = (summary["text"], summary["covered"]) if _valid_summary(history, summary) else ("", 0)
+    pid, model = summary_target(provider_id, model_id)
+    text, usage = await summarize(previous, history[covered:cutoff], pid, model)
+    if not text.strip():
+        return None
+    new_summary = {
+        "text": text.strip(),
+        "covered": cutoff,
+        "hash": prefix_hash(history, cutoff),
+        "provider": pid,
+        "model": model,
+        "updated_at": time.time(),
+    }
+    await asyncio.to_thread(save_summary, chat_id, new_summary)
+    await asyncio.to_thread(usage_ledger.record, pid, model, usage, chat_id, agent_id)
+    return new_summary
+
+async def _run(chat_id: str, *args):
+    try:
+        await compact(chat_id, *args)
+    except Exception as e:
+        # The chat keeps working on the full history; the next turn tries again
+        print(f"Error compacting chat {chat_id}: {e}")
+    finally:
+        _tasks.pop(chat_id, None)
+
+def schedule(request, history: list, summary):
+    """Starts a background summary update for this chat if it has grown past the threshold."""
+    if not COMPACTION_ENABLED or request.chat_id in _tasks:
+        return None
+    cutoff = compaction_cutoff(history, summary)
+    if cutoff is None:
+        return None
+    task = asyncio.create_task(_run(request.chat_id, history, summary, cutoff,
+                                    request.provider_id, request.model_id, request.agent_id))
+    _tasks[request.chat_id] = task
+    return task
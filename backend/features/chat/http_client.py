@@ -0,0 +1,33 @@
+import asyncio
+import os
+import httpx
+
+# One pooled client for every provider call: keeps TLS sessions and connections alive between
+# turns instead of paying a new SSL context + handshake per request
+MAX_CONNECTIONS = int(os.environ.get("ONYS_HTTP_MAX_CONNECTIONS", "200"))
+KEEPALIVE_SECONDS = 60.0
+
+_client = None
+_client_loop = None
+
+def get_client() -> httpx.AsyncClient:
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    # Connections belong to the loop they were opened on (tests run one loop per test)
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            timeout=60.0,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_SECONDS,
+            ),
+        )
+        _client_loop = loop
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
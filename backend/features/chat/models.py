@@ -20,6 +20,7 @@ class ChatRequest(BaseModel):
     images: Optional[List[str]] = [] 
     documents: Optional[List[FileAttachment]] = []
     agent_id: Optional[str] = None
+    use_cache: Optional[bool] = False # Replay a stored answer for an identical prompt
 
 class ChatResponse(BaseModel):
     content: str
@@ -1,13 +1,74 @@
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Header, WebSocket
 from fastapi.responses import StreamingResponse
 from .models import ChatRequest, ChatResponse
 from .service import process_chat
+from .admission import admission, QueueFullError
+from .transports import ChatSocket, start_stream, get_stream, cancel_stream, parse_last_event_id, sse_events
 
 router = APIRouter()
 
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def _reserve_slot(request: ChatRequest):
+    # Reject before streaming starts so clients get a real 429 instead of an error event
+    try:
+        return admission.enqueue(request.provider_id)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail="Chat queue is full, please retry later.",
+                            headers={"Retry-After": str(e.retry_after)})
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    Frees the admission slot however the response ends. The chat generator releases it too, but
+    a generator the client disconnects from before its first item never runs its cleanup.
+    """
+    def __init__(self, ticket, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            admission.release(self.ticket)  # idempotent
+
 @router.post("/send")
 async def send_chat_message(request: ChatRequest):
+    ticket = _reserve_slot(request)
     try:
-        return StreamingResponse(process_chat(request), media_type="application/x-ndjson")
+        return AdmittedStreamingResponse(ticket, process_chat(request, ticket), media_type="application/x-ndjson")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        admission.release(ticket)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/sse")
+async def send_chat_message_sse(request: ChatRequest):
+    stream = start_stream(request, _reserve_slot(request))
+    return StreamingResponse(sse_events(stream), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.get("/sse/{stream_id}")
+async def resume_chat_sse(stream_id: str, last_event_id: Optional[str] = Header(None), after: Optional[str] = None):
+    # EventSource sends Last-Event-ID on reconnect; "?after=" covers the first manual resume
+    stream = get_stream(stream_id)
+    if not stream:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    last_seq = parse_last_event_id(last_event_id or after)
+    if stream.missed_since(last_seq):
+        raise HTTPException(status_code=410, detail="Stream events after this position are no longer buffered")
+    return StreamingResponse(sse_events(stream, last_seq), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.delete("/sse/{stream_id}")
+async def cancel_chat_sse(stream_id: str):
+    if not cancel_stream(stream_id):
+        raise HTTPException(status_code=404, detail="Stream not found or already finished")
+    return {"status": "cancelled"}
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket):
+    await websocket.accept()
+    await ChatSocket(websocket).serve()
+
+@router.get("/admission")
+def get_admission_stats():
+    return admission.stats()
@@ -1,12 +1,22 @@
-import httpx
+import asyncio
 import json
 import os
+import time
+from contextlib import nullcontext
 from features.instructions.service import get_instruction
-from features.sessions.service import save_session
+from features.sessions.service import save_session, load_summary
 from features.files.service import extract_text_from_file
+from features.files.images import prepare_images
 from features.agents.service import get_agent
-
-SETTINGS_FILE = "user_settings.json"
+from features.cache.service import response_cache, make_cache_key, split_for_replay
+from features.usage.service import usage_ledger
+from features.metrics.service import start_trace, record_turn, record_error
+from features.settings.service import get_provider_settings
+from features.tools.service import ToolContext, get_tools, run_tool_calls
+from .admission import admission, QueueFullError, QueueTimeoutError
+from .http_client import get_client
+from .tool_calls import ToolCallAccumulator, tool_declarations, tool_round_messages
+from . import compaction
 
 FORMATTING_INSTRUCTION = """
 SYSTEM FORMATTING RULES:
@@ -15,45 +25,70 @@ SYSTEM FORMATTING RULES:
 3. Use Bold (**text**) for key terms.
 """
 
+# Endpoints can be pointed elsewhere (proxies, the benchmark stand-in servers) through env vars
+OPENAI_COMPATIBLE_URLS = {
+    "openai": os.environ.get("ONYS_OPENAI_URL", "https://api.openai.com/v1/chat/completions"),
+    "grok": os.environ.get("ONYS_GROK_URL", "https://api.x.ai/v1/chat/completions"),
+}
+ANTHROPIC_URL = os.environ.get("ONYS_ANTHROPIC_URL", "https://api.anthropic.com/v1/messages")
+GEMINI_BASE_URL = os.environ.get("ONYS_GEMINI_URL", "https://generativelanguage.googleapis.com/v1beta")
+
+# Model responses per turn when the agent has tools (each tool round adds one)
+MAX_TOOL_ROUNDS = int(os.environ.get("ONYS_MAX_TOOL_ROUNDS", "5"))
+# Attached documents longer than this are left to the lookup_document tool when the agent has it
+DOCUMENT_INLINE_CHARS = int(os.environ.get("ONYS_DOCUMENT_INLINE_CHARS", "30000"))
+
+class ProviderError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Error {status_code}: {message}")
+        self.status_code = status_code
+
 def get_provider_config(provider_id: str):
-    if not os.path.exists(SETTINGS_FILE):
-        return None
-    with open(SETTINGS_FILE, "r") as f:
-        data = json.load(f)
-    for p in data.get("providers", []):
-        if p["id"] == provider_id:
-            return p
-    return None
+    return get_provider_settings(provider_id)
 
 # --- MULTIMODAL SENDERS ---
 
-async def send_to_openai_compatible(key: str, model: str, messages: list, base_url: str, images: list = [], stream: bool = False):
+async def _check_stream_status(response):
+    # Error bodies are plain JSON, not stream events; surface them instead of parsing nothing
+    if response.status_code != 200:
+        body = await response.aread()
+        raise ProviderError(response.status_code, body.decode("utf-8", errors="replace"))
+
+def _last_user_index(messages: list):
+    # The latest user prompt; after a tool round the history ends with tool results instead
+    return next((i for i in range(len(messages) - 1, -1, -1)
+                 if messages[i]['role'] == 'user' and isinstance(messages[i].get('content'), str)), None)
+
+async def send_to_openai_compatible(key: str, model: str, messages: list, base_url: str, images: list = [], stream: bool = False, tools: list = None):
     headers = { "Authorization": f"Bearer {key}", "Content-Type": "application/json" }
      # "Flashbulb" Strategy:
     # 1. Take history as text-only context.
     final_messages = messages.copy()
     # 2. Attach images ONLY to the last user message
-    if images and final_messages:
-        last_msg = final_messages.pop()
-        content_list = [{"type": "text", "text": last_msg['content']}]
-        for img_b64 in images:
-            content_list.append({ "type": "image_url", "image_url": { "url": f"data:image/jpeg;base64,{img_b64}" } })
-        final_messages.append({"role": "user", "content": content_list})
+    last_user = _last_user_index(final_messages)
+    if images and last_user is not None:
+        content_list = [{"type": "text", "text": final_messages[last_user]['content']}]
+        for img in images:
+            content_list.append({ "type": "image_url", "image_url": { "url": f"data:{img['mime_type']};base64,{img['data']}" } })
+        final_messages[last_user] = {"role": "user", "content": content_list}
 
     payload = { "model": model, "messages": final_messages, "stream": stream }
+    if tools:
+        payload["tools"] = tools
     if stream:
         payload["stream_options"] = {"include_usage": True}
-    async with httpx.AsyncClient() as client:
-        if stream:
-            async with client.stream("POST", base_url, headers=headers, json=payload, timeout=60.0) as response:
-                async for chunk in response.aiter_lines():
-                    if chunk:
-                        yield chunk
-        else:
-            yield await client.post(base_url, headers=headers, json=payload, timeout=60.0)
-
-async def send_to_anthropic(key: str, model: str, messages: list, images: list = []):
-    url = "https://api.anthropic.com/v1/messages"
+    client = get_client()
+    if stream:
+        async with client.stream("POST", base_url, headers=headers, json=payload, timeout=60.0) as response:
+            await _check_stream_status(response)
+            async for chunk in response.aiter_lines():
+                if chunk:
+                    yield chunk
+    else:
+        yield await client.post(base_url, headers=headers, json=payload, timeout=60.0)
+
+async def send_to_anthropic(key: str, model: str, messages: list, images: list = [], stream: bool = False, tools: list = None):
+    url = ANTHROPIC_URL
     headers = { "x-api-key": key, "anthropic-version": "2023-06-01", "content-type": "application/json" }
 
     system_prompt = None
@@ -63,39 +98,55 @@ async def send_to_anthropic(key: str, model: str, messages: list, images: list =
             if system_prompt: system_prompt += "\n" + msg['content']
             else: system_prompt = msg['content']
         else:
-            if isinstance(msg['content'], list):
+            if isinstance(msg['content'], list) and any(c['type'] in ('tool_use', 'tool_result') for c in msg['content']):
+                # Tool rounds are already in Anthropic's block format
+                clean_messages.append(msg)
+            elif isinstance(msg['content'], list):
                 text_part = next((c['text'] for c in msg['content'] if c['type'] == 'text'), "")
                 clean_messages.append({"role": msg['role'], "content": text_part})
             else:
-                clean_messages.append(msg)
+                clean_messages.append({"role": msg['role'], "content": msg['content']})
 
-    if images and clean_messages:
-        last_msg = clean_messages.pop()
-        content_list = [{"type": "text", "text": last_msg['content']}]
-        for img_b64 in images:
-            content_list.append({ "type": "image", "source": { "type": "base64", "media_type": "image/jpeg", "data": img_b64 } })
-        clean_messages.append({"role": "user", "content": content_list})
+    last_user = _last_user_index(clean_messages)
+    if images and last_user is not None:
+        content_list = [{"type": "text", "text": clean_messages[last_user]['content']}]
+        for img in images:
+            content_list.append({ "type": "image", "source": { "type": "base64", "media_type": img['mime_type'], "data": img['data'] } })
+        clean_messages[last_user] = {"role": "user", "content": content_list}
 
-    payload = { "model": model, "messages": clean_messages, "max_tokens": 1024 }
+    payload = { "model": model, "messages": clean_messages, "max_tokens": 1024, "stream": stream }
     if system_prompt: payload["system"] = system_prompt
+    if tools: payload["tools"] = tools
 
-    async with httpx.AsyncClient() as client:
-        return await client.post(url, headers=headers, json=payload, timeout=60.0)
-
-async def send_to_gemini(key: str, model: str, messages: list, images: list = [], stream: bool = False):
+    client = get_client()
+    if stream:
+        async with client.stream("POST", url, headers=headers, json=payload, timeout=60.0) as response:
+            await _check_stream_status(response)
+            async for chunk in response.aiter_lines():
+                if chunk:
+                    yield chunk
+    else:
+        yield await client.post(url, headers=headers, json=payload, timeout=60.0)
+
+async def send_to_gemini(key: str, model: str, messages: list, images: list = [], stream: bool = False, tools: list = None):
     # Use streamGenerateContent for streaming, generateContent for non-streaming
     method = "streamGenerateContent" if stream else "generateContent"
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:{method}?key={key}"
+    url = f"{GEMINI_BASE_URL}/models/{model}:{method}?key={key}"
     if stream:
         url += "&alt=sse" # Request Server-Sent Events
 
     system_instruction = None
     contents = []
 
+    last_user = _last_user_index(messages)
     for i, msg in enumerate(messages):
         if msg['role'] == 'system':
             system_instruction = { "parts": [{ "text": msg['content'] }] }
             continue
+        if "parts" in msg:
+            # Tool rounds (functionCall / functionResponse) are already in Gemini's format
+            contents.append({ "role": msg['role'], "parts": msg['parts'] })
+            continue
         role = "model" if msg['role'] == "assistant" else "user"
         parts = []
         if isinstance(msg['content'], list):
@@ -104,34 +155,37 @@ async def send_to_gemini(key: str, model: str, messages: list, images: list = []
         else:
              parts.append({ "text": msg['content'] })
 
-        if i == len(messages) - 1 and images and role == "user":
-            for img_b64 in images:
-                parts.append({ "inline_data": { "mime_type": "image/jpeg", "data": img_b64 } })
+        if i == last_user and images:
+            for img in images:
+                parts.append({ "inline_data": { "mime_type": img['mime_type'], "data": img['data'] } })
         contents.append({ "role": role, "parts": parts })
 
     payload = { "contents": contents }
     if system_instruction: payload["systemInstruction"] = system_instruction
+    if tools: payload["tools"] = tools
 
-    async with httpx.AsyncClient() as client:
-        if stream:
-            async with client.stream("POST", url, json=payload, timeout=60.0) as response:
-                 async for chunk in response.aiter_lines():
-                    if chunk:
-                        yield chunk
-        else:
-            yield await client.post(url, json=payload, timeout=60.0)
+    client = get_client()
+    if stream:
+        async with client.stream("POST", url, json=payload, timeout=60.0) as response:
+             await _check_stream_status(response)
+             async for chunk in response.aiter_lines():
+                if chunk:
+                    yield chunk
+    else:
+        yield await client.post(url, json=payload, timeout=60.0)
 
 async def send_to_runpod(url: str, model: str, messages: list, stream: bool = False):
     clean_url = url.rstrip("/") + "/api/chat"
     payload = { "model": model, "messages": messages, "stream": stream }
-    async with httpx.AsyncClient() as client:
-        if stream:
-            async with client.stream("POST", clean_url, json=payload, timeout=60.0) as response:
-                async for chunk in response.aiter_lines():
-                    if chunk:
-                        yield chunk
-        else:
-            yield await client.post(clean_url, json=payload, timeout=60.0)
+    client = get_client()
+    if stream:
+        async with client.stream("POST", clean_url, json=payload, timeout=60.0) as response:
+            await _check_stream_status(response)
+            async for chunk in response.aiter_lines():
+                if chunk:
+                    yield chunk
+    else:
+        yield await client.post(clean_url, json=payload, timeout=60.0)
 
 # --- RECEIVERS (UPDATED TO RETURN TUPLE: content, usage) ---
 def parse_openai_response(response):
@@ -198,29 +252,76 @@ def parse_gemini_response(response):
         "total_tokens": meta.get("totalTokenCount", 0)
     }
 
-async def process_chat(request):
-    config = get_provider_config(request.provider_id)
-    if not config: 
-        yield json.dumps({"error": "Provider configuration not found."})
-        return
-
-# 1. PREPARE & EXTRACT DOCUMENTS
-    # If there are documents, extract text and append to the LAST user message
-    docs_context = ""
-    if request.documents:
-        for doc in request.documents:
-            text_content = extract_text_from_file(doc.name, doc.type, doc.content)
-            docs_context += f"\n\n--- FILE: {doc.name} ---\n{text_content}\n-----------------------\n"
-
-    # 2. INJECT INSTRUCTIONS
-    user_instruction = get_instruction(request.chat_id)
-    
-    # AGENT INJECTION
+def parse_stream_event(data: dict, usage: dict):
+    """
+    Text delta and running usage after one parsed stream event, for every provider's format.
+    Raises (KeyError, IndexError, ...) on shapes it does not know; the caller skips those events.
+    """
+    delta = ""
+    event_type = data.get("type", "")
+
+    # Anthropic (typed SSE events, usage split across message_start / message_delta)
+    if event_type.startswith(("message_", "content_block_")):
+        if event_type == "content_block_delta":
+            delta = data.get("delta", {}).get("text", "")
+        elif event_type == "message_start":
+            u = data.get("message", {}).get("usage", {})
+            usage = {**usage, "prompt_tokens": u.get("input_tokens", 0)}
+        elif event_type == "message_delta":
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = data.get("usage", {}).get("output_tokens", 0)
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+
+    # OpenAI / Grok (the final usage chunk has an empty "choices" list)
+    elif "choices" in data:
+        if data["choices"]:
+            delta = data["choices"][0].get("delta", {}).get("content") or ""
+
+    # Ollama / RunPod
+    elif "message" in data:
+        delta = data["message"].get("content", "")
+        if data.get("done"):
+            usage = {
+                "prompt_tokens": data.get("prompt_eval_count", 0),
+                "completion_tokens": data.get("eval_count", 0),
+                "total_tokens": data.get("prompt_eval_count", 0) + data.get("eval_count", 0)
+            }
+
+    # Gemini (SSE format)
+    # data: {"candidates": [{"content": {"parts": [{"text": "..."}]}}]}
+    elif "candidates" in data:
+        # The last chunk may carry only usageMetadata and an empty candidate list
+        parts = data["candidates"][0].get("content", {}).get("parts", []) if data["candidates"] else []
+        delta = "".join(p.get("text", "") for p in parts)
+
+    # Extract Usage if present
+    if "usage" in data and "choices" in data and data["usage"]:
+        # OpenAI / Grok usage format
+        u = data["usage"]
+        usage = {
+            "prompt_tokens": u.get("prompt_tokens", 0),
+            "completion_tokens": u.get("completion_tokens", 0),
+            "total_tokens": u.get("total_tokens", 0)
+        }
+
+    if "usageMetadata" in data:
+        # Gemini usage format
+        u = data["usageMetadata"]
+        usage = {
+            "prompt_tokens": u.get("promptTokenCount", 0),
+            "completion_tokens": u.get("candidatesTokenCount", 0),
+            "total_tokens": u.get("totalTokenCount", 0)
+        }
+    return delta, usage
+
+def build_system_prompt(agent=None, user_instruction: str = "") -> str:
     agent_instruction = ""
-    if request.agent_id:
-        agent = get_agent(request.agent_id)
-        if agent:
-            agent_instruction = f"""
+    if agent:
+        agent_instruction = f"""
             YOU ARE AN AI AGENT WITH THE FOLLOWING PROFILE:
             NAME: {agent.name}
             ROLE: {agent.role}
@@ -233,11 +334,110 @@ async def process_chat(request):
             YOUR KNOWLEDGE BASE:
             {agent.knowledge}
             """
+    return f"{FORMATTING_INSTRUCTION}\n\n{agent_instruction}\n\n{user_instruction if user_instruction else ''}"
+
+async def _first_response(generator):
+    # Non-streaming senders yield a single httpx.Response; close the generator so its cleanup runs
+    try:
+        return await anext(generator)
+    finally:
+        await generator.aclose()
+
+async def complete_chat(pid: str, config: dict, model: str, messages: list, key: str = None, images: list = []):
+    """
+    Non-streaming request for background work (batch jobs, summaries). Returns (content, usage).
+    Raises ProviderError on a non-200 answer so callers can retry or record the failure.
+    """
+    key = key or (config.get("keys") or [""])[0]
+    if pid == "runpod":
+        response = await _first_response(send_to_runpod(config.get("url", ""), model, messages))
+        parser = parse_runpod_response
+    elif pid in OPENAI_COMPATIBLE_URLS:
+        response = await _first_response(send_to_openai_compatible(key, model, messages, OPENAI_COMPATIBLE_URLS[pid], images))
+        parser = parse_openai_response
+    elif pid == "gemini":
+        response = await _first_response(send_to_gemini(key, model, messages, images))
+        parser = parse_gemini_response
+    elif pid == "anthropic":
+        response = await _first_response(send_to_anthropic(key, model, messages, images))
+        parser = parse_anthropic_response
+    else:
+        raise ValueError(f"Provider '{pid}' is not supported.")
+
+    if response.status_code != 200:
+        raise ProviderError(response.status_code, response.text)
+    return parser(response)
+
+async def stream_chat_events(request, ticket=None):
+    """
+    Runs one chat turn and yields its events as dicts ({"chunk": ...}, {"usage": ...}, {"error": ...}).
+    Every transport (NDJSON, SSE, WebSocket) serializes these the way it needs.
+    `ticket` is an admission slot reserved by the caller; one is requested here if missing.
+    """
+    if ticket is None:
+        try:
+            ticket = admission.enqueue(request.provider_id)
+        except QueueFullError as e:
+            yield {"error": "Server is busy, please retry shortly.", "retry_after": e.retry_after}
+            return
+    try:
+        try:
+            async for position in admission.wait(ticket):
+                yield {"queue": {"position": position}}
+        except QueueTimeoutError:
+            yield {"error": "Timed out waiting for a free slot, please retry."}
+            return
+
+        async for event in _run_chat_turn(request):
+            yield event
+    finally:
+        admission.release(ticket)
+
+async def _run_chat_turn(request):
+    # File reads/writes and document parsing run in threads so one large history
+    # or PDF does not stall every other stream on the event loop
+    trace = start_trace()
+    with trace.span("settings"):
+        config = await asyncio.to_thread(get_provider_config, request.provider_id)
+    if not config: 
+        yield {"error": "Provider configuration not found."}
+        return
+
+# 1. PREPARE & EXTRACT DOCUMENTS
+    # If there are documents, extract text and append to the LAST user message
+    docs_context = ""
+    documents = []
+    if request.documents:
+        with trace.span("documents"):
+            for doc in request.documents:
+                text_content = await asyncio.to_thread(extract_text_from_file, doc.name, doc.type, doc.content)
+                documents.append((doc.name, text_content))
+                docs_context += f"\n\n--- FILE: {doc.name} ---\n{text_content}\n-----------------------\n"
+
+    # 2. INJECT INSTRUCTIONS
+    with trace.span("instructions"):
+        user_instruction = await asyncio.to_thread(get_instruction, request.chat_id)
+    
+    # AGENT INJECTION
+    with trace.span("agent"):
+        agent = await asyncio.to_thread(get_agent, request.agent_id) if request.agent_id else None
+
+    combined_system_prompt = build_system_prompt(agent, user_instruction)
 
-    combined_system_prompt = f"{FORMATTING_INSTRUCTION}\n\n{agent_instruction}\n\n{user_instruction if user_instruction else ''}"
+    # TOOLS the agent declared (RunPod / Ollama streams are sent without them)
+    tools = get_tools(agent.tools) if agent and request.provider_id != "runpod" else []
+    if len(docs_context) > DOCUMENT_INLINE_CHARS and any(t.name == "lookup_document" for t in tools):
+        # Large attachments stay out of the prompt; the model looks up the passages it needs
+        names = ", ".join(name for name, _ in documents)
+        docs_context = f"\n(Attached: {names}. Too long to include here; use the lookup_document tool to read the relevant parts.)"
 
      # 3. CONSTRUCT MESSAGES
-    final_messages = [m.dict() for m in request.messages]
+    # Long chats send their stored summary + the recent turns instead of the full history
+    with trace.span("summary"):
+        summary = await asyncio.to_thread(load_summary, request.chat_id)
+    summary_text, final_messages = compaction.apply_summary([m.dict() for m in request.messages], summary)
+    if summary_text:
+        combined_system_prompt += compaction.summary_block(summary_text)
     
     # If we extracted text from docs, append it to the latest user prompt
     if docs_context and final_messages:
@@ -255,103 +455,182 @@ async def process_chat(request):
     key = keys[0] if keys else ""
     url = config.get("url", "")
     pid = request.provider_id
-    images = request.images if request.images else []
-    
+    # Images are resized/re-encoded for the target provider (cached by content hash)
+    if request.images:
+        with trace.span("images"):
+            images = await prepare_images(request.images, pid)
+    else:
+        images = []
+
+    # 5. RESPONSE CACHE (opt-in per request or per agent)
+    cache_key = None
+    if request.use_cache or (agent and agent.cache_responses):
+        with trace.span("cache_lookup"):
+            cache_key = make_cache_key(pid, request.model_id, final_messages, images)
+            cached = await response_cache.get(cache_key)
+        if cached:
+            for piece in split_for_replay(cached["content"]):
+                yield {"chunk": piece}
+                await asyncio.sleep(0)
+            yield {"cached": True}
+            if cached["usage"]:
+                yield {"usage": cached["usage"]}
+            record_turn(trace, pid, request.model_id, "cached", cached["usage"])
+            await _record_usage(request, cached["usage"], cached=True)
+            history = await _save_turn(request, cached["content"], {**cached["usage"], "cached": True}, trace)
+            compaction.schedule(request, history, summary)
+            return
+
     answer_text = ""
     usage_data = {}
-    
-    try:
-        stream_generator = None
-        if pid == "runpod":
-             stream_generator = send_to_runpod(url, request.model_id, final_messages, stream=True)
+    tool_log = []
+    declarations = tool_declarations(pid, tools)
+    tool_context = ToolContext(request.chat_id, request.agent_id, documents)
+    dispatched_at = None
 
-        elif pid == "openai":
-            stream_generator = send_to_openai_compatible(key, request.model_id, final_messages, "https://api.openai.com/v1/chat/completions", images, stream=True)
+    try:
+        # One round per model response; a response asking for tools is followed by another round
+        # with the results, until the model answers in text (or MAX_TOOL_ROUNDS is reached)
+        for round_no in range(1, MAX_TOOL_ROUNDS + 1):
+            stream_generator = None
+            if pid == "runpod":
+                 stream_generator = send_to_runpod(url, request.model_id, final_messages, stream=True)
 
-        elif pid == "grok":
-            stream_generator = send_to_openai_compatible(key, request.model_id, final_messages, "https://api.x.ai/v1/chat/completions", images, stream=True)
+            elif pid in OPENAI_COMPATIBLE_URLS:
+                stream_generator = send_to_openai_compatible(key, request.model_id, final_messages, OPENAI_COMPATIBLE_URLS[pid], images, stream=True, tools=declarations)
 
-        elif pid == "gemini":
-            stream_generator = send_to_gemini(key, request.model_id, final_messages, images, stream=True)
+            elif pid == "gemini":
+                stream_generator = send_to_gemini(key, request.model_id, final_messages, images, stream=True, tools=declarations)
 
-        else:
-            # Fallback for non-streaming providers or unimplemented ones
-            # For now we just return error for unimplemented streaming
-            yield json.dumps({"error": f"Provider '{pid}' streaming not implemented yet."})
-            return
+            elif pid == "anthropic":
+                stream_generator = send_to_anthropic(key, request.model_id, final_messages, images, stream=True, tools=declarations)
 
-        async for chunk in stream_generator:
-            # Parse chunk based on provider (OpenAI/Ollama format is usually "data: { ... }")
-            if isinstance(chunk, str) and chunk.startswith("data: "):
-                if "[DONE]" in chunk:
+            else:
+                # Fallback for non-streaming providers or unimplemented ones
+                # For now we just return error for unimplemented streaming
+                yield {"error": f"Provider '{pid}' streaming not implemented yet."}
+                return
+
+            if dispatched_at is None:
+                dispatched_at = trace.elapsed()
+            round_text = ""
+            round_usage = {}
+            accumulator = ToolCallAccumulator()
+            async for chunk in stream_generator:
+                trace.mark("first_byte")
+                # Parse chunk based on provider:
+                # OpenAI / Gemini / Anthropic send SSE ("data: { ... }"), Ollama / RunPod send bare NDJSON lines
+                if not isinstance(chunk, str):
+                    continue
+                if chunk.startswith("data: "):
+                    payload = chunk[6:]
+                elif chunk.startswith("{"):
+                    payload = chunk
+                else:
+                    # SSE "event:" lines and keep-alive comments carry nothing we need
+                    continue
+                if payload.strip() == "[DONE]":
                     break
                 try:
-                    data = json.loads(chunk[6:])
-                    delta = ""
-                    
-                    # OpenAI / Grok
-                    if "choices" in data:
-                        delta = data["choices"][0]["delta"].get("content", "")
-                    
-                    # Ollama / RunPod
-                    elif "message" in data:
-                         delta = data["message"].get("content", "")
-                    
-                    # Gemini (SSE format)
-                    # data: {"candidates": [{"content": {"parts": [{"text": "..."}]}}]}
-                    elif "candidates" in data:
-                        parts = data["candidates"][0].get("content", {}).get("parts", [])
-                        if parts:
-                            delta = parts[0].get("text", "")
-                    
-                    if delta:
-                        answer_text += delta
-                        yield json.dumps({"chunk": delta}) + "\n"
-
-                    # Extract Usage if present
-                    if "usage" in data:
-                        # OpenAI / Grok usage format
-                        u = data["usage"]
-                        usage_data = {
-                            "prompt_tokens": u.get("prompt_tokens", 0),
-                            "completion_tokens": u.get("completion_tokens", 0),
-                            "total_tokens": u.get("total_tokens", 0)
-                        }
-                    
-                    if "usageMetadata" in data:
-                         # Gemini usage format
-                         u = data["usageMetadata"]
-                         usage_data = {
-                            "prompt_tokens": u.get("promptTokenCount", 0),
-                            "completion_tokens": u.get("candidatesTokenCount", 0),
-                            "total_tokens": u.get("totalTokenCount", 0)
-                         }
-
-                except:
-                    pass
-            elif isinstance(chunk, httpx.Response):
-                 # Fallback if we accidentally got a full response
-                 pass
-            elif isinstance(chunk, str):
-                 # Sometimes we might get raw bytes decoded
-                 pass
+                    data = json.loads(payload)
+                except json.JSONDecodeError as e:
+                    record_error(pid, "parse", e)
+                    continue
+                try:
+                    if declarations:
+                        accumulator.feed(data)
+                    delta, round_usage = parse_stream_event(data, round_usage)
+                except (AttributeError, IndexError, KeyError, TypeError, ValueError) as e:
+                    # An unexpected event shape costs that event, not the whole answer
+                    record_error(pid, "parse", e)
+                    continue
+
+                if delta:
+                    trace.mark("ttft")
+                    round_text += delta
+                    yield {"chunk": delta}
+
+            answer_text += round_text
+            for field, tokens in round_usage.items():
+                usage_data[field] = usage_data.get(field, 0) + tokens
+
+            calls = accumulator.calls()
+            if not calls:
+                break
+            if round_no == MAX_TOOL_ROUNDS:
+                print(f"Chat {request.chat_id}: stopped after {MAX_TOOL_ROUNDS} tool rounds")
+                tool_log.append({"round": round_no, "stopped": "tool round limit reached"})
+                break
+
+            # 6. TOOLS: run this round's calls concurrently, then hand the results back
+            yield {"tool_calls": [{"id": c["id"], "name": c["name"], "arguments": c["arguments"]} for c in calls]}
+            with trace.span("tools"):
+                results = await run_tool_calls(calls, tool_context)
+            yield {"tool_results": [{field: r[field] for field in ("id", "name", "ok", "ms")} for r in results]}
+            for call, result in zip(calls, results):
+                tool_log.append({"round": round_no, "name": call["name"], "arguments": call["arguments"],
+                                 "ok": result["ok"], "ms": result["ms"]})
+            final_messages = final_messages + tool_round_messages(pid, round_text, calls, results)
+            if round_text:
+                answer_text += "\n\n"
+                yield {"chunk": "\n\n"}
 
     except Exception as e:
-        yield json.dumps({"error": f"System Error: {str(e)}"})
+        record_error(pid, "provider", e)
+        record_turn(trace, pid, request.model_id, "error", usage_data)
+        yield {"error": f"System Error: {str(e)}"}
         return
 
+    if "ttft" in trace.marks:
+        trace.record("provider_ttft", trace.marks["ttft"] - dispatched_at)
+        trace.record("streaming", trace.elapsed() - trace.marks["ttft"] - trace.stages.get("tools", 0))
+    record_turn(trace, pid, request.model_id, "ok", usage_data)
+
     # Send final usage data to frontend
     if usage_data:
-        yield json.dumps({"usage": usage_data}) + "\n"
+        yield {"usage": usage_data}
+
+    # Answers built from tool results depend on data that changes, so they are not cached
+    if cache_key and answer_text and not tool_log:
+        await response_cache.put(cache_key, answer_text, usage_data)
 
-    # 4. SAVE SESSION WITH METADATA
+    await _record_usage(request, usage_data)
+    history = await _save_turn(request, answer_text, {**usage_data, "tools": tool_log} if tool_log else usage_data, trace)
+    compaction.schedule(request, history, summary)
+
+async def _record_usage(request, usage: dict, cached: bool = False):
+    try:
+        await asyncio.to_thread(usage_ledger.record, request.provider_id, request.model_id, usage,
+                                request.chat_id, request.agent_id, cached)
+    except OSError as e:
+        print(f"Error recording usage: {e}")
+
+async def _save_turn(request, answer_text: str, meta: dict, trace=None):
+    # SAVE SESSION WITH METADATA
     new_history = [m.dict() for m in request.messages]
     
-    # We save the usage stats INSIDE the assistant message
+    # We save the usage stats (and stage timings) INSIDE the assistant message
+    meta = {
+        **meta,
+        "provider": request.provider_id,
+        "model": request.model_id,
+        "agent_id": request.agent_id,
+        "created_at": time.time(),
+    }
+    trace_meta = trace.to_meta() if trace else None
+    if trace_meta:
+        meta["trace"] = trace_meta
     new_history.append({
         "role": "assistant", 
         "content": answer_text,
-        "meta": usage_data 
+        "meta": meta
     })
     
-    save_session(request.chat_id, new_history)
\ No newline at end of file
+    with trace.span("save") if trace else nullcontext():
+        await asyncio.to_thread(save_session, request.chat_id, new_history)
+    return new_history
+
+async def process_chat(request, ticket=None):
+    """NDJSON transport: one JSON event per line."""
+    async for event in stream_chat_events(request, ticket):
+        yield json.dumps(event) + "\n"
@@ -0,0 +1,98 @@
+"""
+Provider formats for tool calling: how tools are declared, how streamed calls are put back
+together, and how results are handed back to the model for the next round.
+
+OpenAI-compatible providers stream the arguments as JSON fragments per call index, Anthropic
+streams them as input_json_delta events of a tool_use block, and Gemini sends each
+functionCall whole.
+"""
+import json
+
+def tool_declarations(pid: str, tools: list):
+    """The `tools` payload field for the provider, or None when the turn has no tools."""
+    if not tools:
+        return None
+    if pid == "anthropic":
+        return [{"name": t.name, "description": t.description, "input_schema": t.parameters} for t in tools]
+    if pid == "gemini":
+        return [{"functionDeclarations": [t.spec() for t in tools]}]
+    return [{"type": "function", "function": t.spec()} for t in tools]
+
+class ToolCallAccumulator:
+    """Collects the tool calls of one streamed response from its parsed events."""
+    def __init__(self):
+        self._calls = {}  # stream index -> {"id", "name", "arguments" (JSON text or dict), "part"}
+
+    def feed(self, data: dict):
+        # OpenAI / Grok: fragments keyed by "index"; id and name only come with the first one
+        if data.get("choices"):
+            for fragment in data["choices"][0].get("delta", {}).get("tool_calls") or []:
+                call = self._calls.setdefault(fragment.get("index", 0), {"id": None, "name": "", "arguments": ""})
+                function = fragment.get("function") or {}
+                call["id"] = fragment.get("id") or call["id"]
+                call["name"] += function.get("name") or ""
+                call["arguments"] += function.get("arguments") or ""
+
+        # Anthropic: a tool_use content block, then its input as partial JSON
+        elif data.get("type") == "content_block_start":
+            block = data.get("content_block", {})
+            if block.get("type") == "tool_use":
+                self._calls[data.get("index", 0)] = {"id": block.get("id"), "name": block.get("name", ""), "arguments": ""}
+        elif data.get("type") == "content_block_delta":
+            delta = data.get("delta", {})
+            if delta.get("type") == "input_json_delta" and data.get("index", 0) in self._calls:
+                self._calls[data.get("index", 0)]["arguments"] += delta.get("partial_json", "")
+
+        # Gemini: complete calls; the part is kept as sent (it may carry a thought signature)
+        elif data.get("candidates"):
+            for part in data["candidates"][0].get("content", {}).get("parts", []):
+                if "functionCall" in part:
+                    index = len(self._calls)
+                    self._calls[index] = {
+                        "id": f"call_{index}",
+                        "name": part["functionCall"].get("name", ""),
+                        "arguments": part["functionCall"].get("args") or {},
+                        "part": part,
+                    }
+
+    def calls(self) -> list:
+        """[{"id", "name", "arguments", "raw", "part"}]; arguments that are not valid JSON stay a string."""
+        calls = []
+        for index in sorted(self._calls):
+            call = self._calls[index]
+            raw = call["arguments"]
+            arguments = raw
+            if isinstance(raw, str):
+                try:
+                    arguments = json.loads(raw) if raw.strip() else {}
+                except json.JSONDecodeError:
+                    pass
+            calls.append({"id": call["id"] or f"call_{index}", "name": call["name"], "arguments": arguments,
+                          "raw": raw, "part": call.get("part")})
+        return calls
+
+def tool_round_messages(pid: str, text: str, calls: list, results: list) -> list:
+    """The assistant's tool request and the results, as the provider expects them in the history."""
+    if pid == "anthropic":
+        content = [{"type": "text", "text": text}] if text else []
+        content += [{"type": "tool_use", "id": c["id"], "name": c["name"],
+                     "input": c["arguments"] if isinstance(c["arguments"], dict) else {}} for c in calls]
+        return [
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": [{"type": "tool_result", "tool_use_id": r["id"], "content": r["content"],
+                                          "is_error": not r["ok"]} for r in results]},
+        ]
+    if pid == "gemini":
+        parts = [{"text": text}] if text else []
+        parts += [c["part"] or {"functionCall": {"name": c["name"], "args": c["arguments"]}} for c in calls]
+        return [
+            {"role": "model", "parts": parts},
+            {"role": "user", "parts": [{"functionResponse": {"name": r["name"], "response": {"content": r["content"]}}}
+                                       for r in results]},
+        ]
+    return [
+        {"role": "assistant", "content": text or None,
+         "tool_calls": [{"id": c["id"], "type": "function", "function": {"name": c["name"], "arguments": c["raw"]}}
+                        for c in calls]},
+        *({"role": "tool", "tool_call_id": r["id"], "content": r["content"]} for r in results),
+    ]
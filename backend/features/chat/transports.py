@@ -0,0 +1,221 @@
+import asyncio
+import json
+import time
+from collections import deque
+from uuid import uuid4
+from fastapi import WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from .models import ChatRequest
+from .admission import admission
+from . import service
+
+# --- SERVER-SENT EVENTS ---
+# A generation runs as its own task and writes into a replay buffer, so a client that
+# drops the connection can reconnect with Last-Event-ID and pick up where it left off.
+
+SSE_BUFFER_SIZE = 5000        # events kept per stream for replay
+SSE_RETENTION_SECONDS = 300   # how long a finished stream can still be resumed
+
+_streams = {}
+
+class StreamGap(Exception):
+    """The events after a client's position were already dropped from the replay buffer."""
+    def __init__(self, missed: int):
+        super().__init__(f"{missed} events are no longer buffered")
+        self.missed = missed
+
+class ChatStream:
+    def __init__(self, stream_id: str):
+        self.id = stream_id
+        self.events = deque(maxlen=SSE_BUFFER_SIZE)  # (seq, event)
+        self.seq = 0
+        self.done = False
+        self.finished_at = None
+        self.task = None
+        self._changed = asyncio.Condition()
+
+    async def run(self, request: ChatRequest, ticket=None):
+        try:
+            async for event in service.stream_chat_events(request, ticket):
+                await self._append(event)
+        except asyncio.CancelledError:
+            await self._append({"cancelled": True})
+        except Exception as e:
+            await self._append({"error": f"System Error: {str(e)}"})
+        finally:
+            self.done = True
+            self.finished_at = time.monotonic()
+            async with self._changed:
+                self._changed.notify_all()
+
+    async def _append(self, event: dict):
+        async with self._changed:
+            self.seq += 1
+            self.events.append((self.seq, event))
+            self._changed.notify_all()
+
+    def missed_since(self, last_seq: int) -> int:
+        """How many events after last_seq can no longer be replayed."""
+        first = self.events[0][0] if self.events else self.seq + 1
+        return max(0, first - last_seq - 1)
+
+    async def follow(self, last_seq: int = 0):
+        """
+        Yields (seq, event) after last_seq, waiting for new events until the stream ends.
+        Raises StreamGap when the reader fell behind the buffer, rather than skip part of the answer.
+        """
+        while True:
+            async with self._changed:
+                missed = self.missed_since(last_seq)
+                if missed:
+                    raise StreamGap(missed)
+                pending = [(s, e) for s, e in self.events if s > last_seq]
+                if not pending:
+                    if self.done:
+                        return
+                    await self._changed.wait()
+                    continue
+            for seq, event in pending:
+                yield seq, event
+                last_seq = seq
+
+def _prune_streams():
+    now = time.monotonic()
+    expired = [sid for sid, s in _streams.items() if s.done and now - s.finished_at > SSE_RETENTION_SECONDS]
+    for sid in expired:
+        del _streams[sid]
+
+def start_stream(request: ChatRequest, ticket=None) -> ChatStream:
+    _prune_streams()
+    stream = ChatStream(uuid4().hex)
+    stream.task = asyncio.create_task(stream.run(request, ticket))
+    if ticket is not None:
+        # A task cancelled before its first step never enters run(), so the slot is freed here too
+        stream.task.add_done_callback(lambda _: admission.release(ticket))
+    _streams[stream.id] = stream
+    return stream
+
+def get_stream(stream_id: str):
+    _prune_streams()
+    return _streams.get(stream_id)
+
+def cancel_stream(stream_id: str) -> bool:
+    stream = _streams.get(stream_id)
+    if not stream or stream.done:
+        return False
+    stream.task.cancel()
+    return True
+
+def parse_last_event_id(value) -> int:
+    # Event ids look like "<stream_id>:<seq>"; a bare number is accepted too
+    if not value:
+        return 0
+    try:
+        return int(str(value).rsplit(":", 1)[-1])
+    except ValueError:
+        return 0
+
+async def sse_events(stream: ChatStream, last_seq: int = 0):
+    if last_seq == 0:
+        yield f"event: stream\ndata: {json.dumps({'stream_id': stream.id})}\n\n"
+    try:
+        async for seq, event in stream.follow(last_seq):
+            yield f"id: {stream.id}:{seq}\ndata: {json.dumps(event)}\n\n"
+    except StreamGap as e:
+        # No "done": what the client has is not the whole answer
+        yield f"event: gap\ndata: {json.dumps({'missed': e.missed})}\n\n"
+        return
+    yield "event: done\ndata: {}\n\n"
+
+# --- WEBSOCKET ---
+# One connection carries many concurrent generations. Client messages:
+#   {"type": "chat", "id": "<generation id>", "request": {...ChatRequest}}
+#   {"type": "cancel", "id": "<generation id>"}
+# Every server message carries the generation "id" next to the usual event fields,
+# followed by {"id": ..., "done": true} or {"id": ..., "cancelled": true}.
+
+WS_MAX_ACTIVE_GENERATIONS = 4
+WS_SEND_QUEUE_SIZE = 64  # generations pause (and stop reading from the provider) when the client falls behind
+
+class ChatSocket:
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.outbox = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        self.generations = {}
+
+    async def serve(self):
+        writer = asyncio.create_task(self._write_loop())
+        try:
+            while True:
+                raw = await self.websocket.receive_text()
+                try:
+                    message = json.loads(raw)
+                except json.JSONDecodeError:
+                    await self.outbox.put({"error": "Invalid JSON message."})
+                    continue
+                if not isinstance(message, dict):
+                    await self.outbox.put({"error": "Messages must be JSON objects."})
+                    continue
+                await self._handle(message)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for task in self.generations.values():
+                task.cancel()
+            writer.cancel()
+
+    async def _handle(self, message: dict):
+        gen_id = message.get("id")
+        kind = message.get("type")
+
+        if not isinstance(gen_id, str) or not gen_id:
+            await self.outbox.put({"id": None, "error": "Each message needs a non-empty string 'id'."})
+            return
+
+        if kind == "cancel":
+            task = self.generations.get(gen_id)
+            if task:
+                task.cancel()
+            return
+
+        if kind != "chat":
+            await self.outbox.put({"id": gen_id, "error": f"Unknown message type '{kind}'."})
+            return
+        if gen_id in self.generations:
+            await self.outbox.put({"id": gen_id, "error": "Each generation needs a unique 'id'."})
+            return
+        if len(self.generations) >= WS_MAX_ACTIVE_GENERATIONS:
+            await self.outbox.put({"id": gen_id, "error": "Too many concurrent generations on this connection."})
+            return
+        fields = message.get("request", {})
+        if not isinstance(fields, dict):
+            await self.outbox.put({"id": gen_id, "error": "'request' must be a JSON object."})
+            return
+        try:
+            request = ChatRequest(**fields)
+        except ValidationError as e:
+            await self.outbox.put({"id": gen_id, "error": f"Invalid request: {e.errors()}"})
+            return
+
+        self.generations[gen_id] = asyncio.create_task(self._generate(gen_id, request))
+
+    async def _generate(self, gen_id: str, request: ChatRequest):
+        try:
+            async for event in service.stream_chat_events(request):
+                await self.outbox.put({"id": gen_id, **event})
+            await self.outbox.put({"id": gen_id, "done": True})
+        except asyncio.CancelledError:
+            # put_nowait: the connection may already be gone, never block a cancelled task
+            try:
+                self.outbox.put_nowait({"id": gen_id, "cancelled": True})
+            except asyncio.QueueFull:
+                pass
+        except Exception as e:
+            await self.outbox.put({"id": gen_id, "error": f"System Error: {str(e)}"})
+        finally:
+            self.generations.pop(gen_id, None)
+
+    async def _write_loop(self):
+        while True:
+            message = await self.outbox.get()
+            await self.websocket.send_text(json.dumps(message))
@@ -0,0 +1,147 @@
+import asyncio
+import base64
+import hashlib
+import io
+from collections import OrderedDict
+
+_pillow = None  # (Image, ImageOps) once imported, False when Pillow is not installed
+
+# Longest side (px) each provider actually uses; anything larger is downsampled on their side
+# anyway, so we only pay for the extra upload and tokens.
+PROVIDER_MAX_DIMENSION = {
+    "openai": 2048,
+    "grok": 2048,
+    "anthropic": 1568,
+    "gemini": 3072,
+}
+DEFAULT_MAX_DIMENSION = 2048
+
+JPEG_QUALITY = 85
+PNG_JPEG_FALLBACK_BYTES = 1_500_000  # opaque PNGs bigger than this after resize are sent as JPEG
+SUPPORTED_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
+CACHE_SIZE = 128
+
+_cache = OrderedDict()
+
+def _load_pillow():
+    """Imports Pillow with the first image instead of at startup. None when it is not installed."""
+    global _pillow
+    if _pillow is None:
+        try:
+            from PIL import Image, ImageOps
+            _pillow = (Image, ImageOps)
+        except ImportError:  # Optional: without Pillow images are only sniffed, never resized
+            _pillow = False
+    return _pillow or None
+
+def sniff_image_type(data: bytes) -> str:
+    """Detects the real image format from its magic bytes (the browser label is not trusted)."""
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data.startswith(b"BM"):
+        return "image/bmp"
+    if data[4:12] in (b"ftypheic", b"ftypheix", b"ftypmif1"):
+        return "image/heic"
+    return "application/octet-stream"
+
+def _encode(img, fmt: str, **options) -> bytes:
+    out = io.BytesIO()
+    img.save(out, fmt, **options)
+    return out.getvalue()
+
+def process_image(data: bytes, max_dimension: int):
+    """
+    Downscales and re-encodes one image. Returns (mime_type, bytes).
+    The original bytes are kept whenever processing would not make them smaller or more compatible.
+    """
+    mime = sniff_image_type(data)
+    pillow = _load_pillow()
+    if pillow is None:
+        return mime, data
+    Image, ImageOps = pillow
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if getattr(img, "is_animated", False):
+                return mime, data
+
+            too_large = max(img.size) > max_dimension
+            unsupported = mime not in SUPPORTED_TYPES
+            if not too_large and not unsupported:
+                return mime, data
+
+            img = ImageOps.exif_transpose(img)  # phone photos are often stored rotated
+            img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+            has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+            if mime == "image/png" or has_alpha:
+                # Keep screenshots lossless so small text stays readable
+                encoded = _encode(img, "PNG", optimize=True)
+                new_mime = "image/png"
+                if not has_alpha and len(encoded) > PNG_JPEG_FALLBACK_BYTES:
+                    encoded = _encode(img.convert("RGB"), "JPEG", quality=JPEG_QUALITY, optimize=True)
+                    new_mime = "image/jpeg"
+            else:
+                encoded = _encode(img.convert("RGB"), "JPEG", quality=JPEG_QUALITY, optimize=True)
+                new_mime = "image/jpeg"
+
+            if not unsupported and len(encoded) >= len(data):
+                return mime, data
+            return new_mime, encoded
+    except Exception as e:
+        print(f"Error processing image: {e}")
+        return mime, data
+
+def _process_base64(b64: str, max_dimension: int):
+    mime, data = process_image(base64.b64decode(b64), max_dimension)
+    return mime, base64.b64encode(data).decode("ascii")
+
+def _strip_data_url(b64: str) -> str:
+    # Accept "data:image/png;base64,...." as well as bare base64
+    if b64.startswith("data:") and "," in b64:
+        return b64.split(",", 1)[1]
+    return b64
+
+async def _prepare_one(b64: str, digest: str, max_dimension: int):
+    key = (digest, max_dimension)
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    # Decoding and resizing are CPU-bound, keep them off the event loop
+    try:
+        mime, data = await asyncio.to_thread(_process_base64, b64, max_dimension)
+    except ValueError as e:  # binascii.Error: not base64
+        print(f"Skipping image that is not valid base64: {e}")
+        return None
+    result = {"mime_type": mime, "data": data, "sha256": digest}
+
+    _cache[key] = result
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return result
+
+async def prepare_images(images: list, provider_id: str) -> list:
+    """
+    Turns the raw base64 images of a request into [{"mime_type", "data", "sha256"}] sized for the provider.
+    Duplicate images are sent once; results are cached by content hash so resending the same
+    image on later turns costs nothing. Images that are not base64 are skipped.
+    """
+    max_dimension = PROVIDER_MAX_DIMENSION.get(provider_id, DEFAULT_MAX_DIMENSION)
+    unique = OrderedDict()
+    for img in images:
+        b64 = _strip_data_url(img)
+        try:
+            digest = hashlib.sha256(b64.encode("ascii")).hexdigest()
+        except UnicodeEncodeError:
+            print("Skipping image that is not valid base64: non-ASCII characters")
+            continue
+        unique.setdefault(digest, b64)
+    prepared = await asyncio.gather(*(_prepare_one(b64, digest, max_dimension) for digest, b64 in unique.items()))
+    return [image for image in prepared if image is not None]
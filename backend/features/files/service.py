@@ -1,6 +1,5 @@
 import base64
 import io
-from pypdf import PdfReader
 
 def extract_text_from_file(file_name: str, file_type: str, base64_content: str) -> str:
     """
@@ -15,6 +14,8 @@ def extract_text_from_file(file_name: str, file_type: str, base64_content: str)
 
         # 1. PDF Handling
         if "pdf" in file_type or file_name.endswith(".pdf"):
+            # Imported on first use: pypdf is slow to import and most chats never attach a PDF
+            from pypdf import PdfReader
             reader = PdfReader(file_stream)
             for page in reader.pages:
                 text = page.extract_text()
@@ -1,23 +1,18 @@
-import json
-import os
+from config import data_path
+from features.storage.service import storage
 
-DB_FILE = "chat_instructions.json"
+DB_FILE = data_path("chat_instructions.json")
 
 def save_instruction(chat_id: str, content: str):
-    data = _load_db()
-    data[chat_id] = content
-    with open(DB_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    def apply(data):
+        data[chat_id] = content
+        return data
+    storage.update(DB_FILE, apply, default={}, indent=4)
 
 def get_instruction(chat_id: str) -> str:
     data = _load_db()
     return data.get(chat_id, "")
 
 def _load_db():
-    if not os.path.exists(DB_FILE):
-        return {}
-    try:
-        with open(DB_FILE, "r") as f:
-            return json.load(f)
-    except:
-        return {}
\ No newline at end of file
+    data = storage.read_cached(DB_FILE, default={})
+    return data if isinstance(data, dict) else {}
\ No newline at end of file
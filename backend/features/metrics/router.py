@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from features.chat.admission import admission
+from features.cache.service import response_cache
+from .service import registry
+
+router = APIRouter()
+
+def _gauge(name: str, help_text: str, value, kind: str = "gauge") -> list:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+
+@router.get("/", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus text exposition format."""
+    stats = admission.stats()
+    cache = response_cache.stats()
+    lines = []
+    lines += _gauge("onys_admission_active", "Chat turns currently holding a slot", stats["active"])
+    lines += _gauge("onys_admission_queued", "Chat turns waiting for a slot", stats["queued"])
+    lines += _gauge("onys_admission_rejected_total", "Chat turns rejected with 429", stats["rejected"], "counter")
+    lines += _gauge("onys_admission_timed_out_total", "Chat turns that gave up waiting", stats["timed_out"], "counter")
+    lines += _gauge("onys_admission_wait_p95_ms", "95th percentile queue wait of recent turns", stats["wait_ms"]["p95"])
+    lines += _gauge("onys_response_cache_hits_total", "Response cache hits", cache["hits"], "counter")
+    lines += _gauge("onys_response_cache_misses_total", "Response cache misses", cache["misses"], "counter")
+    return registry.render() + "\n".join(lines) + "\n"
@@ -0,0 +1,206 @@
+import os
+import time
+from contextlib import contextmanager
+
+# Set ONYS_METRICS=0 to turn tracing and the HTTP middleware off entirely
+METRICS_ENABLED = os.environ.get("ONYS_METRICS", "1") != "0"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 400)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in self.series.items():
+            labels = _format_labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                bucket_labels = _format_labels(self.labels, label_values, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            inf_labels = _format_labels(self.labels, label_values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {series[-1]}")
+            lines.append(f"{self.name}_sum{labels} {round(series[-2], 6)}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name: str, help_text: str, labels: tuple = ()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+chat_turns = registry.counter("onys_chat_turns_total", "Chat turns by outcome (ok, error, cached)", ("provider", "model", "outcome"))
+chat_errors = registry.counter("onys_chat_errors_total", "Chat pipeline errors by stage and exception type", ("provider", "stage", "error"))
+chat_tokens = registry.counter("onys_chat_tokens_total", "Tokens reported by providers", ("provider", "model", "kind"))
+chat_stage_seconds = registry.histogram("onys_chat_stage_seconds", "Time spent in each chat pipeline stage", ("stage",))
+chat_ttft_seconds = registry.histogram("onys_chat_ttft_seconds", "Time to first token", ("provider", "model"))
+chat_turn_seconds = registry.histogram("onys_chat_turn_seconds", "Full chat turn duration", ("provider", "model"))
+chat_token_rate = registry.histogram("onys_chat_output_tokens_per_second", "Completion tokens per second while streaming", ("provider", "model"), RATE_BUCKETS)
+http_requests = registry.counter("onys_http_requests_total", "HTTP requests", ("method", "route", "status"))
+http_seconds = registry.histogram("onys_http_request_seconds", "Time until the response starts", ("method", "route"))
+
+class Trace:
+    """
+    Stage timings of one chat turn. Spans are recorded in order and end up in the assistant
+    message meta as {"trace": {"total_ms": ..., "stages": {...}}}.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.marks = {}
+
+    @contextmanager
+    def span(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def record(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0) + seconds
+        chat_stage_seconds.observe(seconds, stage)
+
+    def mark(self, name: str):
+        """Records the first time `name` happens, relative to the trace start."""
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.started
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def to_meta(self) -> dict:
+        return {
+            "total_ms": round(self.elapsed() * 1000, 1),
+            "stages": {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()},
+            **{f"{name}_ms": round(seconds * 1000, 1) for name, seconds in self.marks.items()},
+        }
+
+class NullTrace:
+    """Stand-in used when metrics are disabled: every call is a no-op."""
+    @contextmanager
+    def span(self, stage: str):
+        yield
+
+    def record(self, stage: str, seconds: float):
+        pass
+
+    def mark(self, name: str):
+        pass
+
+    def elapsed(self) -> float:
+        return 0.0
+
+    def to_meta(self):
+        return None
+
+_null_trace = NullTrace()
+
+def start_trace():
+    return Trace() if METRICS_ENABLED else _null_trace
+
+def record_turn(trace, provider: str, model: str, outcome: str, usage: dict):
+    if not METRICS_ENABLED:
+        return
+    chat_turns.inc(provider, model, outcome)
+    if outcome == "cached":
+        return
+    chat_turn_seconds.observe(trace.elapsed(), provider, model)
+    if "ttft" in trace.marks:
+        chat_ttft_seconds.observe(trace.marks["ttft"], provider, model)
+    if usage:
+        chat_tokens.inc(provider, model, "prompt", amount=usage.get("prompt_tokens", 0))
+        chat_tokens.inc(provider, model, "completion", amount=usage.get("completion_tokens", 0))
+        streaming = trace.stages.get("streaming", 0)
+        if streaming > 0 and usage.get("completion_tokens"):
+            chat_token_rate.observe(usage["completion_tokens"] / streaming, provider, model)
+
+def record_error(provider: str, stage: str, error: Exception):
+    if METRICS_ENABLED:
+        chat_errors.inc(provider, stage, type(error).__name__)
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (no response buffering) timing HTTP requests by route template.
+    Streaming responses are timed until their headers are sent; turn durations come from the chat traces.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                route = scope.get("route")
+                path = getattr(route, "path", "unmatched")
+                http_requests.inc(scope["method"], path, status["code"])
+                http_seconds.observe(time.perf_counter() - started, scope["method"], path)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
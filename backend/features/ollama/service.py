@@ -1,8 +1,17 @@
+import threading
+import time
 import httpx
 
-def get_remote_ollama_models(base_url: str):
+# Model lists change rarely; the provider picker asks for them on every load
+MODELS_TTL_SECONDS = 60
+
+_models_cache = {}  # base url -> (fetched_at, models)
+_models_lock = threading.Lock()
+
+def get_remote_ollama_models(base_url: str, max_age: float = MODELS_TTL_SECONDS):
     """
     Connects to the RunPod/Ollama URL and fetches available models.
+    Successful answers are cached for `max_age` seconds.
     """
     if not base_url:
         return ["error-no-url"]
@@ -11,6 +20,11 @@ def get_remote_ollama_models(base_url: str):
     clean_url = base_url.rstrip("/")
     api_url = f"{clean_url}/api/tags"
 
+    with _models_lock:
+        cached = _models_cache.get(clean_url)
+    if cached and time.monotonic() - cached[0] < max_age:
+        return list(cached[1])
+
     try:
         # We use a timeout so it doesn't hang forever if RunPod is off
         response = httpx.get(api_url, timeout=5.0)
@@ -18,7 +32,10 @@ def get_remote_ollama_models(base_url: str):
         if response.status_code == 200:
             data = response.json()
             # Ollama returns format: { "models": [ { "name": "llama3" }, ... ] }
-            return [m["name"] for m in data.get("models", [])]
+            models = [m["name"] for m in data.get("models", [])]
+            with _models_lock:
+                _models_cache[clean_url] = (time.monotonic(), models)
+            return list(models)
             
         return ["error-runpod-unreachable"]
         
@@ -1,11 +1,9 @@
 # backend/features/providers/router.py
-import json
-import os
 from fastapi import APIRouter
 from features.ollama.service import get_remote_ollama_models
+from features.settings.service import load_settings
 
 router = APIRouter()
-SETTINGS_FILE = "user_settings.json"
 
 # Known models map (Static registry)
 KNOWN_MODELS = {
@@ -17,11 +15,7 @@ KNOWN_MODELS = {
 
 @router.get("/active")
 def get_active_providers():
-    if not os.path.exists(SETTINGS_FILE):
-        return []
-
-    with open(SETTINGS_FILE, "r") as f:
-        data = json.load(f)
+    data = load_settings()
 
     active_list = []
     
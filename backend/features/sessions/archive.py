@@ -0,0 +1,472 @@
+"""
+Archive tier for cold chat sessions.
+
+Sessions not saved for ARCHIVE_AFTER_DAYS are moved out of data/sessions into append-only pack
+files under data/archive. Each session is one independently compressed member holding one JSON
+line ({"id", "messages", "summary", "mtime"}), and index.json maps chat ids to (pack, offset,
+length), so opening an archived chat reads and decompresses only its own bytes. Concatenated
+gzip (or zstd) members are still one valid stream: a pack reads with zcat / zstdcat and has the
+same layout as an export file.
+
+A chat that is saved again moves back to the hot directory; its archived copy becomes dead
+bytes until the pack is rewritten by repack().
+"""
+import asyncio
+import functools
+import gzip
+import io
+import json
+import os
+import time
+import zlib
+from config import DATA_DIR
+from features.storage.service import storage, FSYNC
+
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+# Sessions not saved for this many days are archived (0 turns automatic archiving off)
+ARCHIVE_AFTER_DAYS = float(os.environ.get("ONYS_ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_INTERVAL_SECONDS = 24 * 3600
+# "gzip" (default) or "zstd", which needs the optional zstandard package
+CODEC = os.environ.get("ONYS_ARCHIVE_CODEC", "gzip")
+PACK_MAX_BYTES = int(os.environ.get("ONYS_ARCHIVE_PACK_MB", "64")) * 1024 * 1024
+# Decompressed sessions kept in memory for chats opened again
+CACHE_SIZE = int(os.environ.get("ONYS_ARCHIVE_CACHE_SIZE", "32"))
+BATCH_SIZE = 200
+
+EXTENSIONS = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+# --- Codecs ---
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+def _codec_of(path: str) -> str:
+    return "zstd" if path.endswith(".zst") else "gzip"
+
+def _write_codec() -> str:
+    if CODEC == "zstd" and _zstd() is None:
+        print("ONYS_ARCHIVE_CODEC=zstd needs the zstandard package; archiving with gzip")
+        return "gzip"
+    return CODEC if CODEC in EXTENSIONS else "gzip"
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return _zstd().ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return _zstd().ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+def open_jsonl(path: str, mode: str = "r"):
+    """Text stream over a .jsonl, .jsonl.gz or .jsonl.zst file (mode "r" or "w")."""
+    if path.endswith(".zst"):
+        zstd = _zstd()
+        if zstd is None:
+            raise RuntimeError("reading or writing .zst files needs the zstandard package")
+        if mode == "r":
+            return io.TextIOWrapper(zstd.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True), encoding="utf-8")
+        return io.TextIOWrapper(zstd.ZstdCompressor(level=10).stream_writer(open(path, "wb")), encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+# --- Index ---
+
+def _index_file() -> str:
+    return os.path.join(ARCHIVE_DIR, "index.json")
+
+def _empty_index() -> dict:
+    return {"packs": {}, "sessions": {}, "current": None, "next_pack": 1}
+
+class ArchiveIndexError(Exception):
+    pass
+
+def _index_for_update() -> dict:
+    """The index to modify (call under the index lock). Raises ArchiveIndexError if it is unreadable."""
+    index = storage.read(_index_file(), default=None)
+    if index is None and not storage.exists(_index_file()):
+        return _empty_index()
+    if not isinstance(index, dict) or not isinstance(index.get("sessions"), dict):
+        # Writing a fresh index over it would orphan every archived session
+        raise ArchiveIndexError(f"{_index_file()} is unreadable; recover it with "
+                                "`python -m features.sessions.archive --rebuild-index`")
+    return index
+
+_index_cache = (None, None)  # ((path, version stamp), index)
+
+def _index() -> dict:
+    """Current index, re-read only when the file changed. Shared: callers must not modify it."""
+    global _index_cache
+    path = _index_file()
+    key = (path, storage.version(path))
+    if _index_cache[0] != key:
+        _index_cache = (key, storage.read(path, default=None) or _empty_index())
+    return _index_cache[1]
+
+def _pack_path(pack: str) -> str:
+    return os.path.join(ARCHIVE_DIR, pack)
+
+def _drop_entry(index: dict, chat_id: str):
+    entry = index["sessions"].pop(chat_id, None)
+    if entry and entry["pack"] in index["packs"]:
+        index["packs"][entry["pack"]]["dead"] += entry["length"]
+    return entry
+
+def _new_pack(index: dict, codec: str) -> str:
+    # Pack names are never reused, so cached reads of a removed pack cannot be mistaken for a new one
+    name = f"sessions-{index['next_pack']:04d}{EXTENSIONS[codec]}"
+    index["next_pack"] += 1
+    index["packs"][name] = {"bytes": 0, "dead": 0}
+    return name
+
+def _writable_pack(index: dict, codec: str) -> str:
+    current = index["current"]
+    if current not in index["packs"] or _codec_of(current) != codec or index["packs"][current]["bytes"] >= PACK_MAX_BYTES:
+        current = index["current"] = _new_pack(index, codec)
+    return current
+
+def _store(records: list):
+    """Appends [(chat_id, session, mtime)] to the current pack and indexes them (replacing older copies)."""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    with storage.lock(_index_file()):
+        index = _index_for_update()
+        codec = _write_codec()
+        pack = _writable_pack(index, codec)
+        with open(_pack_path(pack), "ab") as f:
+            f.seek(0, os.SEEK_END)
+            for chat_id, session, mtime in records:
+                line = json.dumps({"id": chat_id, "messages": session["messages"], "summary": session.get("summary"),
+                                   "mtime": mtime}, ensure_ascii=False) + "\n"
+                blob = compress(line.encode("utf-8"), codec)
+                _drop_entry(index, chat_id)
+                index["sessions"][chat_id] = {
+                    "pack": pack,
+                    "offset": f.tell(),
+                    "length": len(blob),
+                    "title": _title(session["messages"]),
+                    "mtime": mtime,
+                }
+                f.write(blob)
+            if FSYNC:
+                f.flush()
+                os.fsync(f.fileno())
+            index["packs"][pack]["bytes"] = f.tell()
+        # The pack is on disk before the index points into it
+        storage.write(_index_file(), index)
+
+def forget(chat_id: str) -> bool:
+    """Removes a session from the archive index; False if it was not archived."""
+    if not is_archived(chat_id):
+        return False
+    with storage.lock(_index_file()):
+        index = _index_for_update()
+        if _drop_entry(index, chat_id) is None:
+            return False
+        storage.write(_index_file(), index)
+    return True
+
+def _title(messages: list) -> str:
+    from .service import session_title
+    return session_title(messages)
+
+# --- Reading ---
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _read_member(path: str, offset: int, length: int) -> str:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        blob = f.read(length)
+    return decompress(blob, _codec_of(path)).decode("utf-8")
+
+def _read_entry(entry: dict, cached: bool = True) -> dict:
+    read = _read_member if cached else _read_member.__wrapped__
+    record = json.loads(read(_pack_path(entry["pack"]), entry["offset"], entry["length"]))
+    return {"messages": record.get("messages", []), "summary": record.get("summary")}
+
+def is_archived(chat_id: str) -> bool:
+    return chat_id in _index()["sessions"]
+
+def load(chat_id: str):
+    """{"messages", "summary"} of an archived session, or None."""
+    for _ in range(2):
+        entry = _index()["sessions"].get(chat_id)
+        if entry is None:
+            return None
+        try:
+            return _read_entry(entry)
+        except FileNotFoundError:
+            # The pack was rewritten by repack() since the index was read; try the new index
+            continue
+    return None
+
+def archived_sessions() -> dict:
+    """chat_id -> {"title", "mtime", ...} of every archived session."""
+    return _index()["sessions"]
+
+def iter_sessions(skip=()):
+    """Yields (chat_id, session, mtime) for every archived session, in pack order (no caching)."""
+    entries = sorted(_index()["sessions"].items(), key=lambda item: (item[1]["pack"], item[1]["offset"]))
+    for chat_id, entry in entries:
+        if chat_id in skip:
+            continue
+        try:
+            yield chat_id, _read_entry(entry, cached=False), entry["mtime"]
+        except (OSError, ValueError) as e:
+            print(f"Error reading archived session {chat_id}: {e}")
+
+# --- Archiving ---
+
+def archive_cold_sessions(days: float = None) -> int:
+    """Moves sessions not saved for `days` (default ARCHIVE_AFTER_DAYS) into the archive."""
+    from .service import SESSIONS_DIR, read_session_file
+
+    days = ARCHIVE_AFTER_DAYS if days is None else days
+    cutoff = time.time() - days * 86400
+    cold = [path for path in storage.list_dir(SESSIONS_DIR, ".json") if storage.mtime(path) < cutoff]
+    archived = 0
+    for start in range(0, len(cold), BATCH_SIZE):
+        # One storage lock at a time: a session lock held while waiting for the index lock (or for
+        # another session's lock, which may share its stripe) can deadlock with save_session.
+        records, mtimes = [], {}
+        for path in cold[start:start + BATCH_SIZE]:
+            with storage.lock(path):
+                mtime = storage.mtime(path)
+                if not storage.exists(path) or mtime >= cutoff:
+                    continue  # saved (or deleted) meanwhile
+                session = read_session_file(path, default=None)
+            if session is None:
+                print(f"Skipping unreadable session file {path}")
+                continue
+            records.append((os.path.splitext(os.path.basename(path))[0], session, mtime))
+            mtimes[path] = mtime
+        if not records:
+            continue
+        _store(records)
+
+        stale = []
+        for path, mtime in mtimes.items():
+            with storage.lock(path):
+                if storage.exists(path) and storage.mtime(path) == mtime:
+                    storage.delete(path)
+                    archived += 1
+                    continue
+            # Saved or deleted while it was being stored: the hot file (or the deletion) wins
+            stale.append(os.path.splitext(os.path.basename(path))[0])
+        for chat_id in stale:
+            forget(chat_id)
+    return archived
+
+def repack(min_dead_ratio: float = 0.5) -> int:
+    """Rewrites packs whose dead bytes (reopened or deleted chats) pass `min_dead_ratio`; returns packs removed."""
+    removed = 0
+    with storage.lock(_index_file()):
+        index = _index_for_update()
+        for pack, stats in list(index["packs"].items()):
+            if not stats["bytes"] or stats["dead"] / stats["bytes"] < min_dead_ratio:
+                continue
+            live = {chat_id: entry for chat_id, entry in index["sessions"].items() if entry["pack"] == pack}
+            del index["packs"][pack]
+            if live:
+                # Members are copied as they are, into a new pack with the same codec
+                new_pack = _new_pack(index, _codec_of(pack))
+                with open(_pack_path(pack), "rb") as src, open(_pack_path(new_pack), "wb") as dst:
+                    for chat_id, entry in sorted(live.items(), key=lambda item: item[1]["offset"]):
+                        src.seek(entry["offset"])
+                        blob = src.read(entry["length"])
+                        index["sessions"][chat_id] = {**entry, "pack": new_pack, "offset": dst.tell()}
+                        dst.write(blob)
+                    if FSYNC:
+                        dst.flush()
+                        os.fsync(dst.fileno())
+                    index["packs"][new_pack]["bytes"] = dst.tell()
+            storage.write(_index_file(), index)
+            try:
+                os.remove(_pack_path(pack))
+            except FileNotFoundError:
+                pass
+            removed += 1
+    return removed
+
+def _members(data: bytes, codec: str):
+    """Yields (offset, length, decompressed bytes) for each member of a pack, up to a damaged one."""
+    view = memoryview(data)
+    offset = 0
+    while offset < len(data):
+        d = _zstd().ZstdDecompressor().decompressobj() if codec == "zstd" else zlib.decompressobj(wbits=31)
+        out, pos = [], offset
+        try:
+            # Fed in chunks so finding where a member ends does not copy the rest of the pack
+            while not d.eof and pos < len(data):
+                out.append(d.decompress(view[pos:pos + 65536]))
+                pos += 65536
+        except Exception as e:
+            print(f"Stopping at damaged member at offset {offset}: {e}")
+            return
+        if not d.eof:
+            print(f"Stopping at truncated member at offset {offset}")
+            return
+        end = min(pos, len(data)) - len(d.unused_data)
+        yield offset, end - offset, b"".join(out)
+        offset = end
+
+def rebuild_index() -> int:
+    """
+    Recreates index.json from the packs (every member stores its chat id); returns sessions indexed.
+    The newest copy of a chat wins, and chats with a hot file are left out. Chats deleted since
+    their pack was last rewritten come back, as the packs hold no record of the deletion.
+    """
+    from .service import get_session_file
+
+    names = os.listdir(ARCHIVE_DIR) if os.path.isdir(ARCHIVE_DIR) else []
+    packs = sorted(name for name in names if name.startswith("sessions-") and name.endswith(tuple(EXTENSIONS.values())))
+    with storage.lock(_index_file()):
+        index = _empty_index()
+        for pack in packs:
+            number = pack[len("sessions-"):].split(".")[0]
+            if number.isdigit():
+                index["next_pack"] = max(index["next_pack"], int(number) + 1)
+            with open(_pack_path(pack), "rb") as f:
+                data = f.read()
+            index["packs"][pack] = {"bytes": len(data), "dead": 0}
+            index["current"] = pack
+            for offset, length, line in _members(data, _codec_of(pack)):
+                try:
+                    record = json.loads(line)
+                    chat_id = record["id"]
+                except (ValueError, KeyError, TypeError) as e:
+                    print(f"Skipping unreadable member at {pack}:{offset}: {e}")
+                    continue
+                _drop_entry(index, chat_id)
+                index["sessions"][chat_id] = {
+                    "pack": pack,
+                    "offset": offset,
+                    "length": length,
+                    "title": _title(record.get("messages", [])),
+                    "mtime": record.get("mtime") or 0,
+                }
+        for chat_id in [chat_id for chat_id in index["sessions"] if storage.exists(get_session_file(chat_id))]:
+            _drop_entry(index, chat_id)
+        for pack, stats in index["packs"].items():
+            live = sum(e["length"] for e in index["sessions"].values() if e["pack"] == pack)
+            stats["dead"] = stats["bytes"] - live
+        try:
+            _index_for_update()
+        except ArchiveIndexError:
+            # Kept for inspection rather than overwritten
+            os.replace(_index_file(), _index_file() + ".corrupt")
+        storage.write(_index_file(), index)
+    return len(index["sessions"])
+
+def run_scheduled() -> int:
+    """Archive pass for the server; with several workers only the one holding the claim runs it."""
+    if ARCHIVE_AFTER_DAYS <= 0:
+        return 0
+    claim = storage.try_claim(os.path.join(ARCHIVE_DIR, "run.lock"))
+    if claim is None:
+        return 0
+    try:
+        count = archive_cold_sessions()
+        repack()
+        if count:
+            print(f"Archived {count} cold sessions")
+        return count
+    finally:
+        claim.release()
+
+async def archive_periodically():
+    while True:
+        try:
+            await asyncio.to_thread(run_scheduled)
+        except Exception as e:
+            print(f"Error archiving sessions: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+# --- Export / import ---
+
+def export_sessions(path: str) -> int:
+    """Streams every session, hot and archived, into a JSONL file (compressed by extension)."""
+    from .service import SESSIONS_DIR, read_session_file
+
+    count = 0
+    hot = set()
+    with open_jsonl(path, "w") as out:
+        for file_path in storage.list_dir(SESSIONS_DIR, ".json"):
+            session = read_session_file(file_path, default=None)
+            if session is None:
+                continue
+            chat_id = os.path.splitext(os.path.basename(file_path))[0]
+            hot.add(chat_id)
+            out.write(json.dumps({"id": chat_id, **session, "mtime": storage.mtime(file_path)}, ensure_ascii=False) + "\n")
+            count += 1
+        for chat_id, session, mtime in iter_sessions(skip=hot):
+            out.write(json.dumps({"id": chat_id, **session, "mtime": mtime}, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+def import_sessions(path: str, overwrite: bool = False) -> tuple:
+    """Loads an export into the archive; existing chats are kept unless `overwrite`. Returns (imported, skipped)."""
+    from .service import get_session_file
+    from . import search
+
+    imported = skipped = 0
+    batch = []
+
+    def store_batch():
+        _store(batch)
+        for chat_id, session, _ in batch:
+            if overwrite:
+                storage.delete(get_session_file(chat_id))
+            search.index_session(chat_id, session["messages"])
+        batch.clear()
+
+    with open_jsonl(path, "r") as src:
+        for line in src:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            chat_id = "".join(c for c in str(record.get("id", "")) if c.isalnum() or c in "-_")
+            if not chat_id or (not overwrite and (storage.exists(get_session_file(chat_id)) or is_archived(chat_id))):
+                skipped += 1
+                continue
+            session = {"messages": record.get("messages", []), "summary": record.get("summary")}
+            batch.append((chat_id, session, record.get("mtime") or time.time()))
+            imported += 1
+            if len(batch) >= BATCH_SIZE:
+                store_batch()
+    if batch:
+        store_batch()
+    return imported, skipped
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Chat session archive")
+    parser.add_argument("--archive", action="store_true", help="move cold sessions into the archive now")
+    parser.add_argument("--days", type=float, default=None, help="age in days for --archive (default ONYS_ARCHIVE_AFTER_DAYS)")
+    parser.add_argument("--repack", action="store_true", help="rewrite packs with many reopened or deleted chats")
+    parser.add_argument("--rebuild-index", action="store_true", help="recreate index.json from the packs (e.g. after it was damaged)")
+    parser.add_argument("--export", metavar="FILE", help="write every session to FILE (.jsonl, .jsonl.gz or .jsonl.zst)")
+    parser.add_argument("--import", dest="import_file", metavar="FILE", help="load sessions from an export into the archive")
+    parser.add_argument("--overwrite", action="store_true", help="with --import, replace chats that already exist")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.rebuild_index:
+        print(f"Indexed {rebuild_index()} archived sessions")
+    if args.archive:
+        print(f"Archived {archive_cold_sessions(args.days)} sessions")
+    if args.repack:
+        print(f"Rewrote {repack()} packs")
+    if args.export:
+        print(f"Exported {export_sessions(args.export)} sessions to {args.export}")
+    if args.import_file:
+        imported, skipped = import_sessions(args.import_file, args.overwrite)
+        print(f"Imported {imported} sessions ({skipped} already present)")
+    storage.flush()
+    print(f"Done in {time.perf_counter() - started:.2f}s")
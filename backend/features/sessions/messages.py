@@ -0,0 +1,17 @@
+"""
+Helpers over a chat's message list shared by the search index and chat compaction.
+"""
+import hashlib
+
+def message_text(content) -> str:
+    """The text of a message's content: a plain string, or the text parts of a multimodal list."""
+    if isinstance(content, list):
+        return "\n".join(c.get("text", "") for c in content if isinstance(c, dict) and c.get("type") == "text")
+    return content if isinstance(content, str) else ""
+
+def prefix_hash(messages: list, count: int) -> str:
+    """Fingerprint of the first `count` messages (roles and text), to tell whether a stored prefix changed."""
+    digest = hashlib.sha1()
+    for msg in messages[:count]:
+        digest.update(f"{msg.get('role')}\0{message_text(msg.get('content'))}\0".encode("utf-8"))
+    return digest.hexdigest()
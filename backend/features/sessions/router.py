@@ -1,6 +1,7 @@
-from fastapi import APIRouter
-from typing import List
-from .service import list_sessions, load_session, save_session, delete_session
+from fastapi import APIRouter, HTTPException, Query
+from typing import List, Optional
+from .service import list_sessions, load_session, save_session, delete_session, search_sessions
+from timeutil import parse_time
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -13,6 +14,28 @@ class SessionSaveRequest(BaseModel):
 def get_all_sessions():
     return list_sessions()
 
+@router.get("/search")
+def search_sessions_endpoint(
+    q: str,
+    agent_id: Optional[str] = None,
+    model: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+):
+    """Full-text search over message content, best matches first. since/until take ISO dates or epoch seconds."""
+    try:
+        start, end = parse_time(since), parse_time(until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return search_sessions(
+        q, agent_id=agent_id, model=model,
+        since=start.timestamp() if start else None,
+        until=end.timestamp() if end else None,
+        limit=limit, offset=offset,
+    )
+
 @router.get("/{chat_id}")
 def get_session_history(chat_id: str):
     return load_session(chat_id)
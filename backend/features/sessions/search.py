@@ -0,0 +1,205 @@
+"""
+Full-text index over chat messages (SQLite FTS5).
+
+save_session / delete_session keep it current; since chats normally only grow, a save
+only inserts the messages past the indexed ones (a changed prefix reindexes that chat). Rebuild from the session files with:
+
+    cd backend
+    python -m features.sessions.search --rebuild
+"""
+import os
+import sqlite3
+import threading
+import time
+from config import DATA_DIR
+from features.storage.service import storage
+from .messages import message_text, prefix_hash
+
+SEARCH_DB = os.path.join(DATA_DIR, "search.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS indexed_sessions (
+    chat_id TEXT PRIMARY KEY,
+    title TEXT,
+    message_count INTEGER NOT NULL,
+    prefix_hash TEXT,
+    updated_at REAL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content,
+    chat_id UNINDEXED,
+    idx UNINDEXED,
+    role UNINDEXED,
+    agent_id UNINDEXED,
+    model UNINDEXED,
+    ts UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS index_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_local = threading.local()
+
+def _connect():
+    # One connection per thread (routes run in a threadpool); WAL lets searches run during writes
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != SEARCH_DB:
+        os.makedirs(os.path.dirname(SEARCH_DB) or ".", exist_ok=True)
+        conn = sqlite3.connect(SEARCH_DB, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn, _local.path = conn, SEARCH_DB
+    return conn
+
+def _title_of(messages: list) -> str:
+    first = next((message_text(m.get("content")) for m in messages if m.get("role") == "user"), "New Chat")
+    return first[:30] + "..." if len(first) > 30 else first
+
+def _rows(chat_id: str, messages: list, start: int, fallback_ts: float) -> list:
+    rows = []
+    for i in range(start, len(messages)):
+        msg = messages[i]
+        text = message_text(msg.get("content"))
+        if not text:
+            continue
+        meta = msg.get("meta") or {}
+        if msg.get("role") != "assistant":
+            # User turns carry no meta; take agent/model from the answer that follows
+            meta = next((m.get("meta") or {} for m in messages[i + 1:] if m.get("role") == "assistant"), {})
+        rows.append((text, chat_id, i, msg.get("role", ""), meta.get("agent_id") or "", meta.get("model") or "",
+                     meta.get("created_at") or fallback_ts))
+    return rows
+
+def index_session(chat_id: str, messages: list, fallback_ts: float = None):
+    """
+    Brings the index for one chat up to date: appends when the indexed prefix is unchanged, else reindexes it.
+    Messages without meta.created_at (older chats) are dated `fallback_ts`, by default now.
+    """
+    conn = _connect()
+    now = time.time()
+    with conn:
+        row = conn.execute("SELECT message_count, prefix_hash FROM indexed_sessions WHERE chat_id = ?", (chat_id,)).fetchone()
+        start = 0
+        if row:
+            count, stored_hash = row
+            if count <= len(messages) and prefix_hash(messages, count) == stored_hash:
+                start = count
+            else:
+                conn.execute("DELETE FROM messages_fts WHERE chat_id = ?", (chat_id,))
+
+        conn.executemany(
+            "INSERT INTO messages_fts (content, chat_id, idx, role, agent_id, model, ts) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            _rows(chat_id, messages, start, fallback_ts or now),
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO indexed_sessions (chat_id, title, message_count, prefix_hash, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (chat_id, _title_of(messages), len(messages), prefix_hash(messages, len(messages)), now),
+        )
+
+def remove_session(chat_id: str):
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM messages_fts WHERE chat_id = ?", (chat_id,))
+        conn.execute("DELETE FROM indexed_sessions WHERE chat_id = ?", (chat_id,))
+
+def rebuild_index(sessions_dir: str) -> int:
+    from .service import read_session_file
+    from . import archive
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM messages_fts")
+        conn.execute("DELETE FROM indexed_sessions")
+    count = 0
+    hot = set()
+    for path in storage.list_dir(sessions_dir, ".json"):
+        try:
+            messages = read_session_file(path)["messages"]
+        except AttributeError:
+            continue
+        chat_id = os.path.splitext(os.path.basename(path))[0]
+        hot.add(chat_id)
+        # Legacy messages have no created_at; the file's last save is the closest date they have
+        index_session(chat_id, messages, fallback_ts=storage.mtime(path))
+        count += 1
+    for chat_id, session, mtime in archive.iter_sessions(skip=hot):
+        index_session(chat_id, session["messages"], fallback_ts=mtime)
+        count += 1
+    with conn:
+        conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('optimize')")
+        conn.execute("INSERT OR REPLACE INTO index_meta (key, value) VALUES ('backfilled', ?)", (str(time.time()),))
+    return count
+
+def is_backfilled() -> bool:
+    """
+    Whether a full rebuild has run on this index. Saves index their own chat, so an index that
+    is not empty can still be missing every chat written before it existed.
+    """
+    return _connect().execute("SELECT 1 FROM index_meta WHERE key = 'backfilled'").fetchone() is not None
+
+def _fts_query(text: str) -> str:
+    # Quote every term so user input can't hit FTS5 syntax; the last term matches as a prefix
+    terms = [t.replace('"', '""') for t in text.split()]
+    if not terms:
+        return ""
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+def search(query: str, agent_id: str = None, model: str = None, since: float = None, until: float = None,
+           limit: int = 20, offset: int = 0) -> dict:
+    match = _fts_query(query)
+    if not match:
+        return {"query": query, "results": []}
+
+    sql = """
+        SELECT f.chat_id, f.idx, f.role, f.agent_id, f.model, f.ts,
+               snippet(messages_fts, 0, '<mark>', '</mark>', '…', 16), bm25(messages_fts), s.title
+        FROM messages_fts f LEFT JOIN indexed_sessions s ON s.chat_id = f.chat_id
+        WHERE messages_fts MATCH ?
+    """
+    params = [match]
+    if agent_id:
+        sql += " AND f.agent_id = ?"
+        params.append(agent_id)
+    if model:
+        sql += " AND f.model = ?"
+        params.append(model)
+    if since is not None:
+        sql += " AND f.ts >= ?"
+        params.append(since)
+    if until is not None:
+        sql += " AND f.ts < ?"
+        params.append(until)
+    sql += " ORDER BY bm25(messages_fts) LIMIT ? OFFSET ?"
+    params += [limit, offset]
+
+    results = []
+    for chat_id, idx, role, agent, model_id, ts, snippet, score, title in _connect().execute(sql, params):
+        results.append({
+            "chat_id": chat_id,
+            "title": title,
+            "message_index": idx,
+            "role": role,
+            "agent_id": agent or None,
+            "model": model_id or None,
+            "ts": ts,
+            "snippet": snippet,
+            "score": round(-score, 6),
+        })
+    return {"query": query, "results": results}
+
+if __name__ == "__main__":
+    import argparse
+    from .service import SESSIONS_DIR
+
+    parser = argparse.ArgumentParser(description="Chat session search index")
+    parser.add_argument("--rebuild", action="store_true", help="reindex every session file")
+    args = parser.parse_args()
+    if args.rebuild:
+        started = time.perf_counter()
+        count = rebuild_index(SESSIONS_DIR)
+        print(f"Indexed {count} sessions in {time.perf_counter() - started:.2f}s")
@@ -1,47 +1,102 @@
-import json
 import os
-import glob
 from typing import List
+from config import DATA_DIR
+from features.storage.service import storage
+from . import archive, search
 
-SESSIONS_DIR = "data/sessions"
-
-# Ensure directory exists
-os.makedirs(SESSIONS_DIR, exist_ok=True)
+# Created by the first save (storage makes missing directories)
+SESSIONS_DIR = os.path.join(DATA_DIR, "sessions")
 
 def get_session_file(chat_id: str):
     # Sanitize ID to prevent path traversal
     safe_id = "".join([c for c in chat_id if c.isalnum() or c in "-_"])
     return os.path.join(SESSIONS_DIR, f"{safe_id}.json")
 
+def _index_id(file_path: str) -> str:
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+def read_session_file(file_path: str, default=[]) -> dict:
+    """Session files are {"messages": [...], "summary": {...}}; older ones are a bare message list."""
+    data = storage.read(file_path, default=default)
+    if data is None:
+        return None
+    if isinstance(data, list):
+        return {"messages": data, "summary": None}
+    return {"messages": data.get("messages", []), "summary": data.get("summary")}
+
+def session_title(messages: List[dict]) -> str:
+    # First user message, shortened
+    first_msg = next((m["content"] for m in messages if m["role"] == "user"), "New Chat")
+    return first_msg[:30] + "..." if len(first_msg) > 30 else first_msg
+
+def _read_session(chat_id: str) -> dict:
+    # Hot file first; chats not saved for a long time live in the archive
+    file_path = get_session_file(chat_id)
+    if storage.exists(file_path):
+        return read_session_file(file_path)
+    return archive.load(_index_id(file_path)) or {"messages": [], "summary": None}
+
 def save_session(chat_id: str, messages: List[dict]):
+    """Write-behind: back-to-back saves of a chat (e.g. during a turn) reach the disk once."""
     file_path = get_session_file(chat_id)
-    with open(file_path, "w") as f:
-        json.dump(messages, f, indent=4)
+    archived = None
+    # The lock keeps a background summary update from being overwritten, and vice versa
+    with storage.lock(file_path):
+        if storage.exists(file_path):
+            # Keep the stored summary; compaction checks it still matches the history before using it
+            try:
+                summary = read_session_file(file_path)["summary"]
+            except AttributeError:
+                summary = None
+            storage.write_later(file_path, {"messages": messages, "summary": summary}, indent=4)
+        else:
+            # A reopened archived chat moves back to the hot directory. Written through, since
+            # its archived copy is dropped right after.
+            archived = archive.load(_index_id(file_path))
+            summary = archived["summary"] if archived else None
+            storage.write(file_path, {"messages": messages, "summary": summary}, indent=4)
+    if archived:
+        # After releasing the session lock: the archive index has its own lock, never taken under it
+        archive.forget(_index_id(file_path))
+    try:
+        search.index_session(_index_id(file_path), messages)
+    except Exception as e:
+        # The file is the source of truth; a stale index is fixed by the next save or a rebuild
+        print(f"Error indexing session {chat_id}: {e}")
 
 def load_session(chat_id: str):
-    file_path = get_session_file(chat_id)
-    if not os.path.exists(file_path):
-        return []
     try:
-        with open(file_path, "r") as f:
-            return json.load(f)
+        return _read_session(chat_id)["messages"]
     except:
         return []
 
+def load_summary(chat_id: str):
+    try:
+        return _read_session(chat_id)["summary"]
+    except:
+        return None
+
+def save_summary(chat_id: str, summary: dict) -> bool:
+    """Stores a summary next to the messages; False if the session is gone."""
+    file_path = get_session_file(chat_id)
+    with storage.lock(file_path):
+        if not storage.exists(file_path):
+            return False
+        messages = read_session_file(file_path)["messages"]
+        storage.write_later(file_path, {"messages": messages, "summary": summary}, indent=4)
+    return True
+
 def list_sessions():
     """Returns a list of available chat sessions based on file names"""
-    files = glob.glob(os.path.join(SESSIONS_DIR, "*.json"))
+    files = storage.list_dir(SESSIONS_DIR, ".json")
     sessions = []
+    mtimes = {}
     for f in files:
         # Get filename without extension
         session_id = os.path.splitext(os.path.basename(f))[0]
         # Peek at the file to find a title (first user message) or use ID
         try:
-            with open(f, "r") as json_file:
-                data = json.load(json_file)
-                # Find first user message for a title
-                first_msg = next((m["content"] for m in data if m["role"] == "user"), "New Chat")
-                title = first_msg[:30] + "..." if len(first_msg) > 30 else first_msg
+            title = session_title(read_session_file(f)["messages"])
         except:
             title = "Empty Chat"
 
@@ -49,14 +104,31 @@ def list_sessions():
             "id": session_id,
             "title": title
         })
+        mtimes[session_id] = storage.mtime(f)
+    # Archived chats come from the archive index, without opening them
+    for session_id, entry in archive.archived_sessions().items():
+        if session_id not in mtimes:
+            sessions.append({"id": session_id, "title": entry["title"], "archived": True})
+            mtimes[session_id] = entry["mtime"]
     # Sort by modification time (newest first)
-    sessions.sort(key=lambda x: os.path.getmtime(os.path.join(SESSIONS_DIR, f"{x['id']}.json")), reverse=True)
+    sessions.sort(key=lambda x: mtimes[x["id"]], reverse=True)
     return sessions
 
 
 def delete_session(chat_id: str):
     file_path = get_session_file(chat_id)
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    deleted = storage.delete(file_path)
+    deleted = archive.forget(_index_id(file_path)) or deleted
+    if deleted:
+        try:
+            search.remove_session(_index_id(file_path))
+        except Exception as e:
+            print(f"Error removing session {chat_id} from the index: {e}")
         return True
-    return False
\ No newline at end of file
+    return False
+
+def search_sessions(query: str, **filters) -> dict:
+    # First search on an existing data directory: index what is already on disk
+    if not search.is_backfilled():
+        search.rebuild_index(SESSIONS_DIR)
+    return search.search(query, **filters)
@@ -1,23 +1,17 @@
 # backend/features/settings/router.py
-import json
 from fastapi import APIRouter
 from .models import SettingsPayload
+from .service import load_settings, save_settings as store_settings
 
 router = APIRouter()
-DB_FILE = "user_settings.json"
 
 @router.post("/save")
 def save_settings(payload: SettingsPayload):
     # Save the data to a local JSON file
-    with open(DB_FILE, "w") as f:
-        json.dump(payload.dict(), f, indent=4)
+    store_settings(payload.dict())
     return {"status": "success", "message": "Settings saved successfully"}
 
 @router.get("/")
 def get_settings():
     # Load settings if they exist
-    try:
-        with open(DB_FILE, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {"providers": []}
\ No newline at end of file
+    return load_settings()
\ No newline at end of file
@@ -0,0 +1,17 @@
+from config import SETTINGS_FILE
+from features.storage.service import storage
+
+# Settings are read on every chat turn; the parsed file is kept per worker and re-read only
+# when its version stamp changes (saved here, by another worker, or edited by hand)
+
+def load_settings() -> dict:
+    return storage.read_cached(SETTINGS_FILE, default={"providers": []})
+
+def save_settings(data: dict):
+    storage.write(SETTINGS_FILE, data, indent=4)
+
+def get_provider_settings(provider_id: str):
+    for p in load_settings().get("providers", []):
+        if p["id"] == provider_id:
+            return p
+    return None
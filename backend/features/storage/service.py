@@ -0,0 +1,332 @@
+import atexit
+import copy
+import json
+import os
+import threading
+import time
+import zlib
+from config import DATA_DIR, WORKERS
+
+try:
+    import fcntl
+
+    def _lock_fd(fd: int, blocking: bool = True) -> bool:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _unlock_fd(fd: int):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+except ImportError:  # Windows
+    import msvcrt
+
+    def _lock_fd(fd: int, blocking: bool = True) -> bool:
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.01)
+
+    def _unlock_fd(fd: int):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+# Seconds a write-behind save may wait so rapid saves of the same file coalesce (0 = write through).
+# Queued data lives in one process, so with several workers every save is written through.
+WRITE_BEHIND_DELAY = 0.0 if WORKERS > 1 else float(os.environ.get("ONYS_WRITE_BEHIND_DELAY", "0.5"))
+# fsync before the rename so a crash leaves either the old or the new file, never a truncated one
+FSYNC = os.environ.get("ONYS_FSYNC", "1") != "0"
+# Cross-process locks are spread over a fixed set of lock files instead of one per data file
+LOCK_STRIPES = 64
+
+class _StripeLock:
+    """Cross-process half of a file lock: an exclusive lock on one of the stripe files."""
+    def __init__(self, path: str):
+        self.path = path
+        self.mutex = threading.RLock()
+        self.depth = 0
+        self.fd = None
+
+    def acquire(self):
+        self.mutex.acquire()
+        try:
+            if self.depth == 0:
+                if self.fd is None:
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                    self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                _lock_fd(self.fd)
+            self.depth += 1
+        except BaseException:
+            self.mutex.release()
+            raise
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            _unlock_fd(self.fd)
+        self.mutex.release()
+
+class FileLock:
+    """Reentrant lock on one file, exclusive across threads (per-path RLock) and worker processes (stripe)."""
+    def __init__(self, local: threading.RLock, stripe: _StripeLock):
+        self.local = local
+        self.stripe = stripe
+
+    def __enter__(self):
+        self.local.acquire()
+        try:
+            self.stripe.acquire()
+        except BaseException:
+            self.local.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self.stripe.release()
+        self.local.release()
+
+class Claim:
+    """Non-blocking exclusive ownership of a path; the OS releases it if the process dies."""
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    def release(self):
+        if self.fd is not None:
+            _unlock_fd(self.fd)
+            os.close(self.fd)
+            self.fd = None
+
+class JsonStorage:
+    """
+    Shared persistence for the JSON files of every feature.
+
+    - Writes are atomic: a temp file in the same directory is renamed over the target, so
+      readers (in any process) see the old or the new file and never need a lock.
+    - lock(path) serializes read-modify-write cycles on one file across threads and worker
+      processes (reentrant, so the helpers below can be called while holding it).
+    - read_cached() re-parses a file only when its version stamp (mtime, size, inode) changed,
+      which is how per-worker caches notice writes made by other workers.
+    - write_later() queues a save; repeated saves of a file within WRITE_BEHIND_DELAY are
+      coalesced into one disk write. Reads see queued data, and flush() writes everything out.
+    """
+    def __init__(self, write_delay: float = WRITE_BEHIND_DELAY, lock_dir: str = None):
+        self.write_delay = write_delay
+        self.lock_dir = lock_dir or os.path.join(DATA_DIR, ".locks")
+        self._locks = {}
+        self._stripes = [_StripeLock(os.path.join(self.lock_dir, f"{i:02d}.lock")) for i in range(LOCK_STRIPES)]
+        self._locks_guard = threading.Lock()
+        self._pending = {}  # path -> (serialized json, queued_at, due)
+        self._cached = {}   # path -> (version stamp, parsed data)
+        self._cond = threading.Condition()
+        self._flusher = None
+
+    def _local_lock(self, path: str) -> threading.RLock:
+        key = os.path.abspath(path)
+        with self._locks_guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.RLock()
+            return lock
+
+    def lock(self, path: str) -> FileLock:
+        key = os.path.abspath(path)
+        stripe = self._stripes[zlib.crc32(key.encode("utf-8")) % LOCK_STRIPES]
+        return FileLock(self._local_lock(path), stripe)
+
+    def try_claim(self, path: str):
+        """Claim on `path` (a lock file, created if needed), or None while another process holds it."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if _lock_fd(fd, blocking=False):
+            return Claim(fd)
+        os.close(fd)
+        return None
+
+    # --- Reading ---
+
+    def read(self, path: str, default=None):
+        """Parsed contents of `path`, or `default` when it is missing or unreadable."""
+        with self._local_lock(path):
+            with self._cond:
+                pending = self._pending.get(os.path.abspath(path))
+            try:
+                if pending:
+                    return json.loads(pending[0])
+                with open(path, "r") as f:
+                    return json.load(f)
+            except FileNotFoundError:
+                return default
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Error reading {path}: {e}")
+                return default
+
+    @staticmethod
+    def version(path: str):
+        """Cheap change stamp of a file (one stat); None when it does not exist."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def read_cached(self, path: str, default=None):
+        """Like read(), for small hot files: parsed again only when the version stamp changed. Returns a copy."""
+        key = os.path.abspath(path)
+        with self._local_lock(path):
+            with self._cond:
+                pending = self._pending.get(key)
+            if pending:
+                return json.loads(pending[0])
+            stamp = self.version(path)
+            if stamp is None:
+                self._cached.pop(key, None)
+                return copy.deepcopy(default)
+            cached = self._cached.get(key)
+            if cached is None or cached[0] != stamp:
+                cached = self._cached[key] = (stamp, self.read(path, default))
+            return copy.deepcopy(cached[1])
+
+    def exists(self, path: str) -> bool:
+        with self._cond:
+            if os.path.abspath(path) in self._pending:
+                return True
+        return os.path.exists(path)
+
+    def mtime(self, path: str) -> float:
+        with self._cond:
+            pending = self._pending.get(os.path.abspath(path))
+        if pending:
+            return pending[1]
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0.0
+
+    def list_dir(self, directory: str, suffix: str = ".json") -> list:
+        """Files in `directory` ending in `suffix`, including ones only queued so far."""
+        paths = set()
+        try:
+            paths.update(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(suffix))
+        except FileNotFoundError:
+            pass
+        prefix = os.path.abspath(directory) + os.sep
+        with self._cond:
+            for key in self._pending:
+                if key.startswith(prefix) and key.endswith(suffix) and os.sep not in key[len(prefix):]:
+                    paths.add(os.path.join(directory, key[len(prefix):]))
+        return sorted(paths)
+
+    # --- Writing ---
+
+    def _write_text(self, path: str, text: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(text)
+                if FSYNC:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def write(self, path: str, data, indent: int = None):
+        """Atomically replaces `path` now; supersedes a queued write of the same file."""
+        text = json.dumps(data, indent=indent)
+        with self.lock(path):
+            with self._cond:
+                self._pending.pop(os.path.abspath(path), None)
+            self._write_text(path, text)
+
+    def write_later(self, path: str, data, indent: int = None):
+        """Queues a write-behind save. The data is serialized now, so callers may keep mutating it."""
+        if self.write_delay <= 0:
+            return self.write(path, data, indent)
+        text = json.dumps(data, indent=indent)
+        key = os.path.abspath(path)
+        with self.lock(path):
+            with self._cond:
+                now = time.time()
+                previous = self._pending.get(key)
+                # Keep the first due time so a file saved continuously is still written every delay
+                due = previous[2] if previous else time.monotonic() + self.write_delay
+                self._pending[key] = (text, now, due)
+                self._ensure_flusher()
+                self._cond.notify()
+
+    def update(self, path: str, fn, default=None, indent: int = None, later: bool = False):
+        """Read-modify-write under the file lock: stores and returns fn(current contents)."""
+        with self.lock(path):
+            data = fn(self.read(path, default))
+            (self.write_later if later else self.write)(path, data, indent)
+            return data
+
+    def delete(self, path: str) -> bool:
+        with self.lock(path):
+            with self._cond:
+                queued = self._pending.pop(os.path.abspath(path), None) is not None
+            try:
+                os.remove(path)
+                return True
+            except FileNotFoundError:
+                return queued
+
+    # --- Write-behind queue ---
+
+    def _ensure_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_loop, name="storage-flusher", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                wait = min(due for _, _, due in self._pending.values()) - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                now = time.monotonic()
+                due_paths = [key for key, (_, _, due) in self._pending.items() if due <= now]
+            for key in due_paths:
+                self._flush_one(key)
+
+    def _flush_one(self, key: str):
+        with self.lock(key):
+            with self._cond:
+                entry = self._pending.pop(key, None)
+            if entry is None:
+                return
+            try:
+                self._write_text(key, entry[0])
+            except OSError as e:
+                print(f"Error writing {key}: {e}")
+                with self._cond:
+                    # Retry later unless a newer save was queued meanwhile
+                    self._pending.setdefault(key, (entry[0], entry[1], time.monotonic() + max(self.write_delay, 1.0)))
+
+    def flush(self):
+        """Writes every queued save now (called on shutdown)."""
+        with self._cond:
+            keys = list(self._pending)
+        for key in keys:
+            self._flush_one(key)
+
+storage = JsonStorage()
+atexit.register(storage.flush)
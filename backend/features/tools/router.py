@@ -0,0 +1,9 @@
+from fastapi import APIRouter
+from .service import list_tools
+
+router = APIRouter()
+
+@router.get("/")
+def get_tools():
+    """Tools an agent can list in its `tools` field"""
+    return list_tools()
@@ -0,0 +1,168 @@
+"""
+Tools agents can call during a chat turn.
+
+An agent lists tool names in `Agent.tools`; their JSON schemas are sent to the provider, and the
+calls the model makes are run here (all calls of one round concurrently, each with a timeout)
+before the chat pipeline sends the results back and continues streaming.
+
+A tool is a plain function `fn(context, **arguments)` returning a string or JSON-serializable
+data. Blocking functions run in a thread; coroutine functions run on the event loop.
+"""
+import asyncio
+import inspect
+import json
+import os
+import re
+import time
+
+TOOL_TIMEOUT_SECONDS = float(os.environ.get("ONYS_TOOL_TIMEOUT", "15"))
+# Longer results are cut so one tool cannot flood the context window
+MAX_RESULT_CHARS = int(os.environ.get("ONYS_TOOL_MAX_RESULT_CHARS", "8000"))
+
+class ToolContext:
+    """What a tool may know about the turn that called it."""
+    def __init__(self, chat_id: str = None, agent_id: str = None, documents: list = None):
+        self.chat_id = chat_id
+        self.agent_id = agent_id
+        self.documents = documents or []  # [(name, extracted text)]
+
+class Tool:
+    def __init__(self, name: str, description: str, parameters: dict, fn):
+        self.name = name
+        self.description = description
+        self.parameters = parameters
+        self.fn = fn
+
+    def spec(self) -> dict:
+        return {"name": self.name, "description": self.description, "parameters": self.parameters}
+
+TOOLS = {}
+
+def register_tool(name: str, description: str, parameters: dict):
+    def decorator(fn):
+        TOOLS[name] = Tool(name, description, parameters, fn)
+        return fn
+    return decorator
+
+def get_tools(names) -> list:
+    """Registered tools among `names` (unknown names, e.g. of a removed tool, are skipped)."""
+    return [TOOLS[name] for name in names or [] if name in TOOLS]
+
+def list_tools() -> list:
+    return [tool.spec() for tool in TOOLS.values()]
+
+# --- Execution ---
+
+def _format_result(result) -> str:
+    text = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
+    if len(text) > MAX_RESULT_CHARS:
+        text = text[:MAX_RESULT_CHARS] + "\n[truncated]"
+    return text
+
+async def run_tool(call: dict, context: ToolContext, timeout: float = None) -> dict:
+    """
+    Runs one call ({"id", "name", "arguments"}) and returns {"id", "name", "content", "ok", "ms"}.
+    Failures are returned as error text for the model instead of raised, so the turn goes on.
+    """
+    timeout = TOOL_TIMEOUT_SECONDS if timeout is None else timeout
+    name = call.get("name", "")
+    started = time.perf_counter()
+    try:
+        tool = TOOLS.get(name)
+        if tool is None:
+            raise ValueError(f"unknown tool '{name}'")
+        arguments = call.get("arguments") or {}
+        if not isinstance(arguments, dict):
+            raise ValueError("arguments must be a JSON object")
+        if inspect.iscoroutinefunction(tool.fn):
+            result = await asyncio.wait_for(tool.fn(context, **arguments), timeout)
+        else:
+            # A timed-out thread cannot be stopped; its result is simply dropped
+            result = await asyncio.wait_for(asyncio.to_thread(tool.fn, context, **arguments), timeout)
+        content, ok = _format_result(result), True
+    except asyncio.TimeoutError:
+        content, ok = f"Error: tool '{name}' timed out after {timeout:g}s.", False
+    except Exception as e:
+        content, ok = f"Error: {e}", False
+    return {
+        "id": call.get("id"),
+        "name": name,
+        "content": content,
+        "ok": ok,
+        "ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+async def run_tool_calls(calls: list, context: ToolContext, timeout: float = None) -> list:
+    """Runs the calls of one model round concurrently; results keep the order of `calls`."""
+    return list(await asyncio.gather(*(run_tool(call, context, timeout) for call in calls)))
+
+# --- Built-in tools ---
+
+@register_tool(
+    "search_sessions",
+    "Full-text search over the user's past chat sessions. Returns matching messages with their chat title and a snippet.",
+    {
+        "type": "object",
+        "properties": {
+            "query": {"type": "string", "description": "Words to search for"},
+            "limit": {"type": "integer", "description": "Maximum number of results (default 5, at most 20)"},
+        },
+        "required": ["query"],
+    },
+)
+def search_sessions_tool(context: ToolContext, query: str, limit: int = 5):
+    from features.sessions.service import search_sessions
+
+    results = search_sessions(query, limit=max(1, min(int(limit), 20)))["results"]
+    return [{
+        "chat_id": r["chat_id"],
+        "title": r["title"],
+        "role": r["role"],
+        "snippet": r["snippet"].replace("<mark>", "").replace("</mark>", ""),
+    } for r in results if r["chat_id"] != context.chat_id]
+
+PASSAGE_CHARS = 1200
+
+def _passages(text: str):
+    # Paragraphs merged up to PASSAGE_CHARS, so a match comes with some surrounding context
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        if current and len(current) + len(paragraph) > PASSAGE_CHARS:
+            yield current
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current.strip():
+        yield current
+
+@register_tool(
+    "lookup_document",
+    "Finds the passages of the documents attached to the conversation that best match a query.",
+    {
+        "type": "object",
+        "properties": {
+            "query": {"type": "string", "description": "Words to look for"},
+            "document": {"type": "string", "description": "Only search the document with this file name"},
+            "limit": {"type": "integer", "description": "Maximum number of passages (default 3, at most 10)"},
+        },
+        "required": ["query"],
+    },
+)
+def lookup_document_tool(context: ToolContext, query: str, document: str = None, limit: int = 3):
+    terms = set(re.findall(r"\w+", query.lower()))
+    if not terms:
+        raise ValueError("the query has no words to look for")
+    documents = [(name, text) for name, text in context.documents if not document or name == document]
+    if not documents:
+        return "No matching document is attached."
+
+    scored = []
+    for name, text in documents:
+        for passage in _passages(text):
+            words = re.findall(r"\w+", passage.lower())
+            score = sum(1 for w in words if w in terms) + 5 * len(terms.intersection(words))
+            if score:
+                scored.append((score, name, passage.strip()))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    if not scored:
+        return "No passage matches the query."
+    return [{"document": name, "passage": passage} for _, name, passage in scored[:max(1, min(int(limit), 10))]]
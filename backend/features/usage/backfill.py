@@ -0,0 +1,57 @@
+"""
+Rebuilds the usage ledger from the saved chat sessions.
+
+    cd backend
+    python -m features.usage.backfill
+
+Archived chats are included. Turns saved before the ledger existed have no provider/model/timestamp
+in their meta; they are booked as "unknown" at the session's last save.
+"""
+import os
+from features.sessions import archive
+from features.sessions import service as sessions
+from features.storage.service import storage
+from .service import usage_ledger
+
+def _session_entries(chat_id: str, messages: list, mtime: float) -> list:
+    entries = []
+    for msg in messages:
+        meta = msg.get("meta") or {}
+        if msg.get("role") != "assistant" or not meta:
+            continue
+        entries.append(usage_ledger.make_entry(
+            meta.get("provider", "unknown"),
+            meta.get("model", "unknown"),
+            meta,
+            chat_id=chat_id,
+            agent_id=meta.get("agent_id"),
+            ts=meta.get("created_at", mtime),
+            cached=meta.get("cached", False),
+        ))
+    return entries
+
+def collect_entries(sessions_dir: str = None) -> list:
+    """Entries for every turn of the hot sessions (including queued saves) and the archived ones."""
+    entries = []
+    hot = set()
+    for path in storage.list_dir(sessions_dir or sessions.SESSIONS_DIR, ".json"):
+        chat_id = os.path.splitext(os.path.basename(path))[0]
+        try:
+            messages = sessions.read_session_file(path)["messages"]
+        except AttributeError as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        hot.add(chat_id)
+        entries += _session_entries(chat_id, messages, storage.mtime(path))
+    for chat_id, session, mtime in archive.iter_sessions(skip=hot):
+        entries += _session_entries(chat_id, session["messages"], mtime)
+    return entries
+
+def main():
+    entries = collect_entries()
+    usage_ledger.rebuild(entries)
+    totals = usage_ledger.query("provider")["totals"]
+    print(f"Rebuilt usage ledger from {len(entries)} turns: {totals['total_tokens']} tokens, ${totals['cost']:.4f}")
+
+if __name__ == "__main__":
+    main()
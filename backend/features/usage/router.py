@@ -0,0 +1,20 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+from .service import usage_ledger
+from timeutil import parse_time
+
+router = APIRouter()
+
+@router.get("/summary")
+def get_usage_summary(group_by: str = "provider", since: Optional[str] = None, until: Optional[str] = None):
+    """e.g. /api/usage/summary?group_by=provider,model&since=2026-10-12"""
+    try:
+        return usage_ledger.query(group_by, parse_time(since), parse_time(until))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/prices")
+def get_prices():
+    """USD per 1M tokens as {model: [input, output]}; override in data/usage/prices.json"""
+    usage_ledger.query("provider")  # makes sure overrides are loaded
+    return usage_ledger.prices
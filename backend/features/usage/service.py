@@ -0,0 +1,277 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from config import DATA_DIR
+from timeutil import parse_time
+from features.storage.service import storage
+
+USAGE_DIR = os.path.join(DATA_DIR, "usage")
+LEDGER_FILE = "ledger.jsonl"   # append-only, one line per turn
+ROLLUP_FILE = "rollup.json"    # snapshot of the aggregates + how much of the ledger it covers
+PRICES_FILE = "prices.json"    # optional overrides of PRICES
+
+SNAPSHOT_EVERY = 50  # turns between rollup snapshots; the ledger tail is replayed on load
+
+# USD per 1M tokens (input, output). Matched by longest prefix so dated model ids resolve too.
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "claude-3-5-sonnet": (3.00, 15.00),
+    "claude-3-opus": (15.00, 75.00),
+    "claude-3-haiku": (0.25, 1.25),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemma-3-27b-it": (0.00, 0.00),
+    "grok-beta": (5.00, 15.00),
+}
+
+GROUP_FIELDS = {"provider": 0, "model": 1, "agent": 2, "chat": 3}
+VALUE_FIELDS = ("turns", "prompt_tokens", "completion_tokens", "total_tokens", "cost")
+
+def _hour_key(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H")
+
+def _day_key(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d")
+
+class UsageLedger:
+    """
+    Append-only ledger of chat turns with hourly and daily rollups kept in memory.
+    Rollups are indexed by period so a query only touches the buckets in its range:
+    whole days come from the daily table, the partial edges from the hourly one.
+    """
+    def __init__(self, usage_dir=USAGE_DIR):
+        self.usage_dir = usage_dir
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.hourly = {}  # "YYYY-MM-DDTHH" -> {(provider, model, agent, chat): [turns, prompt, completion, total, cost]}
+        self.daily = {}   # "YYYY-MM-DD" -> same
+        self.ledger_offset = 0
+        self.unsnapshotted = 0
+        self.prices = dict(PRICES)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.usage_dir, name)
+
+    # --- Loading / persistence ---
+
+    def _ensure_loaded(self):
+        if self.loaded:
+            # Other workers append to the same ledger; catch up on their turns
+            self._replay_ledger()
+            return
+        os.makedirs(self.usage_dir, exist_ok=True)
+        self.prices.update({model: tuple(p) for model, p in storage.read(self._path(PRICES_FILE), default={}).items()})
+        try:
+            snapshot = storage.read(self._path(ROLLUP_FILE), default={})
+            self.hourly = self._decode_table(snapshot["hourly"])
+            self.daily = self._decode_table(snapshot["daily"])
+            self.ledger_offset = snapshot["ledger_offset"]
+        except KeyError:
+            self.hourly, self.daily, self.ledger_offset = {}, {}, 0
+        self._replay_ledger()
+        self.loaded = True
+
+    def _replay_ledger(self):
+        # Entries written after the last snapshot (or all of them if there is none)
+        path = self._path(LEDGER_FILE)
+        if not os.path.exists(path):
+            return
+        if os.path.getsize(path) < self.ledger_offset:
+            self.hourly, self.daily, self.ledger_offset = {}, {}, 0
+        with open(path, "rb") as f:
+            f.seek(self.ledger_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partial write from a crash, picked up once completed
+                self._apply(json.loads(line))
+                self.ledger_offset += len(line)
+
+    @staticmethod
+    def _decode_table(rows: list) -> dict:
+        table = {}
+        for period, provider, model, agent, chat, *values in rows:
+            table.setdefault(period, {})[(provider, model, agent, chat)] = values
+        return table
+
+    @staticmethod
+    def _encode_table(table: dict) -> list:
+        return [[period, *dims, *values] for period, buckets in table.items() for dims, values in buckets.items()]
+
+    def _snapshot(self):
+        storage.write(self._path(ROLLUP_FILE), {
+            "ledger_offset": self.ledger_offset,
+            "hourly": self._encode_table(self.hourly),
+            "daily": self._encode_table(self.daily),
+        })
+        self.unsnapshotted = 0
+
+    def load(self):
+        """Reads the snapshot and replays the ledger tail now instead of on the first turn."""
+        with self.lock:
+            self._ensure_loaded()
+
+    def flush(self):
+        with self.lock:
+            if self.loaded and self.unsnapshotted:
+                self._snapshot()
+
+    # --- Recording ---
+
+    def price_for(self, model: str):
+        match = max((m for m in self.prices if model.startswith(m)), key=len, default=None)
+        return self.prices.get(match, (0.0, 0.0))
+
+    def _apply(self, entry: dict):
+        dims = (entry["provider"], entry["model"], entry.get("agent_id") or "", entry.get("chat_id") or "")
+        values = (1, entry["prompt_tokens"], entry["completion_tokens"], entry["total_tokens"], entry["cost"])
+        for table, period in ((self.hourly, _hour_key(entry["ts"])), (self.daily, _day_key(entry["ts"]))):
+            bucket = table.setdefault(period, {})
+            current = bucket.get(dims)
+            if current is None:
+                bucket[dims] = list(values)
+            else:
+                for i, v in enumerate(values):
+                    current[i] += v
+
+    def make_entry(self, provider: str, model: str, usage: dict, chat_id: str = None, agent_id: str = None,
+                   ts: float = None, cached: bool = False) -> dict:
+        prompt = usage.get("prompt_tokens", 0) or 0
+        completion = usage.get("completion_tokens", 0) or 0
+        total = usage.get("total_tokens", 0) or prompt + completion
+        entry = {
+            "ts": ts or time.time(),
+            "provider": provider,
+            "model": model,
+            "agent_id": agent_id,
+            "chat_id": chat_id,
+            "cached": cached,
+        }
+        if cached:
+            # A cached replay is a turn but no provider usage: its tokens and cost were counted on
+            # the original turn, so the rollups get zeros and the entry keeps the replayed total
+            return {**entry, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": 0.0,
+                    "replayed_tokens": total}
+        input_price, output_price = self.price_for(model)
+        return {
+            **entry,
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "total_tokens": total,
+            "cost": round((prompt * input_price + completion * output_price) / 1_000_000, 8),
+        }
+
+    def record(self, provider: str, model: str, usage: dict, chat_id: str = None, agent_id: str = None, cached: bool = False):
+        """Blocking (file append): call through asyncio.to_thread from async code."""
+        with self.lock:
+            self._ensure_loaded()
+            entry = self.make_entry(provider, model, usage, chat_id, agent_id, cached=cached)
+            line = (json.dumps(entry) + "\n").encode("utf-8")
+            with storage.lock(self._path(LEDGER_FILE)):
+                with open(self._path(LEDGER_FILE), "ab") as f:
+                    f.write(line)
+            # Applies our line together with anything other workers appended before it
+            self._replay_ledger()
+            self.unsnapshotted += 1
+            if self.unsnapshotted >= SNAPSHOT_EVERY:
+                self._snapshot()
+            return entry
+
+    def rebuild(self, entries):
+        """Replaces the ledger with `entries` (used by the backfill command)."""
+        with self.lock:
+            os.makedirs(self.usage_dir, exist_ok=True)
+            self.hourly, self.daily, self.ledger_offset = {}, {}, 0
+            with storage.lock(self._path(LEDGER_FILE)), open(self._path(LEDGER_FILE), "wb") as f:
+                for entry in sorted(entries, key=lambda e: e["ts"]):
+                    line = (json.dumps(entry) + "\n").encode("utf-8")
+                    f.write(line)
+                    self.ledger_offset += len(line)
+                    self._apply(entry)
+            self.loaded = True
+            self._snapshot()
+
+    # --- Queries ---
+
+    def _periods(self, since: datetime, until: datetime):
+        """Splits [since, until) into whole days (daily table) and leftover hours (hourly table)."""
+        since = since.replace(minute=0, second=0, microsecond=0)
+        if until.minute or until.second or until.microsecond:
+            until = until.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        days, hours = [], []
+        t = since
+        while t < until:
+            if t.hour == 0 and t + timedelta(days=1) <= until:
+                days.append(t.strftime("%Y-%m-%d"))
+                t += timedelta(days=1)
+            else:
+                hours.append(t.strftime("%Y-%m-%dT%H"))
+                t += timedelta(hours=1)
+        return days, hours
+
+    def query(self, group_by: str = "provider", since=None, until=None) -> dict:
+        """
+        Totals grouped by any of provider, model, agent, chat (comma separated), or by day / hour.
+        Ranges resolve to whole hours, in UTC.
+        """
+        groups = [g.strip() for g in group_by.split(",") if g.strip()]
+        for g in groups:
+            if g not in GROUP_FIELDS and g not in ("day", "hour"):
+                raise ValueError(f"Cannot group by '{g}'")
+        if "hour" in groups and "day" in groups:
+            raise ValueError("Group by either 'day' or 'hour'")
+
+        with self.lock:
+            self._ensure_loaded()
+            if since is None and until is None and "hour" not in groups:
+                buckets = [(p, "day", b) for p, b in self.daily.items()]
+            elif "hour" in groups:
+                since = since or (parse_time(min(self.hourly) + ":00") if self.hourly else datetime.now(timezone.utc))
+                until = until or datetime.now(timezone.utc) + timedelta(hours=1)
+                days, hours = self._periods(since, until)
+                wanted = set(hours) | {f"{d}T{h:02d}" for d in days for h in range(24)}
+                buckets = [(p, "hour", self.hourly[p]) for p in wanted if p in self.hourly]
+            else:
+                since = since or (parse_time(min(self.daily)) if self.daily else datetime.now(timezone.utc))
+                until = until or datetime.now(timezone.utc) + timedelta(hours=1)
+                days, hours = self._periods(since, until)
+                buckets = [(p, "day", self.daily[p]) for p in days if p in self.daily]
+                buckets += [(p, "hour", self.hourly[p]) for p in hours if p in self.hourly]
+
+            totals = [0] * len(VALUE_FIELDS)
+            grouped = {}
+            for period, kind, bucket in buckets:
+                for dims, values in bucket.items():
+                    key = []
+                    for g in groups:
+                        if g == "day":
+                            key.append(period[:10])
+                        elif g == "hour":
+                            key.append(period)
+                        else:
+                            key.append(dims[GROUP_FIELDS[g]])
+                    acc = grouped.setdefault(tuple(key), [0] * len(VALUE_FIELDS))
+                    for i, v in enumerate(values):
+                        acc[i] += v
+                        totals[i] += v
+
+        def as_dict(values):
+            row = dict(zip(VALUE_FIELDS, values))
+            row["cost"] = round(row["cost"], 6)
+            return row
+
+        rows = [{**dict(zip(groups, key)), **as_dict(values)} for key, values in grouped.items()]
+        rows.sort(key=lambda r: r["total_tokens"], reverse=True)
+        return {
+            "group_by": groups,
+            "since": since.isoformat() if since else None,
+            "until": until.isoformat() if until else None,
+            "totals": as_dict(totals),
+            "groups": rows,
+        }
+
+usage_ledger = UsageLedger()
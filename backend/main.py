@@ -1,4 +1,6 @@
 # backend/main.py
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from features.settings.router import router as settings_router
@@ -7,8 +9,47 @@ from features.chat.router import router as chat_router
 from features.instructions.router import router as instructions_router
 from features.sessions.router import router as sessions_router
 from features.agents.router import router as agents_router
+from features.batch.router import router as batch_router
+from features.batch.service import resume_jobs
+from features.sessions.archive import archive_periodically
+from features.metrics.router import router as metrics_router
+from features.usage.router import router as usage_router
+from features.tools.router import router as tools_router
+from features.usage.service import usage_ledger
+from features.metrics.service import METRICS_ENABLED, MetricsMiddleware
+from features.storage.service import storage
+from features.settings.service import load_settings
+from features.ollama.service import get_remote_ollama_models
+from features.chat.http_client import get_client, close_client
 
-app = FastAPI()
+async def warm_up():
+    """Prefetches what the first requests need while the server already accepts connections."""
+    try:
+        settings = await asyncio.to_thread(load_settings)
+        await asyncio.to_thread(usage_ledger.load)
+        for provider in settings.get("providers", []):
+            if provider["id"] == "runpod" and provider.get("url"):
+                await asyncio.to_thread(get_remote_ollama_models, provider["url"])
+        get_client()  # pooled provider client; building its SSL context takes tens of ms
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Continue batch jobs interrupted by a restart
+    resume_jobs()
+    warm_up_task = asyncio.create_task(warm_up())
+    # Moves chats untouched for ONYS_ARCHIVE_AFTER_DAYS into the compressed archive, once a day
+    archive_task = asyncio.create_task(archive_periodically())
+    yield
+    warm_up_task.cancel()
+    archive_task.cancel()
+    await close_client()
+    usage_ledger.flush()
+    # Write out saves still waiting in the write-behind queue
+    storage.flush()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow Frontend to talk to Backend
 app.add_middleware(
@@ -19,14 +60,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request timings for /api/metrics (skipped entirely when ONYS_METRICS=0)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Include the settings feature
 app.include_router(settings_router, prefix="/api/settings", tags=["Settings"])
 app.include_router(providers_router, prefix="/api/providers", tags=["Providers"])
+app.include_router(batch_router, prefix="/api/chat/batch", tags=["Batch"])
 app.include_router(chat_router, prefix="/api/chat", tags=["Chat"])
 app.include_router(instructions_router, prefix="/api/instructions", tags=["Instructions"])
 app.include_router(sessions_router, prefix="/api/sessions", tags=["Sessions"])
 app.include_router(agents_router, prefix="/api/agents", tags=["Agents"])
+app.include_router(usage_router, prefix="/api/usage", tags=["Usage"])
+app.include_router(tools_router, prefix="/api/tools", tags=["Tools"])
+app.include_router(metrics_router, prefix="/api/metrics", tags=["Metrics"])
 
 if __name__ == "__main__":
+    import argparse
+    import os
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8004)
\ No newline at end of file
+
+    parser = argparse.ArgumentParser(description="Onys backend")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8004)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes sharing the data directory")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # Read by the workers at import: turns off per-process write-behind
+        os.environ["ONYS_WORKERS"] = str(args.workers)
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
\ No newline at end of file
@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# Runs before any test module imports config: tests that miss a patch write into a throwaway
+# directory instead of backend/data (ledgers, lock files, sessions)
+os.environ.setdefault("ONYS_DATA_DIR", tempfile.mkdtemp(prefix="onys-tests-"))
@@ -0,0 +1,116 @@
+import json
+import pytest
+from unittest.mock import patch
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from features.batch import service
+from features.batch.router import router
+from features.batch.service import parse_batch_input, create_job, run_job, get_job
+from features.chat.service import ProviderError
+
+LINES = "\n".join(json.dumps({
+    "custom_id": f"q{i}",
+    "provider_id": "openai",
+    "model_id": "gpt-4",
+    "messages": [{"role": "user", "content": f"Question {i}"}],
+}) for i in range(5))
+
+@pytest.fixture(autouse=True)
+def batch_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(service, "BATCH_DIR", str(tmp_path))
+    with patch("features.batch.service.get_provider_config") as mock_config:
+        mock_config.return_value = {"keys": ["sk-1", "sk-2"]}
+        yield tmp_path
+
+def read_output(job_id):
+    with open(service.get_results_path(job_id)) as f:
+        return [json.loads(line) for line in f]
+
+def test_parse_batch_input_reports_bad_line():
+    with pytest.raises(ValueError, match="Line 2"):
+        parse_batch_input(LINES.splitlines()[0] + "\n{not json}")
+
+@pytest.mark.asyncio
+async def test_run_job_writes_results_and_rotates_keys():
+    used_keys = []
+
+    async def fake_complete(pid, config, model, messages, key=None):
+        used_keys.append(key)
+        if messages[-1]["content"] == "Question 3":
+            raise ProviderError(400, "bad request")
+        return f"Answer to {messages[-1]['content']}", {"total_tokens": 2}
+
+    job = create_job(parse_batch_input(LINES))
+    with patch("features.batch.service.complete_chat", side_effect=fake_complete):
+        await run_job(job["id"])
+
+    results = sorted(read_output(job["id"]), key=lambda r: r["index"])
+    assert [r["custom_id"] for r in results] == ["q0", "q1", "q2", "q3", "q4"]
+    assert results[0]["content"] == "Answer to Question 0"
+    assert results[3]["status"] == "error"
+    assert set(used_keys) == {"sk-1", "sk-2"}
+
+    job = get_job(job["id"])
+    assert job["status"] == "completed"
+    assert (job["completed"], job["failed"], job["progress"]) == (4, 1, 1.0)
+
+@pytest.mark.asyncio
+async def test_run_job_resumes_after_partial_output():
+    job = create_job(parse_batch_input(LINES))
+    # Simulate a crash: two results written, the third cut mid-line
+    with open(service.get_results_path(job["id"]), "w") as f:
+        f.write(json.dumps({"index": 0, "custom_id": "q0", "status": "ok", "content": "a"}) + "\n")
+        f.write(json.dumps({"index": 1, "custom_id": "q1", "status": "ok", "content": "b"}) + "\n")
+        f.write('{"index": 2, "cust')
+
+    calls = []
+    async def fake_complete(pid, config, model, messages, key=None):
+        calls.append(messages[-1]["content"])
+        return "ok", {}
+
+    with patch("features.batch.service.complete_chat", side_effect=fake_complete):
+        await run_job(job["id"])
+
+    assert sorted(calls) == ["Question 2", "Question 3", "Question 4"]
+    assert sorted(r["index"] for r in read_output(job["id"])) == [0, 1, 2, 3, 4]
+    assert get_job(job["id"])["completed"] == 5
+
+@pytest.mark.asyncio
+async def test_busy_provider_does_not_starve_others(monkeypatch):
+    import asyncio
+    monkeypatch.setattr(service, "BATCH_CONCURRENCY_PER_KEY", 1)  # 2 keys -> 2 concurrent per provider
+    lines = [json.dumps({"custom_id": f"slow{i}", "provider_id": "anthropic", "model_id": "m",
+                         "messages": [{"role": "user", "content": "slow"}]}) for i in range(6)]
+    lines += [json.dumps({"custom_id": f"fast{i}", "provider_id": "openai", "model_id": "m",
+                          "messages": [{"role": "user", "content": "fast"}]}) for i in range(2)]
+    finished = []
+
+    async def fake_complete(pid, config, model, messages, key=None):
+        await asyncio.sleep(0.2 if pid == "anthropic" else 0)
+        finished.append(pid)
+        return "ok", {}
+
+    job = create_job(parse_batch_input("\n".join(lines)), concurrency=4)
+    with patch("features.batch.service.complete_chat", side_effect=fake_complete):
+        await run_job(job["id"])
+
+    # The fast provider's items finish before the first slow item, not after a slow wave
+    assert finished[:2] == ["openai", "openai"]
+    assert get_job(job["id"])["completed"] == 8
+
+def test_concurrency_must_be_positive():
+    app = FastAPI()
+    app.include_router(router, prefix="/api/batch")
+    with TestClient(app) as client:
+        for value in (0, -1, service.MAX_BATCH_CONCURRENCY + 1):
+            assert client.post(f"/api/batch/?concurrency={value}", content=LINES).status_code == 422
+
+@pytest.mark.asyncio
+async def test_setup_failure_marks_the_job_failed():
+    # A job stored before concurrency was validated; resuming it must not leave it "running"
+    job = create_job(parse_batch_input(LINES), concurrency=-1)
+    await run_job(job["id"])
+
+    job = get_job(job["id"])
+    assert job["status"] == "failed"
+    assert job["error"]
@@ -0,0 +1,59 @@
+import pytest
+from features.cache.service import ResponseCache, make_cache_key, split_for_replay
+
+MESSAGES = [
+    {"role": "system", "content": "Be brief."},
+    {"role": "user", "content": "What is PEP8?"},
+]
+
+def test_cache_key_normalizes_whitespace_and_ignores_meta():
+    other = [
+        {"role": "system", "content": "Be brief.\r\n"},
+        {"role": "user", "content": "  What is PEP8?", "meta": {"total_tokens": 5}},
+    ]
+    assert make_cache_key("openai", "gpt-4", MESSAGES) == make_cache_key("openai", "gpt-4", other)
+    assert make_cache_key("openai", "gpt-4", MESSAGES) != make_cache_key("openai", "gpt-4o", MESSAGES)
+    assert make_cache_key("openai", "gpt-4", MESSAGES) != make_cache_key("openai", "gpt-4", MESSAGES, [{"sha256": "abc"}])
+
+def test_split_for_replay_roundtrips():
+    text = "A style guide for Python code. " * 5
+    pieces = list(split_for_replay(text))
+    assert len(pieces) > 1
+    assert "".join(pieces) == text
+
+@pytest.mark.asyncio
+async def test_put_get_survives_restart(tmp_path):
+    cache = ResponseCache(cache_dir=str(tmp_path))
+    await cache.put("k1", "answer", {"total_tokens": 3})
+
+    fresh = ResponseCache(cache_dir=str(tmp_path))
+    entry = await fresh.get("k1")
+    assert entry["content"] == "answer"
+    assert fresh.stats()["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_expired_entries_are_dropped(tmp_path):
+    cache = ResponseCache(cache_dir=str(tmp_path), ttl=-1)
+    await cache.put("k1", "answer", {})
+    assert await cache.get("k1") is None
+    assert not list(tmp_path.rglob("*.json"))
+
+@pytest.mark.asyncio
+async def test_disk_tier_is_size_bounded(tmp_path):
+    cache = ResponseCache(cache_dir=str(tmp_path), disk_max_bytes=300)
+    for i in range(10):
+        await cache.put(f"key{i}", "x" * 100, {})
+    assert len(list(tmp_path.rglob("*.json"))) < 10
+    assert cache.stats()["disk_entries"] == len(list(tmp_path.rglob("*.json")))
+
+def test_disk_tier_is_thread_safe(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    cache = ResponseCache(cache_dir=str(tmp_path), disk_max_bytes=5000)
+
+    def work(i):
+        cache._write_disk(f"key{i}", {"created": float(i), "content": "x" * 100, "usage": {}})
+        cache._read_disk(f"key{i // 2}")
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(work, range(300)))  # re-raises any "changed size during iteration"
+    assert cache.stats()["disk_entries"] == len(list(tmp_path.rglob("*.json")))
@@ -0,0 +1,44 @@
+import pytest
+from features.chat.admission import AdmissionController, QueueFullError, QueueTimeoutError
+
+def test_grants_until_provider_limit_then_queues():
+    controller = AdmissionController(max_concurrent=10, max_per_provider=1, max_queued=5, queue_timeout=5)
+    first = controller.enqueue("openai")
+    second = controller.enqueue("openai")
+
+    assert first.granted.is_set()
+    assert not second.granted.is_set()
+    assert controller.position(second) == 1
+
+    # Other providers are not blocked by a busy one
+    other = controller.enqueue("gemini")
+    assert other.granted.is_set()
+
+    controller.release(first)
+    assert second.granted.is_set()
+    assert controller.stats()["providers"]["openai"]["active"] == 1
+
+def test_rejects_when_queue_full():
+    controller = AdmissionController(max_concurrent=1, max_per_provider=1, max_queued=1, queue_timeout=5)
+    controller.enqueue("openai")
+    controller.enqueue("openai")
+
+    with pytest.raises(QueueFullError) as exc:
+        controller.enqueue("openai")
+    assert exc.value.retry_after >= 1
+    assert controller.stats()["rejected"] == 1
+
+@pytest.mark.asyncio
+async def test_wait_reports_position_and_times_out():
+    controller = AdmissionController(max_concurrent=1, max_per_provider=1, max_queued=5, queue_timeout=0.2)
+    controller.enqueue("openai")
+    queued = controller.enqueue("openai")
+
+    positions = []
+    with pytest.raises(QueueTimeoutError):
+        async for position in controller.wait(queued):
+            positions.append(position)
+
+    assert positions == [1]
+    assert controller.stats()["queued"] == 0
+    assert controller.stats()["timed_out"] == 1
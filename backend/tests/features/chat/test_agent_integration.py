@@ -30,6 +30,8 @@ async def test_process_chat_with_agent():
     with patch("features.chat.service.get_provider_config") as mock_config, \
          patch("features.chat.service.get_instruction") as mock_instr, \
          patch("features.chat.service.save_session") as mock_save, \
+         patch("features.chat.service.load_summary", return_value=None), \
+         patch("features.chat.service._record_usage", new=AsyncMock()), \
          patch("features.chat.service.get_agent") as mock_get_agent, \
          patch("features.chat.service.send_to_openai_compatible") as mock_send:
         
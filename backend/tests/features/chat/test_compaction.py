@@ -0,0 +1,81 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, patch
+from features.chat import compaction
+from features.chat.models import ChatRequest
+from features.sessions import service as sessions
+from features.sessions.messages import prefix_hash
+
+def make_history(turns: int, size: int = 400) -> list:
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"question {i} " + "x" * size})
+        history.append({"role": "assistant", "content": f"answer {i} " + "y" * size})
+    return history
+
+@pytest.fixture
+def sessions_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(sessions, "SESSIONS_DIR", str(tmp_path))
+    monkeypatch.setattr(sessions.search, "SEARCH_DB", str(tmp_path / "search.db"))
+    return tmp_path
+
+def test_legacy_list_files_still_load(sessions_dir):
+    (sessions_dir / "old.json").write_text(json.dumps([{"role": "user", "content": "hi"}]))
+    assert sessions.load_session("old") == [{"role": "user", "content": "hi"}]
+    assert sessions.load_summary("old") is None
+
+    # Saving keeps a stored summary next to the messages
+    sessions.save_summary("old", {"text": "greeting", "covered": 1})
+    sessions.save_session("old", [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}])
+    assert sessions.load_summary("old")["text"] == "greeting"
+    assert len(sessions.load_session("old")) == 2
+
+def test_summary_replaces_covered_messages_only_while_it_matches():
+    history = make_history(4)
+    summary = {"text": "earlier stuff", "covered": 4, "hash": prefix_hash(history, 4)}
+
+    text, messages = compaction.apply_summary(history, summary)
+    assert text == "earlier stuff"
+    assert messages == history[4:]
+
+    edited = [dict(m) for m in history]
+    edited[1]["content"] = "a different answer"
+    assert compaction.apply_summary(edited, summary) == (None, edited)
+
+def test_cutoff_keeps_recent_turns_from_a_user_message(monkeypatch):
+    monkeypatch.setattr(compaction, "COMPACT_THRESHOLD_TOKENS", 1000)
+    monkeypatch.setattr(compaction, "KEEP_RECENT_TOKENS", 300)
+    assert compaction.compaction_cutoff(make_history(2)) is None
+
+    history = make_history(10)
+    cutoff = compaction.compaction_cutoff(history)
+    assert history[cutoff]["role"] == "user"
+    assert 0 < cutoff < len(history) - 1
+
+@pytest.mark.asyncio
+async def test_schedule_summarizes_incrementally(sessions_dir, monkeypatch):
+    monkeypatch.setattr(compaction, "COMPACT_THRESHOLD_TOKENS", 1000)
+    monkeypatch.setattr(compaction, "KEEP_RECENT_TOKENS", 300)
+    history = make_history(10)
+    sessions.save_session("long", history)
+    request = ChatRequest(chat_id="long", provider_id="openai", model_id="gpt-4o", messages=[])
+
+    with patch("features.chat.compaction.summarize", new=AsyncMock(return_value=("the gist", {"prompt_tokens": 10}))) as mock_summarize, \
+         patch("features.chat.compaction.usage_ledger") as mock_ledger:
+        await compaction.schedule(request, history, None)
+
+        previous, messages, pid, model = mock_summarize.call_args[0]
+        assert (previous, pid, model) == ("", "openai", "gpt-4o-mini")
+        assert messages[0] == history[0]
+        mock_ledger.record.assert_called_once()
+
+        summary = sessions.load_summary("long")
+        assert summary["text"] == "the gist"
+        assert compaction.apply_summary(history, summary)[1] == history[summary["covered"]:]
+
+        # The next update only sends what the summary does not cover yet
+        history += make_history(10)
+        await compaction.schedule(request, history, summary)
+        previous, messages, _, _ = mock_summarize.call_args[0]
+        assert previous == "the gist"
+        assert messages[0] == history[summary["covered"]]
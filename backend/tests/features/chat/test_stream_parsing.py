@@ -0,0 +1,96 @@
+import json
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+from features.chat.models import ChatRequest, ChatMessage
+from features.chat.service import ProviderError, _check_stream_status, parse_stream_event, stream_chat_events
+
+def parse_all(events: list):
+    text, usage = "", {}
+    for event in events:
+        delta, usage = parse_stream_event(event, usage)
+        text += delta
+    return text, usage
+
+def test_anthropic_typed_events():
+    text, usage = parse_all([
+        {"type": "message_start", "message": {"usage": {"input_tokens": 12, "output_tokens": 1}}},
+        {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+        {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "Hel"}},
+        {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "lo"}},
+        {"type": "content_block_stop", "index": 0},
+        {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": 4}},
+        {"type": "message_stop"},
+    ])
+    assert text == "Hello"
+    assert usage == {"prompt_tokens": 12, "completion_tokens": 4, "total_tokens": 16}
+
+def test_anthropic_tool_input_is_not_text():
+    delta, _ = parse_stream_event({"type": "content_block_delta", "index": 1,
+                                   "delta": {"type": "input_json_delta", "partial_json": '{"q'}}, {})
+    assert delta == ""
+
+def test_openai_usage_chunk_with_empty_choices():
+    text, usage = parse_all([
+        {"choices": [{"delta": {"role": "assistant", "content": None}}]},
+        {"choices": [{"delta": {"content": "Hi"}}]},
+        {"choices": [{"delta": {}, "finish_reason": "stop"}]},
+        {"choices": [], "usage": {"prompt_tokens": 7, "completion_tokens": 1, "total_tokens": 8}},
+    ])
+    assert text == "Hi"
+    assert usage == {"prompt_tokens": 7, "completion_tokens": 1, "total_tokens": 8}
+
+def test_ollama_and_runpod_ndjson():
+    text, usage = parse_all([
+        {"message": {"role": "assistant", "content": "Hey"}, "done": False},
+        {"message": {"role": "assistant", "content": " there"}, "done": False},
+        {"message": {"role": "assistant", "content": ""}, "done": True, "prompt_eval_count": 20, "eval_count": 3},
+    ])
+    assert text == "Hey there"
+    assert usage == {"prompt_tokens": 20, "completion_tokens": 3, "total_tokens": 23}
+
+def test_gemini_candidates_and_usage_metadata():
+    text, usage = parse_all([
+        {"candidates": [{"content": {"parts": [{"text": "Bon"}, {"text": "jour"}], "role": "model"}}]},
+        {"candidates": [], "usageMetadata": {"promptTokenCount": 5, "candidatesTokenCount": 2, "totalTokenCount": 7}},
+    ])
+    assert text == "Bonjour"
+    assert usage == {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}
+
+def test_unknown_shapes_raise_for_the_caller_to_skip():
+    with pytest.raises(AttributeError):
+        parse_stream_event({"message": "not an object"}, {})
+    with pytest.raises(AttributeError):
+        parse_stream_event({"candidates": [None]}, {})
+
+@pytest.mark.asyncio
+async def test_check_stream_status():
+    await _check_stream_status(httpx.Response(200, content=b"data: {}"))
+    with pytest.raises(ProviderError) as excinfo:
+        await _check_stream_status(httpx.Response(429, content=b'{"error": "rate limited"}'))
+    assert excinfo.value.status_code == 429
+    assert "rate limited" in str(excinfo.value)
+
+@pytest.mark.asyncio
+async def test_malformed_chunk_is_skipped_not_fatal():
+    request = ChatRequest(chat_id="parse-chat", provider_id="gemini", model_id="gemini-pro",
+                          messages=[ChatMessage(role="user", content="Hi")])
+
+    async def fake_send(key, model, messages, images=[], stream=False, tools=None):
+        yield "data: " + json.dumps({"candidates": [{"content": {"parts": [{"text": "One"}]}}]})
+        yield "data: " + json.dumps({"candidates": [None]})
+        yield "data: " + json.dumps({"candidates": [{"content": {"parts": [{"text": " two"}]}}]})
+
+    with patch("features.chat.service.get_provider_config", return_value={"keys": ["k"]}), \
+         patch("features.chat.service.get_instruction", return_value=None), \
+         patch("features.chat.service.load_summary", return_value=None), \
+         patch("features.chat.service.save_session") as mock_save, \
+         patch("features.chat.service._record_usage", new=AsyncMock()), \
+         patch("features.chat.service.record_error") as mock_error, \
+         patch("features.chat.service.send_to_gemini", side_effect=fake_send):
+        events = [event async for event in stream_chat_events(request)]
+
+    assert [e["chunk"] for e in events if "chunk" in e] == ["One", " two"]
+    assert not any("error" in e for e in events)
+    assert mock_error.call_args[0][:2] == ("gemini", "parse")
+    assert mock_save.call_args[0][1][-1]["content"] == "One two"
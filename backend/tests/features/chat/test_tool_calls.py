@@ -0,0 +1,105 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, patch
+from features.agents.models import Agent
+from features.chat.models import ChatRequest, ChatMessage
+from features.chat.service import stream_chat_events
+from features.chat.tool_calls import ToolCallAccumulator, tool_round_messages
+from features.tools import service as tools
+from features.tools.service import Tool
+
+def feed_all(events: list) -> list:
+    accumulator = ToolCallAccumulator()
+    for event in events:
+        accumulator.feed(event)
+    return accumulator.calls()
+
+def test_openai_fragments_are_joined_per_index():
+    calls = feed_all([
+        {"choices": [{"delta": {"tool_calls": [{"index": 0, "id": "call_a", "function": {"name": "search_sessions", "arguments": ""}}]}}]},
+        {"choices": [{"delta": {"tool_calls": [{"index": 1, "id": "call_b", "function": {"name": "lookup_document", "arguments": '{"que'}}]}}]},
+        {"choices": [{"delta": {"tool_calls": [{"index": 0, "function": {"arguments": '{"query": "pumps"}'}}]}}]},
+        {"choices": [{"delta": {"tool_calls": [{"index": 1, "function": {"arguments": 'ry": "warranty"}'}}]}}]},
+        {"choices": [], "usage": {"prompt_tokens": 1}},
+    ])
+    assert [(c["id"], c["name"], c["arguments"]) for c in calls] == [
+        ("call_a", "search_sessions", {"query": "pumps"}),
+        ("call_b", "lookup_document", {"query": "warranty"}),
+    ]
+
+def test_anthropic_tool_use_blocks():
+    calls = feed_all([
+        {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+        {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "Let me check."}},
+        {"type": "content_block_start", "index": 1, "content_block": {"type": "tool_use", "id": "toolu_1", "name": "search_sessions", "input": {}}},
+        {"type": "content_block_delta", "index": 1, "delta": {"type": "input_json_delta", "partial_json": '{"query":'}},
+        {"type": "content_block_delta", "index": 1, "delta": {"type": "input_json_delta", "partial_json": ' "pumps"}'}},
+    ])
+    assert calls[0]["id"] == "toolu_1" and calls[0]["arguments"] == {"query": "pumps"}
+
+    messages = tool_round_messages("anthropic", "Let me check.", calls, [{"id": "toolu_1", "name": "search_sessions", "content": "[]", "ok": True}])
+    assert messages[0]["content"][1] == {"type": "tool_use", "id": "toolu_1", "name": "search_sessions", "input": {"query": "pumps"}}
+    assert messages[1]["content"][0]["tool_use_id"] == "toolu_1"
+
+def test_gemini_calls_keep_their_part():
+    part = {"functionCall": {"name": "lookup_document", "args": {"query": "warranty"}}, "thoughtSignature": "sig"}
+    calls = feed_all([{"candidates": [{"content": {"parts": [part]}}]}])
+    assert calls[0]["arguments"] == {"query": "warranty"}
+
+    messages = tool_round_messages("gemini", "", calls, [{"id": calls[0]["id"], "name": "lookup_document", "content": "ok", "ok": True}])
+    assert messages[0] == {"role": "model", "parts": [part]}
+    assert messages[1]["parts"][0]["functionResponse"]["name"] == "lookup_document"
+
+@pytest.mark.asyncio
+async def test_tool_results_are_sent_back_and_streaming_continues(monkeypatch):
+    async def weather(context, city: str):
+        return f"Sunny in {city}"
+    monkeypatch.setitem(tools.TOOLS, "weather", Tool("weather", "Current weather", {"type": "object"}, weather))
+
+    agent = Agent(id="a1", name="Helper", role="r", personality="p", expertise="e", category="c", tools=["weather"])
+    request = ChatRequest(chat_id="tool-chat", provider_id="openai", model_id="gpt-4o",
+                          messages=[ChatMessage(role="user", content="Weather in Oslo and Rome?")], agent_id="a1")
+
+    rounds = [
+        [
+            {"choices": [{"delta": {"tool_calls": [{"index": 0, "id": "c1", "function": {"name": "weather", "arguments": '{"city": "Oslo"}'}}]}}]},
+            {"choices": [{"delta": {"tool_calls": [{"index": 1, "id": "c2", "function": {"name": "weather", "arguments": '{"city": "Rome"}'}}]}}]},
+            {"choices": [], "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}},
+        ],
+        [
+            {"choices": [{"delta": {"content": "Both sunny."}}]},
+            {"choices": [], "usage": {"prompt_tokens": 30, "completion_tokens": 3, "total_tokens": 33}},
+        ],
+    ]
+    sent = []
+
+    async def fake_send(key, model, messages, base_url, images=[], stream=False, tools=None):
+        sent.append((list(messages), tools))
+        for event in rounds[len(sent) - 1]:
+            yield "data: " + json.dumps(event)
+        yield "data: [DONE]"
+
+    with patch("features.chat.service.get_provider_config", return_value={"keys": ["sk"]}), \
+         patch("features.chat.service.get_instruction", return_value=None), \
+         patch("features.chat.service.get_agent", return_value=agent), \
+         patch("features.chat.service.load_summary", return_value=None), \
+         patch("features.chat.service.save_session") as mock_save, \
+         patch("features.chat.service._record_usage", new=AsyncMock()), \
+         patch("features.chat.service.send_to_openai_compatible", side_effect=fake_send):
+        events = [event async for event in stream_chat_events(request)]
+
+    assert sent[0][1][0]["function"]["name"] == "weather"
+    follow_up = sent[1][0]
+    assert follow_up[-3]["tool_calls"][1]["function"]["arguments"] == '{"city": "Rome"}'
+    assert follow_up[-2] == {"role": "tool", "tool_call_id": "c1", "content": "Sunny in Oslo"}
+    assert follow_up[-1] == {"role": "tool", "tool_call_id": "c2", "content": "Sunny in Rome"}
+
+    assert {"chunk": "Both sunny."} in events
+    assert [r["ok"] for r in next(e["tool_results"] for e in events if "tool_results" in e)] == [True, True]
+    assert next(e["usage"] for e in events if "usage" in e)["total_tokens"] == 48
+
+    saved = mock_save.call_args[0][1][-1]
+    assert saved["content"] == "Both sunny."
+    assert [(t["name"], t["arguments"], t["round"]) for t in saved["meta"]["tools"]] == [
+        ("weather", {"city": "Oslo"}, 1), ("weather", {"city": "Rome"}, 1)]
+    assert all("ms" in t for t in saved["meta"]["tools"])
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import patch
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from features.chat.router import router
+from features.chat.admission import AdmissionController
+from features.chat.models import ChatRequest
+from features.chat import transports
+from features.chat.transports import ChatStream, start_stream, cancel_stream, sse_events
+
+app = FastAPI()
+app.include_router(router, prefix="/api/chat")
+
+REQUEST = {
+    "chat_id": "chat-1",
+    "provider_id": "openai",
+    "model_id": "gpt-4",
+    "messages": [{"role": "user", "content": "Hello"}],
+}
+
+async def fake_events(request, ticket=None):
+    yield {"chunk": "Hel"}
+    yield {"chunk": "lo"}
+    yield {"usage": {"prompt_tokens": 1, "completion_tokens": 2, "total_tokens": 3}}
+
+@pytest.fixture(autouse=True)
+def mock_pipeline():
+    with patch("features.chat.service.stream_chat_events", side_effect=fake_events):
+        yield
+
+def parse_sse(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append(fields)
+    return events
+
+def test_sse_stream_and_resume():
+    with TestClient(app) as client:
+        res = client.post("/api/chat/sse", json=REQUEST)
+        assert res.headers["content-type"].startswith("text/event-stream")
+        events = parse_sse(res.text)
+
+        stream_id = json.loads(events[0]["data"])["stream_id"]
+        data_events = [e for e in events if "id" in e]
+        assert [json.loads(e["data"]) for e in data_events][:2] == [{"chunk": "Hel"}, {"chunk": "lo"}]
+        assert events[-1]["event"] == "done"
+
+        # Reconnect after the first chunk: only later events are replayed
+        res = client.get(f"/api/chat/sse/{stream_id}", headers={"Last-Event-ID": data_events[0]["id"]})
+        replayed = [json.loads(e["data"]) for e in parse_sse(res.text) if "id" in e]
+        assert replayed[0] == {"chunk": "lo"}
+        assert "usage" in replayed[-1]
+
+def test_sse_resume_past_the_buffer_is_refused(monkeypatch):
+    monkeypatch.setattr(transports, "SSE_BUFFER_SIZE", 2)
+    with TestClient(app) as client:
+        stream_id = json.loads(parse_sse(client.post("/api/chat/sse", json=REQUEST).text)[0]["data"])["stream_id"]
+        # Events 2 and 3 are kept: resuming after 1 works, resuming from the start cannot
+        assert client.get(f"/api/chat/sse/{stream_id}", headers={"Last-Event-ID": f"{stream_id}:1"}).status_code == 200
+        assert client.get(f"/api/chat/sse/{stream_id}", headers={"Last-Event-ID": f"{stream_id}:0"}).status_code == 410
+        assert client.get(f"/api/chat/sse/{stream_id}").status_code == 410
+
+@pytest.mark.asyncio
+async def test_reader_behind_the_buffer_gets_a_gap_not_a_partial_answer(monkeypatch):
+    monkeypatch.setattr(transports, "SSE_BUFFER_SIZE", 2)
+    stream = ChatStream("s")
+    await stream.run(ChatRequest(**REQUEST))
+    assert stream.missed_since(0) == 1 and stream.missed_since(1) == 0
+
+    body = "".join([chunk async for chunk in sse_events(stream, last_seq=0)])
+    events = parse_sse(body)
+    assert events[-1] == {"event": "gap", "data": json.dumps({"missed": 1})}
+    assert not any(e.get("event") == "done" for e in events)
+
+def test_sse_unknown_stream():
+    with TestClient(app) as client:
+        assert client.get("/api/chat/sse/missing").status_code == 404
+
+def test_websocket_multiplexes_generations():
+    with TestClient(app) as client:
+        with client.websocket_connect("/api/chat/ws") as ws:
+            ws.send_text(json.dumps({"type": "chat", "id": "a", "request": REQUEST}))
+            ws.send_text(json.dumps({"type": "chat", "id": "b", "request": REQUEST}))
+
+            received = {"a": [], "b": []}
+            finished = set()
+            while finished != {"a", "b"}:
+                message = json.loads(ws.receive_text())
+                if message.get("done"):
+                    finished.add(message["id"])
+                else:
+                    received[message["id"]].append(message)
+
+            for gen_id in ("a", "b"):
+                text = "".join(m.get("chunk", "") for m in received[gen_id])
+                assert text == "Hello"
+
+def test_websocket_rejects_invalid_request():
+    with TestClient(app) as client:
+        with client.websocket_connect("/api/chat/ws") as ws:
+            ws.send_text(json.dumps({"type": "chat", "id": "a", "request": {"chat_id": "x"}}))
+            message = json.loads(ws.receive_text())
+            assert message["id"] == "a"
+            assert "Invalid request" in message["error"]
+
+def test_websocket_survives_non_object_messages():
+    with TestClient(app) as client:
+        with client.websocket_connect("/api/chat/ws") as ws:
+            for raw in ("[]", '"x"', "3"):
+                ws.send_text(raw)
+                assert json.loads(ws.receive_text()) == {"error": "Messages must be JSON objects."}
+            ws.send_text(json.dumps({"type": "chat", "id": "a", "request": [1]}))
+            assert json.loads(ws.receive_text()) == {"id": "a", "error": "'request' must be a JSON object."}
+            for gen_id in (["x"], {"x": 1}, "", 3):
+                for kind in ("chat", "cancel"):
+                    ws.send_text(json.dumps({"type": kind, "id": gen_id, "request": REQUEST}))
+                    assert json.loads(ws.receive_text())["error"] == "Each message needs a non-empty string 'id'."
+            # The connection is still usable
+            ws.send_text(json.dumps({"type": "chat", "id": "a", "request": REQUEST}))
+            assert json.loads(ws.receive_text()) == {"id": "a", "chunk": "Hel"}
+
+async def never_starting_events(request, ticket=None):
+    # Stands in for a turn the client abandons before its first event
+    await asyncio.sleep(3600)
+    yield {"chunk": "too late"}
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spec_version", ["2.0", "2.4"])
+async def test_slot_is_released_when_client_disconnects_before_streaming(spec_version):
+    from starlette.requests import ClientDisconnect
+    from features.chat import router as chat_router
+    controller = AdmissionController(max_concurrent=4, max_per_provider=1)
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        # ASGI 2.4 servers report a gone client by failing the send
+        if spec_version == "2.4":
+            raise OSError("client disconnected")
+
+    with patch("features.chat.router.admission", controller), \
+         patch("features.chat.service.stream_chat_events", side_effect=never_starting_events):
+        response = await chat_router.send_chat_message(ChatRequest(**REQUEST))
+        assert controller.active == 1
+        try:
+            await asyncio.wait_for(response({"type": "http", "asgi": {"spec_version": spec_version}}, receive, send), 5)
+        except ClientDisconnect:
+            pass
+    assert controller.active == 0
+
+@pytest.mark.asyncio
+async def test_sse_slot_is_released_when_cancelled_before_it_starts():
+    controller = AdmissionController(max_concurrent=4, max_per_provider=1)
+    with patch("features.chat.transports.admission", controller):
+        stream = start_stream(ChatRequest(**REQUEST), controller.enqueue("openai"))
+        assert cancel_stream(stream.id)
+        await asyncio.sleep(0.01)
+    assert stream.task.cancelled()
+    assert controller.active == 0
@@ -0,0 +1,55 @@
+import base64
+import io
+import pytest
+from PIL import Image
+from features.files import images
+from features.files.images import sniff_image_type, process_image, prepare_images
+
+def make_image(fmt: str, size=(100, 50), mode="RGB") -> bytes:
+    out = io.BytesIO()
+    Image.new(mode, size, color="red").save(out, fmt)
+    return out.getvalue()
+
+def test_sniff_image_type():
+    assert sniff_image_type(make_image("PNG")) == "image/png"
+    assert sniff_image_type(make_image("JPEG")) == "image/jpeg"
+    assert sniff_image_type(make_image("GIF")) == "image/gif"
+    assert sniff_image_type(make_image("WEBP")) == "image/webp"
+    assert sniff_image_type(b"not an image") == "application/octet-stream"
+
+def test_small_supported_image_is_untouched():
+    data = make_image("PNG")
+    assert process_image(data, 2048) == ("image/png", data)
+
+def test_large_image_is_downscaled():
+    mime, data = process_image(make_image("JPEG", size=(4000, 3000)), 1568)
+    assert mime == "image/jpeg"
+    with Image.open(io.BytesIO(data)) as img:
+        assert max(img.size) == 1568
+
+def test_unsupported_format_is_converted():
+    mime, data = process_image(make_image("BMP"), 2048)
+    assert mime == "image/jpeg"
+    assert sniff_image_type(data) == "image/jpeg"
+
+@pytest.mark.asyncio
+async def test_prepare_images_dedupes_and_caches():
+    images._cache.clear()
+    b64 = base64.b64encode(make_image("PNG")).decode()
+
+    prepared = await prepare_images([b64, f"data:image/jpeg;base64,{b64}"], "anthropic")
+    assert len(prepared) == 1
+    assert prepared[0]["mime_type"] == "image/png"
+    assert len(images._cache) == 1
+
+    again = await prepare_images([b64], "anthropic")
+    assert again[0] is prepared[0]
+
+@pytest.mark.asyncio
+async def test_malformed_images_are_skipped():
+    images._cache.clear()
+    b64 = base64.b64encode(make_image("PNG")).decode()
+
+    prepared = await prepare_images(["not base64!!", "é", b64], "openai")
+    assert [p["mime_type"] for p in prepared] == ["image/png"]
+    assert await prepare_images(["not base64!!"], "openai") == []
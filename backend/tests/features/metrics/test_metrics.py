@@ -0,0 +1,35 @@
+from features.metrics.service import Registry, Trace
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    hist = registry.histogram("test_seconds", "Test", ("provider",), buckets=(0.1, 1))
+    hist.observe(0.05, "openai")
+    hist.observe(0.5, "openai")
+    hist.observe(5, "openai")
+
+    text = registry.render()
+    assert 'test_seconds_bucket{provider="openai",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{provider="openai",le="1"} 2' in text
+    assert 'test_seconds_bucket{provider="openai",le="+Inf"} 3' in text
+    assert 'test_seconds_count{provider="openai"} 3' in text
+
+def test_counter_escapes_label_values():
+    registry = Registry()
+    counter = registry.counter("test_total", "Test", ("model",))
+    counter.inc('my"model')
+    counter.inc('my"model', amount=2)
+    assert 'test_total{model="my\\"model"} 3' in registry.render()
+
+def test_trace_meta_contains_stages_and_marks():
+    trace = Trace()
+    with trace.span("settings"):
+        pass
+    with trace.span("settings"):
+        pass
+    trace.mark("ttft")
+    trace.mark("ttft")
+
+    meta = trace.to_meta()
+    assert set(meta["stages"]) == {"settings"}
+    assert "ttft_ms" in meta
+    assert meta["total_ms"] >= meta["ttft_ms"]
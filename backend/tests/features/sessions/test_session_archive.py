@@ -0,0 +1,156 @@
+import gzip
+import json
+import os
+import threading
+import time
+import pytest
+from contextlib import contextmanager
+from features.sessions import archive, service as sessions
+from features.storage.service import storage
+
+DAY = 86400
+
+def chat(text: str) -> list:
+    return [{"role": "user", "content": text}, {"role": "assistant", "content": f"answer to {text}"}]
+
+@pytest.fixture
+def data_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(sessions, "SESSIONS_DIR", str(tmp_path / "sessions"))
+    monkeypatch.setattr(sessions.search, "SEARCH_DB", str(tmp_path / "search.db"))
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    return tmp_path
+
+def save_aged(chat_id: str, messages: list, days_old: float):
+    sessions.save_session(chat_id, messages)
+    storage.flush()
+    stamp = time.time() - days_old * DAY
+    os.utime(sessions.get_session_file(chat_id), (stamp, stamp))
+
+def test_cold_sessions_move_to_the_archive_and_still_load(data_dirs):
+    save_aged("old-1", chat("pumps"), 40)
+    save_aged("old-2", chat("valves and fittings for the garden"), 35)
+    save_aged("recent", chat("today"), 1)
+
+    assert archive.archive_cold_sessions(days=30) == 2
+    assert sorted(os.listdir(data_dirs / "sessions")) == ["recent.json"]
+    assert sessions.load_session("old-1") == chat("pumps")
+
+    listed = {s["id"]: s for s in sessions.list_sessions()}
+    assert listed["old-2"] == {"id": "old-2", "title": "valves and fittings for the ga...", "archived": True}
+    assert [s["id"] for s in sessions.list_sessions()] == ["recent", "old-2", "old-1"]
+
+    # A pack is a plain compressed JSONL stream
+    pack = next(name for name in os.listdir(data_dirs / "archive") if name.endswith(".jsonl.gz"))
+    with gzip.open(data_dirs / "archive" / pack, "rt") as f:
+        assert [json.loads(line)["id"] for line in f] == ["old-1", "old-2"]
+
+def test_reopened_chat_moves_back_and_deleted_chat_is_gone(data_dirs):
+    save_aged("reopened", chat("first"), 40)
+    save_aged("deleted", chat("second"), 40)
+    archive.archive_cold_sessions(days=30)
+
+    sessions.save_session("reopened", chat("first") + chat("follow-up"))
+    assert os.path.exists(sessions.get_session_file("reopened"))
+    assert not archive.is_archived("reopened")
+    assert len(sessions.load_session("reopened")) == 4
+
+    assert sessions.delete_session("deleted")
+    assert sessions.load_session("deleted") == []
+    assert not sessions.delete_session("deleted")
+
+    # Both copies are dead now; repack drops the pack
+    assert archive.repack() == 1
+    assert [name for name in os.listdir(data_dirs / "archive") if name.startswith("sessions-")] == []
+
+def test_archiving_never_nests_storage_locks(data_dirs, monkeypatch):
+    # Two storage locks held at once (e.g. a session and the archive index) can deadlock with a
+    # thread taking them in the other order, so every caller must hold at most one file's lock
+    held = threading.local()
+    nested = []
+    real_lock = storage.lock
+
+    @contextmanager
+    def checked_lock(path):
+        paths = getattr(held, "paths", [])
+        if any(os.path.abspath(p) != os.path.abspath(path) for p in paths):
+            nested.append((paths, path))
+        held.paths = paths + [path]
+        try:
+            with real_lock(path):
+                yield
+        finally:
+            held.paths = paths
+    monkeypatch.setattr(storage, "lock", checked_lock)
+
+    save_aged("busy", chat("pumps"), 40)
+    save_aged("idle", chat("valves"), 40)
+    store = archive._store
+
+    def store_then_save(records):
+        store(records)
+        # The chat is saved again after its copy went into the pack, before the hot file is removed
+        sessions.save_session("busy", chat("pumps") + chat("more"))
+    monkeypatch.setattr(archive, "_store", store_then_save)
+
+    assert archive.archive_cold_sessions(days=30) == 1
+    assert not archive.is_archived("busy") and archive.is_archived("idle")
+    assert len(sessions.load_session("busy")) == 4
+
+    monkeypatch.setattr(archive, "_store", store)
+    sessions.save_session("idle", chat("valves") + chat("reopened"))
+    sessions.delete_session("busy")
+    assert not archive.is_archived("idle")
+    assert nested == []
+
+def test_repack_keeps_live_sessions(data_dirs):
+    for i in range(3):
+        save_aged(f"chat-{i}", chat(f"topic {i}"), 40)
+    archive.archive_cold_sessions(days=30)
+    sessions.delete_session("chat-0")
+    sessions.delete_session("chat-1")
+
+    assert archive.repack() == 1
+    assert sessions.load_session("chat-2") == chat("topic 2")
+
+def test_export_import_round_trip(data_dirs, tmp_path_factory, monkeypatch):
+    save_aged("hot", chat("hot chat"), 1)
+    save_aged("cold", chat("cold chat"), 40)
+    archive.archive_cold_sessions(days=30)
+    export_file = str(tmp_path_factory.mktemp("export") / "sessions.jsonl.gz")
+    assert archive.export_sessions(export_file) == 2
+
+    # Into an empty data directory: everything lands in the archive and is searchable
+    target = tmp_path_factory.mktemp("target")
+    monkeypatch.setattr(sessions, "SESSIONS_DIR", str(target / "sessions"))
+    monkeypatch.setattr(sessions.search, "SEARCH_DB", str(target / "search.db"))
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(target / "archive"))
+    assert archive.import_sessions(export_file) == (2, 0)
+    assert archive.import_sessions(export_file) == (0, 2)
+    assert sessions.load_session("hot") == chat("hot chat")
+    assert sessions.load_session("cold") == chat("cold chat")
+    assert {r["chat_id"] for r in sessions.search_sessions("cold")["results"]} == {"cold"}
+
+def test_damaged_index_is_not_overwritten_and_can_be_rebuilt(data_dirs):
+    for i in range(3):
+        save_aged(f"chat-{i}", chat(f"topic {i}"), 40)
+    archive.archive_cold_sessions(days=30)
+    sessions.save_session("chat-0", chat("topic 0") + chat("follow-up"))  # hot again; its packed copy is dead
+    index_file = data_dirs / "archive" / "index.json"
+    index_file.write_text('{"packs": {"sessions-0001.jsonl.gz"')
+
+    # Archiving more would replace the index with one that forgot the packed chats
+    save_aged("chat-3", chat("topic 3"), 40)
+    with pytest.raises(archive.ArchiveIndexError):
+        archive.archive_cold_sessions(days=30)
+    with pytest.raises(archive.ArchiveIndexError):
+        archive.repack()
+    assert os.path.exists(sessions.get_session_file("chat-3"))
+
+    assert archive.rebuild_index() == 2
+    assert (data_dirs / "archive" / "index.json.corrupt").exists()
+    assert sorted(archive.archived_sessions()) == ["chat-1", "chat-2"]
+    assert sessions.load_session("chat-2") == chat("topic 2")
+    assert len(sessions.load_session("chat-0")) == 4
+
+    assert archive.archive_cold_sessions(days=30) == 1
+    assert archive.load("chat-3") == {"messages": chat("topic 3"), "summary": None}
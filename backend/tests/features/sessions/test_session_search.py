@@ -0,0 +1,79 @@
+import json
+import os
+import pytest
+from features.sessions import search
+
+def turn(question: str, answer: str, agent_id=None, model="gpt-4o", ts=1760000000.0):
+    return [
+        {"role": "user", "content": question},
+        {"role": "assistant", "content": answer, "meta": {"agent_id": agent_id, "model": model, "created_at": ts}},
+    ]
+
+@pytest.fixture(autouse=True)
+def search_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(search, "SEARCH_DB", str(tmp_path / "search.db"))
+
+def test_ranked_results_with_snippets():
+    search.index_session("c1", turn("How do I tune postgres vacuum?", "Lower autovacuum_vacuum_scale_factor for big tables."))
+    search.index_session("c2", turn("Postgres postgres postgres", "Yes, postgres."))
+
+    results = search.search("postgres")["results"]
+    assert [r["chat_id"] for r in results][:2] == ["c2", "c2"]
+    assert any(r["chat_id"] == "c1" for r in results)
+    assert "<mark>" in results[0]["snippet"]
+    assert search.search("autovac")["results"][0]["role"] == "assistant"  # last term matches as a prefix
+
+def test_filters_by_agent_model_and_date():
+    search.index_session("c1", turn("deploy steps", "ok", agent_id="ops", model="gpt-4o", ts=100.0))
+    search.index_session("c2", turn("deploy steps", "ok", agent_id="dev", model="claude-3-5-sonnet", ts=200.0))
+
+    assert {r["chat_id"] for r in search.search("deploy", agent_id="ops")["results"]} == {"c1"}
+    assert {r["chat_id"] for r in search.search("deploy", model="claude-3-5-sonnet")["results"]} == {"c2"}
+    assert {r["chat_id"] for r in search.search("deploy", since=150.0)["results"]} == {"c2"}
+    assert {r["chat_id"] for r in search.search("deploy", until=150.0)["results"]} == {"c1"}
+
+def test_incremental_updates_and_removal():
+    messages = turn("first question", "first answer")
+    search.index_session("c1", messages)
+    messages += turn("second question", "second answer")
+    search.index_session("c1", messages)
+    assert len(search.search("question")["results"]) == 2
+
+    # Editing an earlier message reindexes the whole chat
+    messages[0] = {"role": "user", "content": "rewritten prompt"}
+    search.index_session("c1", messages)
+    assert len(search.search("question")["results"]) == 1
+    assert len(search.search("rewritten")["results"]) == 1
+
+    search.remove_session("c1")
+    assert search.search("second")["results"] == []
+
+def test_query_syntax_is_escaped():
+    search.index_session("c1", turn('what does "AND" OR NOT( mean', "operators"))
+    assert search.search('"AND" OR NOT(')["results"]
+    assert search.search("   ")["results"] == []
+
+def test_rebuild_dates_legacy_messages_by_file_mtime(tmp_path, monkeypatch):
+    from features.sessions import archive
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    sessions_dir = tmp_path / "sessions"
+    sessions_dir.mkdir()
+    legacy = sessions_dir / "legacy.json"
+    legacy.write_text(json.dumps([{"role": "user", "content": "boiler manual"}, {"role": "assistant", "content": "page 4"}]))
+    os.utime(legacy, (1000.0, 1000.0))
+
+    assert search.rebuild_index(str(sessions_dir)) == 1
+    assert [r["ts"] for r in search.search("boiler")["results"]] == [1000.0]
+    assert search.search("boiler", since=2000.0)["results"] == []
+
+def test_chats_from_before_the_index_are_backfilled_after_a_new_save(tmp_path, monkeypatch):
+    from features.sessions import archive, service as sessions
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    monkeypatch.setattr(sessions, "SESSIONS_DIR", str(tmp_path / "sessions"))
+    (tmp_path / "sessions").mkdir()
+    (tmp_path / "sessions" / "old.json").write_text(json.dumps([{"role": "user", "content": "boiler pressure"}]))
+
+    # The save indexes its own chat, so the index is no longer empty before the first search
+    sessions.save_session("new", [{"role": "user", "content": "garden hose"}])
+    assert {r["chat_id"] for r in sessions.search_sessions("boiler")["results"]} == {"old"}
+    assert search.is_backfilled()
@@ -0,0 +1,27 @@
+import json
+import os
+import pytest
+from features.settings import service
+
+@pytest.fixture
+def settings_file(tmp_path, monkeypatch):
+    path = tmp_path / "user_settings.json"
+    monkeypatch.setattr(service, "SETTINGS_FILE", str(path))
+    return path
+
+def test_cached_settings_follow_changes_from_other_processes(settings_file):
+    assert service.load_settings() == {"providers": []}
+
+    service.save_settings({"providers": [{"id": "openai", "name": "OpenAI", "keys": ["sk-1"]}]})
+    assert service.get_provider_settings("openai")["keys"] == ["sk-1"]
+
+    # Another worker (or a hand edit) replaces the file: the version stamp changes
+    other = settings_file.with_name("other.json")
+    other.write_text(json.dumps({"providers": [{"id": "openai", "name": "OpenAI", "keys": ["sk-2"]}]}))
+    os.replace(other, settings_file)
+    assert service.get_provider_settings("openai")["keys"] == ["sk-2"]
+
+def test_callers_get_copies(settings_file):
+    service.save_settings({"providers": [{"id": "openai", "name": "OpenAI", "keys": ["sk-1"]}]})
+    service.get_provider_settings("openai")["keys"].append("mutated")
+    assert service.get_provider_settings("openai")["keys"] == ["sk-1"]
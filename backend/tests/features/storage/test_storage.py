@@ -0,0 +1,96 @@
+import json
+import threading
+from unittest.mock import patch
+from features.storage.service import JsonStorage
+
+def test_atomic_write_and_read(tmp_path):
+    storage = JsonStorage(write_delay=0)
+    path = str(tmp_path / "nested" / "data.json")
+
+    assert storage.read(path, default=[]) == []
+    storage.write(path, {"a": 1}, indent=4)
+    assert json.loads(open(path).read()) == {"a": 1}
+    assert [p.name for p in (tmp_path / "nested").iterdir()] == ["data.json"]  # no temp files left behind
+
+    (tmp_path / "broken.json").write_text("{not json")
+    assert storage.read(str(tmp_path / "broken.json"), default={}) == {}
+
+def test_write_behind_coalesces_and_reads_queued_data(tmp_path):
+    storage = JsonStorage(write_delay=60)
+    path = str(tmp_path / "session.json")
+
+    with patch.object(storage, "_write_text", wraps=storage._write_text) as write_text:
+        data = {"messages": []}
+        for i in range(5):
+            data["messages"].append(i)
+            storage.write_later(path, data)
+        data["messages"].append("mutated after the save")
+
+        assert not (tmp_path / "session.json").exists()
+        assert storage.read(path) == {"messages": [0, 1, 2, 3, 4]}
+        assert storage.exists(path)
+        assert storage.list_dir(str(tmp_path)) == [path]
+
+        storage.flush()
+        assert write_text.call_count == 1
+    assert json.loads(open(path).read()) == {"messages": [0, 1, 2, 3, 4]}
+
+def test_delete_drops_queued_write(tmp_path):
+    storage = JsonStorage(write_delay=60)
+    path = str(tmp_path / "gone.json")
+    storage.write_later(path, [1])
+    assert storage.delete(path) is True
+    storage.flush()
+    assert not (tmp_path / "gone.json").exists()
+    assert storage.delete(path) is False
+
+def test_update_does_not_lose_concurrent_changes(tmp_path):
+    storage = JsonStorage(write_delay=0)
+    path = str(tmp_path / "counter.json")
+
+    def bump():
+        for _ in range(50):
+            storage.update(path, lambda n: n + 1, default=0)
+
+    threads = [threading.Thread(target=bump) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert storage.read(path) == 200
+
+def _bump_in_process(path: str, lock_dir: str, times: int):
+    storage = JsonStorage(write_delay=0, lock_dir=lock_dir)
+    for _ in range(times):
+        storage.update(path, lambda n: n + 1, default=0)
+
+def test_update_is_safe_across_worker_processes(tmp_path):
+    import multiprocessing
+    path, lock_dir = str(tmp_path / "counter.json"), str(tmp_path / "locks")
+    workers = [multiprocessing.Process(target=_bump_in_process, args=(path, lock_dir, 25)) for _ in range(4)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    assert JsonStorage(write_delay=0, lock_dir=lock_dir).read(path) == 100
+
+def test_claims_are_exclusive_until_released(tmp_path):
+    storage = JsonStorage(write_delay=0, lock_dir=str(tmp_path / "locks"))
+    path = str(tmp_path / "job" / "run.lock")
+    claim = storage.try_claim(path)
+    assert claim is not None
+    assert storage.try_claim(path) is None
+    claim.release()
+    assert storage.try_claim(path) is not None
+
+def test_read_cached_notices_replaced_files(tmp_path):
+    storage = JsonStorage(write_delay=0, lock_dir=str(tmp_path / "locks"))
+    path = str(tmp_path / "agents.json")
+    assert storage.read_cached(path, default=[]) == []
+    storage.write(path, [{"id": "a"}])
+    first = storage.read_cached(path)
+    first.append("mutated")
+    assert storage.read_cached(path) == [{"id": "a"}]
+
+    JsonStorage(write_delay=0, lock_dir=str(tmp_path / "locks")).write(path, [{"id": "b"}])  # "another worker"
+    assert storage.read_cached(path) == [{"id": "b"}]
@@ -0,0 +1,68 @@
+import asyncio
+import time
+import pytest
+from features.tools import service as tools
+from features.tools.service import Tool, ToolContext, run_tool, run_tool_calls
+
+@pytest.fixture
+def slow_tools(monkeypatch):
+    async def nap(context, seconds: float):
+        await asyncio.sleep(seconds)
+        return {"slept": seconds}
+
+    def blocking_nap(context, seconds: float):
+        time.sleep(seconds)
+        return f"slept {seconds}"
+
+    monkeypatch.setitem(tools.TOOLS, "nap", Tool("nap", "", {}, nap))
+    monkeypatch.setitem(tools.TOOLS, "blocking_nap", Tool("blocking_nap", "", {}, blocking_nap))
+
+@pytest.mark.asyncio
+async def test_calls_of_one_round_run_concurrently(slow_tools):
+    calls = [
+        {"id": "a", "name": "nap", "arguments": {"seconds": 0.2}},
+        {"id": "b", "name": "blocking_nap", "arguments": {"seconds": 0.2}},
+        {"id": "c", "name": "nap", "arguments": {"seconds": 0.2}},
+    ]
+    started = time.perf_counter()
+    results = await run_tool_calls(calls, ToolContext())
+    assert time.perf_counter() - started < 0.5
+    assert [r["id"] for r in results] == ["a", "b", "c"]
+    assert results[0]["content"] == '{"slept": 0.2}'
+    assert results[1]["content"] == "slept 0.2"
+    assert all(r["ok"] and r["ms"] >= 150 for r in results)
+
+@pytest.mark.asyncio
+async def test_failures_become_error_results(slow_tools):
+    timed_out = await run_tool({"id": "t", "name": "nap", "arguments": {"seconds": 1}}, ToolContext(), timeout=0.05)
+    assert not timed_out["ok"] and "timed out" in timed_out["content"]
+
+    unknown = await run_tool({"id": "u", "name": "rm_rf", "arguments": {}}, ToolContext())
+    assert not unknown["ok"] and "unknown tool" in unknown["content"]
+
+    bad_args = await run_tool({"id": "b", "name": "nap", "arguments": '{"seconds": '}, ToolContext())
+    assert not bad_args["ok"] and "JSON object" in bad_args["content"]
+
+    wrong_args = await run_tool({"id": "w", "name": "nap", "arguments": {"minutes": 1}}, ToolContext())
+    assert not wrong_args["ok"]
+
+def test_lookup_document_returns_best_passages():
+    manual = "\n\n".join([
+        "Installation: run the installer and accept the license.",
+        "Troubleshooting: if the pump makes noise, check the impeller for debris.",
+        "Warranty: two years from the date of purchase.",
+    ])
+    context = ToolContext(documents=[("manual.txt", manual), ("notes.txt", "Nothing about pumps here.")])
+
+    passages = tools.lookup_document_tool(context, "noisy pump impeller", limit=1)
+    assert passages == [{"document": "manual.txt", "passage": manual}]  # short text: one passage
+
+    context.documents = [("manual.txt", "\n\n".join(p * 20 for p in manual.split("\n\n")))]
+    best = tools.lookup_document_tool(context, "impeller debris", limit=1)[0]
+    assert best["passage"].startswith("Troubleshooting")
+    assert tools.lookup_document_tool(context, "zebra") == "No passage matches the query."
+    assert tools.lookup_document_tool(context, "pump", document="other.pdf") == "No matching document is attached."
+
+def test_agents_only_get_registered_tools():
+    assert [t.name for t in tools.get_tools(["lookup_document", "removed_tool"])] == ["lookup_document"]
+    assert {"search_sessions", "lookup_document"} <= {spec["name"] for spec in tools.list_tools()}
@@ -0,0 +1,33 @@
+import os
+import time
+from features.sessions import archive, service as sessions
+from features.storage.service import storage
+from features.usage.backfill import collect_entries
+
+def turn(text: str, tokens: int) -> list:
+    return [
+        {"role": "user", "content": text},
+        {"role": "assistant", "content": "ok", "meta": {"provider": "openai", "model": "gpt-4o", "total_tokens": tokens}},
+    ]
+
+def test_archived_and_queued_sessions_are_counted(tmp_path, monkeypatch):
+    monkeypatch.setattr(sessions, "SESSIONS_DIR", str(tmp_path / "sessions"))
+    monkeypatch.setattr(sessions.search, "SEARCH_DB", str(tmp_path / "search.db"))
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+
+    sessions.save_session("cold", turn("old question", 100))
+    storage.flush()
+    stamp = time.time() - 60 * 86400
+    os.utime(sessions.get_session_file("cold"), (stamp, stamp))
+    assert archive.archive_cold_sessions(days=30) == 1
+
+    # The second turn is still in the write-behind queue when the backfill runs
+    monkeypatch.setattr(storage, "write_delay", 60)
+    sessions.save_session("hot", turn("new question", 7))
+    sessions.save_session("hot", turn("new question", 7) + turn("follow-up", 5))
+
+    tokens = {}
+    for entry in collect_entries():
+        tokens.setdefault(entry["chat_id"], []).append(entry["total_tokens"])
+    assert tokens == {"cold": [100], "hot": [7, 5]}
+    storage.flush()
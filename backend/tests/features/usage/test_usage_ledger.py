@@ -0,0 +1,62 @@
+from features.usage.service import UsageLedger
+from timeutil import parse_time
+
+def ts(value: str) -> float:
+    return parse_time(value).timestamp()
+
+def make_ledger(tmp_path) -> UsageLedger:
+    ledger = UsageLedger(usage_dir=str(tmp_path))
+    usage = {"prompt_tokens": 1000, "completion_tokens": 500}
+    ledger.rebuild([
+        ledger.make_entry("openai", "gpt-4o-2024-08-06", usage, chat_id="c1", agent_id="a1", ts=ts("2026-10-12T09:30")),
+        ledger.make_entry("openai", "gpt-4o", usage, chat_id="c2", ts=ts("2026-10-13T23:10")),
+        ledger.make_entry("gemini", "gemini-2.0-flash", usage, chat_id="c1", agent_id="a1", ts=ts("2026-10-14T00:05")),
+    ])
+    return ledger
+
+def test_price_lookup_uses_longest_prefix(tmp_path):
+    ledger = UsageLedger(usage_dir=str(tmp_path))
+    assert ledger.price_for("gpt-4o-mini-2024-07-18") == (0.15, 0.60)
+    assert ledger.price_for("gpt-4o-2024-08-06") == (2.50, 10.00)
+    assert ledger.price_for("llama3") == (0.0, 0.0)
+
+def test_query_groups_and_costs(tmp_path):
+    ledger = make_ledger(tmp_path)
+    result = ledger.query("provider")
+    by_provider = {row["provider"]: row for row in result["groups"]}
+
+    assert by_provider["openai"]["turns"] == 2
+    assert by_provider["openai"]["total_tokens"] == 3000
+    assert by_provider["openai"]["cost"] == round(2 * (1000 * 2.50 + 500 * 10.00) / 1e6, 6)
+    assert result["totals"]["turns"] == 3
+
+    by_agent = {row["agent"]: row["turns"] for row in ledger.query("agent")["groups"]}
+    assert by_agent == {"a1": 2, "": 1}
+
+def test_query_range_mixes_days_and_hours(tmp_path):
+    ledger = make_ledger(tmp_path)
+    # From mid-day 12th to 14th 00:30: partial 12th (hours), full 13th (day), first hour of 14th
+    result = ledger.query("day", since=parse_time("2026-10-12T09:00"), until=parse_time("2026-10-14T00:30"))
+    assert [row["day"] for row in sorted(result["groups"], key=lambda r: r["day"])] == ["2026-10-12", "2026-10-13", "2026-10-14"]
+
+    result = ledger.query("provider,model", since=parse_time("2026-10-12T10:00"), until=parse_time("2026-10-14"))
+    assert result["totals"]["turns"] == 1
+    assert result["groups"][0]["model"] == "gpt-4o"
+
+def test_reload_replays_ledger_after_snapshot(tmp_path):
+    ledger = make_ledger(tmp_path)
+    ledger.record("runpod", "llama3", {"prompt_tokens": 10, "completion_tokens": 5}, chat_id="c3")
+
+    reloaded = UsageLedger(usage_dir=str(tmp_path))
+    assert reloaded.query("provider")["totals"]["turns"] == 4
+
+def test_cached_replays_count_turns_not_tokens(tmp_path):
+    ledger = make_ledger(tmp_path)
+    usage = {"prompt_tokens": 1000, "completion_tokens": 500}
+    for _ in range(3):
+        ledger.record("openai", "gpt-4o", usage, chat_id="c2", cached=True)
+
+    openai = next(row for row in ledger.query("provider")["groups"] if row["provider"] == "openai")
+    assert openai["turns"] == 5
+    assert openai["total_tokens"] == 3000  # billed tokens only, not each replay
+    assert ledger.make_entry("openai", "gpt-4o", usage, cached=True)["replayed_tokens"] == 1500
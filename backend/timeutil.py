@@ -0,0 +1,11 @@
+from datetime import datetime, timezone
+
+def parse_time(value) -> datetime:
+    """Accepts ISO dates/datetimes ("2026-10-12", "2026-10-12T08:00") or epoch seconds; naive means UTC."""
+    if value is None or value == "":
+        return None
+    try:
+        return datetime.fromtimestamp(float(value), timezone.utc)
+    except ValueError:
+        parsed = datetime.fromisoformat(str(value))
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)